@@ -0,0 +1,59 @@
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from jsonl_io import JsonlReader, available_json_backends
+
+# Initializing argparse
+parser = argparse.ArgumentParser(description='Compare records/sec of the JSONL reader backends on a synthetic arXiv-like corpus')
+parser.add_argument('-records', action="store", default=2000, dest="records", type=int, help='Number of synthetic records')
+parser.add_argument('-text_size', action="store", default=50000, dest="text_size", type=int, help='Approximate characters of text per record')
+parser.add_argument('-jsonl', action="store", default=None, dest="jsonl_path", type=str, help='Benchmark an existing JSONL file instead of a synthetic one')
+arguments = parser.parse_args()
+
+METADATA_KEYS = ['timestamp', 'yymm', 'arxiv_id', 'language', 'url']
+
+
+def write_synthetic_corpus(path, records, text_size, seed=0):
+    """Write records shaped like the RedPajama arXiv dump: a long LaTeX text and a small meta dict."""
+    rng = random.Random(seed)
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 10))) for _ in range(5000)]
+    words += ['AUROC', 'AUPRC', '$x$', '\\cite{a}', '\\textbf{b}', '\n']
+    with open(path, 'w', encoding='utf-8') as file:
+        for i in range(records):
+            text = ' '.join(rng.choice(words) for _ in range(text_size // 6))
+            meta = {'timestamp': '2019-01-01T00:00:00', 'yymm': '1901', 'arxiv_id': f'1901.{i:05d}',
+                    'language': 'en', 'url': f'https://arxiv.org/abs/1901.{i:05d}'}
+            file.write(json.dumps({'text': text, 'meta': meta}) + '\n')
+
+
+def records_per_second(path, backend, fields):
+    reader = JsonlReader(fields, backend=backend)
+    start = time.perf_counter()
+    count = sum(1 for _ in reader.iter_file(path))
+    return count / (time.perf_counter() - start)
+
+
+if arguments.jsonl_path:
+    corpus_path = arguments.jsonl_path
+else:
+    corpus_path = os.path.join(tempfile.mkdtemp(), 'synthetic_arxiv.jsonl')
+    write_synthetic_corpus(corpus_path, arguments.records, arguments.text_size)
+size_mb = os.path.getsize(corpus_path) / 1e6
+print(f"Corpus: {corpus_path} ({size_mb:.1f} MB)")
+
+selections = {
+    'all fields': None,
+    'meta only': ['meta.' + key for key in METADATA_KEYS],
+    'text + meta': ['text'] + ['meta.' + key for key in METADATA_KEYS],
+}
+print(f"{'backend':<10} {'fields':<12} {'records/s':>12}")
+for backend in available_json_backends():
+    for name, fields in selections.items():
+        print(f"{backend:<10} {name:<12} {records_per_second(corpus_path, backend, fields):>12.0f}")
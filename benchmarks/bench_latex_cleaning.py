@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from latex_cleaning import remove_latex_commands, remove_latex_commands_chained
+
+# Initializing argparse
+parser = argparse.ArgumentParser(description='Compare the throughput of the single-pass LaTeX cleaner and the chained re.sub version')
+parser.add_argument('-jsonl', action="store", default=None, dest="jsonl_path", type=str, help='Optional JSONL file to sample real texts from')
+parser.add_argument('-samples', action="store", default=200, dest="samples", type=int, help='Number of texts to sample from the JSONL file')
+parser.add_argument('-repeat', action="store", default=3, dest="repeat", type=int, help='Timing repetitions; the best run is reported')
+arguments = parser.parse_args()
+
+PROSE = ("The receiver operating characteristic curve of the classifier was computed on held-out data, "
+         "and the proposed method improves the area under the curve over all baselines. ")
+LATEX = ("We set $\\lambda = 0.1$ as in \\cite{smith2020} and report AUROC in Table~\\ref{tab:main}.\n"
+         "\\begin{equation}\\mathrm{AUPRC} = \\int_0^1 p(r)\\,dr\\end{equation}\n\\\\ \\textbf{Results.} ")
+
+
+def synthetic_corpus(num_docs=50, doc_size=200000, latex_ratio=0.2, seed=0):
+    """Build arXiv-like documents mixing prose with a given share of LaTeX snippets."""
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(num_docs):
+        parts, size = [], 0
+        while size < doc_size:
+            part = LATEX if rng.random() < latex_ratio else PROSE
+            parts.append(part)
+            size += len(part)
+        docs.append(''.join(parts))
+    return docs
+
+
+def sample_jsonl(path, samples):
+    docs = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            docs.append(json.loads(line).get('text') or '')
+            if len(docs) >= samples:
+                break
+    return docs
+
+
+def throughput(function, docs, repeat):
+    megabytes = sum(len(doc.encode('utf-8')) for doc in docs) / 1e6
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for doc in docs:
+            function(doc)
+        best = min(best, time.perf_counter() - start)
+    return megabytes / best
+
+
+corpora = {
+    'prose (5% LaTeX)': synthetic_corpus(latex_ratio=0.05),
+    'mixed (20% LaTeX)': synthetic_corpus(latex_ratio=0.2),
+    'dense (80% LaTeX)': synthetic_corpus(latex_ratio=0.8),
+}
+if arguments.jsonl_path:
+    corpora['sampled'] = sample_jsonl(arguments.jsonl_path, arguments.samples)
+
+print(f"{'corpus':<20} {'chained MB/s':>14} {'single-pass MB/s':>18} {'speedup':>9}")
+for name, docs in corpora.items():
+    chained = throughput(remove_latex_commands_chained, docs, arguments.repeat)
+    single = throughput(remove_latex_commands, docs, arguments.repeat)
+    print(f"{name:<20} {chained:>14.1f} {single:>18.1f} {single / chained:>8.2f}x")
@@ -0,0 +1,388 @@
+import argparse
+import importlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'src'))
+sys.path.append(os.path.join(ROOT, 'regex'))
+sys.path.append(os.path.join(ROOT, 'keyword_lists'))
+import regex_definitions
+from arxiv_search import create_keyword_pattern
+
+# Sentences of arXiv-like prose; metric mentions are mixed in at a corpus-specific rate
+PROSE = [
+    "The proposed method is trained with stochastic gradient descent on the full training split. ",
+    "We follow the preprocessing of prior work and report the mean over five random seeds. ",
+    "As shown in Table~\\ref{tab:main}, the model outperforms all baselines on every dataset. ",
+    "Hyperparameters were selected on the validation set $\\mathcal{D}_{val}$ with early stopping. ",
+    "The process of curve fitting is described in the appendix, together with the approximation error. ",
+]
+MENTIONS = [
+    "The AUROC of the classifier was 0.91 on held-out data. ",
+    "We plot the receiver operating characteristic and report the area under the curve (AUC). ",
+    "Sensitivity vs. 1-specificity curves are shown in Figure 3. ",
+    "true positive rate versus false positive rate for all thresholds. ",
+    "The AUPRC and the average precision are more informative under class imbalance. ",
+    "precision-recall curves (PRC) and the AUC-PR are given in the appendix. ",
+]
+# Filler for the adversarial probes, repeated to growing lengths
+PUMPS = [' ', 'a', '-', ' -', 'vs ', '1 - ']
+PROBE_SIZES = [4000, 8000, 16000, 32000]
+# Simple pattern timed next to every profiled one; the gate compares speeds relative to it, which
+# cancels out differences between machines and runs
+CALIBRATION_PATTERN = re.compile(r'\bthe\b', re.IGNORECASE)
+# Characters used to compare the character classes of quantified items
+_ALPHABET = [chr(code) for code in range(32, 127)] + ['\t', '\n', '\r']
+
+
+def synthetic_corpus(size, mention_rate, seed=0):
+    """Build arXiv-like prose of about `size` characters with the given share of metric mentions."""
+    rng = random.Random(seed)
+    parts, total = [], 0
+    while total < size:
+        part = rng.choice(MENTIONS) if rng.random() < mention_rate else rng.choice(PROSE)
+        parts.append(part)
+        total += len(part)
+    # Split into documents of about 100k characters, like paper texts
+    text = ''.join(parts)
+    return [text[i:i + 100000] for i in range(0, len(text), 100000)]
+
+
+def sample_jsonl(path, samples):
+    docs = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            docs.append(json.loads(line).get('text') or '')
+            if len(docs) >= samples:
+                break
+    return docs
+
+
+def collect_patterns():
+    """Every regex of regex_definitions, the combined family regexes and every keyword-list pattern, by name."""
+    patterns = {}
+    for family in ('AUROC', 'AUPRC'):
+        for i, source in enumerate(getattr(regex_definitions, f'{family}_REGEXES')):
+            # The combined regexes apply (?i) to every alternative
+            patterns[f'{family}_REGEXES[{i}]'] = re.compile(source, re.IGNORECASE)
+    patterns['compiled_auroc_regex'] = regex_definitions.compiled_auroc_regex
+    patterns['compiled_auprc_regex'] = regex_definitions.compiled_auprc_regex
+    keyword_dir = os.path.join(ROOT, 'keyword_lists')
+    for filename in sorted(os.listdir(keyword_dir)):
+        if not filename.endswith('.py'):
+            continue
+        module = importlib.import_module(filename[:-3])
+        for name in sorted(vars(module)):
+            if name.endswith('_search_terms'):
+                patterns[f'{filename[:-3]}.{name}'] = create_keyword_pattern(getattr(module, name))
+    return patterns
+
+
+def _char_set(item, flags):
+    # Characters of _ALPHABET matched by a single-character parse item, or None for anything longer
+    op, av = item
+    if op == sre_constants.LITERAL:
+        chars = {chr(av)}
+    elif op == sre_constants.NOT_LITERAL:
+        chars = set(_ALPHABET) - {chr(av)}
+    elif op == sre_constants.ANY:
+        chars = set(_ALPHABET) - ({'\n'} if not flags & re.DOTALL else set())
+    elif op == sre_constants.IN:
+        chars, negate = set(), False
+        for member_op, member_av in av:
+            if member_op == sre_constants.NEGATE:
+                negate = True
+            elif member_op == sre_constants.LITERAL:
+                chars.add(chr(member_av))
+            elif member_op == sre_constants.RANGE:
+                chars.update(chr(code) for code in range(member_av[0], member_av[1] + 1))
+            elif member_op == sre_constants.CATEGORY:
+                category = {sre_constants.CATEGORY_SPACE: r'\s', sre_constants.CATEGORY_NOT_SPACE: r'\S',
+                            sre_constants.CATEGORY_DIGIT: r'\d', sre_constants.CATEGORY_NOT_DIGIT: r'\D',
+                            sre_constants.CATEGORY_WORD: r'\w', sre_constants.CATEGORY_NOT_WORD: r'\W'}.get(member_av)
+                if category is None:
+                    return None
+                chars.update(char for char in _ALPHABET if re.match(category, char))
+            else:
+                return None
+        if negate:
+            chars = set(_ALPHABET) - chars
+    else:
+        return None
+    if flags & re.IGNORECASE:
+        chars |= {char.swapcase() for char in chars}
+    return chars
+
+
+def _first_chars(items, flags):
+    # Characters a sequence can start with, if its first item is a single character
+    items = list(items)
+    if not items:
+        return None
+    op, av = items[0]
+    if op == sre_constants.SUBPATTERN:
+        return _first_chars(av[-1], flags)
+    if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] > 0:
+        return _first_chars(av[2], flags)
+    return _char_set(items[0], flags)
+
+
+def static_risks(pattern):
+    """
+    Parse a pattern and list constructs that make backtracking super-linear on unlucky inputs.
+
+    Flags nested unbounded quantifiers such as (a+)+, adjacent unbounded quantifiers over overlapping
+    characters such as \\s*\\s*, and alternatives starting with the same character under an unbounded
+    quantifier such as (a|ab)*.
+    """
+    risks = []
+    flags = pattern.flags
+
+    def walk(items, inside_unbounded):
+        previous = None
+        for op, av in items:
+            if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                low, high, sub = av
+                unbounded = high == sre_constants.MAXREPEAT
+                if unbounded and inside_unbounded:
+                    risks.append('nested unbounded quantifiers')
+                chars = _first_chars(sub, flags) if len(list(sub)) == 1 else None
+                if unbounded and chars is not None and previous is not None and chars & previous:
+                    risks.append('adjacent quantifiers over overlapping characters')
+                walk(sub, inside_unbounded or unbounded)
+                if unbounded:
+                    previous = chars
+                elif low > 0:
+                    previous = None
+            elif op == sre_constants.SUBPATTERN:
+                walk(av[-1], inside_unbounded)
+                previous = None
+            elif op == sre_constants.BRANCH:
+                if inside_unbounded:
+                    starts = [_first_chars(branch, flags) for branch in av[1]]
+                    starts = [chars for chars in starts if chars is not None]
+                    if any(a & b for i, a in enumerate(starts) for b in starts[i + 1:]):
+                        risks.append('overlapping alternatives under a quantifier')
+                for branch in av[1]:
+                    walk(branch, inside_unbounded)
+                previous = None
+            elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+                walk(av[1], inside_unbounded)
+            else:
+                previous = None
+
+    walk(sre_parse.parse(pattern.pattern, flags), False)
+    return sorted(set(risks))
+
+
+def probe_inputs(pattern):
+    """Adversarial texts for a pattern: runs of filler, alone and after every literal word of the pattern, each also ending in a mismatch."""
+    # The longest literal words, which are the likeliest to start a partial match
+    words = sorted(set(re.findall(r'[A-Za-z]{2,}', re.sub(r'\\.', ' ', pattern.pattern))), key=lambda word: (-len(word), word))[:10]
+    probes = {}
+    for pump in PUMPS:
+        probes[f'{pump!r}*n'] = lambda n, pump=pump: pump * (n // len(pump))
+        # A final mismatch makes nested quantifiers such as (a+)+$ try every split of the run
+        probes[f'{pump!r}*n+!'] = lambda n, pump=pump: pump * (n // len(pump)) + '!'
+        for word in words:
+            probes[f'{word!r}+{pump!r}*n'] = lambda n, word=word, pump=pump: word + pump * (n // len(pump)) + '!'
+            probes[f'({word!r}+{pump!r})*n'] = lambda n, word=word, pump=pump: (word + pump) * (n // (len(word) + len(pump)))
+    return probes
+
+
+def _time_probe(pattern, text, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in pattern.finditer(text):
+            pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def dynamic_probe(pattern):
+    """
+    Time the pattern on each adversarial input at doubling sizes.
+
+    Returns:
+    - dict: 'worst_exponent' (growth of the time per doubling of the input; 1 is linear, 2 quadratic),
+      'worst_probe' and its 'worst_seconds' at the largest size.
+    """
+    worst = {'worst_exponent': 1.0, 'worst_probe': None, 'worst_seconds': 0.0}
+    for name, build in probe_inputs(pattern).items():
+        times = [_time_probe(pattern, build(size)) for size in PROBE_SIZES]
+        # Times of a few milliseconds are dominated by noise
+        if times[-1] < 5e-3:
+            continue
+        # Least-squares slope of log(time) over log(size)
+        xs = [math.log(size) for size in PROBE_SIZES]
+        ys = [math.log(max(t, 1e-9)) for t in times]
+        mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+        exponent = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sum((x - mean_x) ** 2 for x in xs)
+        if exponent > worst['worst_exponent']:
+            worst = {'worst_exponent': exponent, 'worst_probe': name, 'worst_seconds': times[-1]}
+    return worst
+
+
+def _dynamic_probe_source(source, flags):
+    return dynamic_probe(re.compile(source, flags))
+
+
+def run_dynamic_probe(pattern, timeout):
+    # In a separate process, so a catastrophic pattern can be stopped
+    with multiprocessing.Pool(1) as pool:
+        result = pool.apply_async(_dynamic_probe_source, (pattern.pattern, pattern.flags))
+        try:
+            return result.get(timeout)
+        except multiprocessing.TimeoutError:
+            pool.terminate()
+            return {'worst_exponent': float('inf'), 'worst_probe': 'timeout', 'worst_seconds': timeout}
+
+
+def throughput(pattern, docs, repeat):
+    megabytes = sum(len(doc.encode('utf-8')) for doc in docs) / 1e6
+    best, matches = float('inf'), 0
+    for _ in range(repeat):
+        matches = 0
+        start = time.perf_counter()
+        for doc in docs:
+            for _ in pattern.finditer(doc):
+                matches += 1
+        best = min(best, time.perf_counter() - start)
+    return megabytes / best, matches
+
+
+def profile(patterns, corpora, repeat, probe_timeout):
+    results = {}
+    for name, pattern in patterns.items():
+        entry = {'mb_per_s': {}, 'relative_speed': {}, 'matches': {}, 'static_risks': static_risks(pattern)}
+        for corpus_name, docs in corpora.items():
+            # Pattern and calibration are timed back to back in every repetition; the median ratio
+            # is robust against load changes during the run
+            speeds, ratios = [], []
+            for _ in range(repeat):
+                speed, entry['matches'][corpus_name] = throughput(pattern, docs, 1)
+                calibration, _ = throughput(CALIBRATION_PATTERN, docs, 1)
+                speeds.append(speed)
+                ratios.append(speed / calibration)
+            entry['mb_per_s'][corpus_name] = max(speeds)
+            entry['relative_speed'][corpus_name] = statistics.median(ratios)
+        entry.update(run_dynamic_probe(pattern, probe_timeout))
+        entry['superlinear'] = entry['worst_exponent'] > 1.5
+        results[name] = entry
+    return results
+
+
+def print_results(results, corpora):
+    header = f"{'pattern':<38}" + ''.join(f" {name + ' MB/s':>16} {'matches':>8}" for name in corpora) + f" {'growth':>7}  risks"
+    print(header)
+    for name, entry in results.items():
+        row = f"{name:<38}" + ''.join(f" {entry['mb_per_s'][corpus]:>16.1f} {entry['matches'][corpus]:>8}" for corpus in corpora)
+        risks = list(entry['static_risks'])
+        if entry['superlinear']:
+            risks.append(f"superlinear on {entry['worst_probe']} ({entry['worst_seconds']:.2f}s at {PROBE_SIZES[-1]} chars)")
+        growth = 'timeout' if math.isinf(entry['worst_exponent']) else f"n^{entry['worst_exponent']:.1f}"
+        print(row + f" {growth:>7}  {'; '.join(risks) or '-'}")
+
+
+def compare_to_baseline(results, baseline, tolerance, strict_matches, gated_corpora):
+    """
+    Return the list of regressions of `results` against a saved baseline: throughput (relative to
+    CALIBRATION_PATTERN) more than `tolerance` below the baseline's, new superlinear behaviour or static
+    risks, and with `strict_matches` changed match counts.
+    """
+    failures = []
+    for name, entry in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print(f"New pattern without baseline: {name}")
+            continue
+        for corpus in gated_corpora:
+            if corpus not in reference['relative_speed']:
+                continue
+            if entry['relative_speed'][corpus] < (1 - tolerance) * reference['relative_speed'][corpus]:
+                failures.append(f"{name}: {entry['relative_speed'][corpus]:.2f}x calibration speed on {corpus}, "
+                                f"baseline {reference['relative_speed'][corpus]:.2f}x")
+            if entry['matches'][corpus] != reference['matches'][corpus]:
+                message = f"{name}: {entry['matches'][corpus]} matches on {corpus}, baseline {reference['matches'][corpus]}"
+                if strict_matches:
+                    failures.append(message)
+                else:
+                    print(f"Changed: {message}")
+        if entry['superlinear'] and not reference.get('superlinear'):
+            failures.append(f"{name}: new superlinear backtracking on {entry['worst_probe']}")
+        new_risks = set(entry['static_risks']) - set(reference.get('static_risks', []))
+        if new_risks:
+            failures.append(f"{name}: new static risks {sorted(new_risks)}")
+    return failures
+
+
+def _json_number(value):
+    # JSON has no infinity; timeouts are stored as null
+    return None if isinstance(value, float) and math.isinf(value) else value
+
+
+def main(argv=None):
+    """Profile the patterns, save or compare the baseline and return the exit status: 1 on regressions, else 0."""
+    # Initializing argparse
+    parser = argparse.ArgumentParser(description='Profile the metric regexes and keyword patterns: throughput, match counts and backtracking risks')
+    parser.add_argument('-jsonl', action="store", default=None, dest="jsonl_path", type=str, help='Optional JSONL file to sample real texts from')
+    parser.add_argument('-samples', action="store", default=200, dest="samples", type=int, help='Number of texts to sample from the JSONL file')
+    parser.add_argument('-size', action="store", default=2000000, dest="corpus_size", type=int, help='Characters per synthetic corpus')
+    parser.add_argument('-repeat', action="store", default=5, dest="repeat", type=int, help='Timing repetitions; the best run is reported')
+    parser.add_argument('-probe_timeout', action="store", default=10.0, dest="probe_timeout", type=float, help='Seconds allowed for the adversarial probes of one pattern')
+    parser.add_argument('-pattern', action="store", default=None, dest="pattern_filter", type=str, help='Only profile patterns whose name contains this string')
+    parser.add_argument('-save_baseline', action="store", default=None, dest="save_baseline", type=str, help='Write the results to this JSON file')
+    parser.add_argument('-baseline', action="store", default=None, dest="baseline", type=str, help='Compare against this JSON file and exit with status 1 on regressions')
+    parser.add_argument('-tolerance', action="store", default=0.3, dest="tolerance", type=float, help='Allowed relative throughput drop against the baseline')
+    parser.add_argument('-strict_matches', action="store_true", dest="strict_matches", help='Also fail when match counts on the synthetic corpora change')
+    arguments = parser.parse_args(argv)
+
+    patterns = collect_patterns()
+    if arguments.pattern_filter:
+        patterns = {name: pattern for name, pattern in patterns.items() if arguments.pattern_filter in name}
+    corpora = {
+        'sparse': synthetic_corpus(arguments.corpus_size, mention_rate=0.02),
+        'dense': synthetic_corpus(arguments.corpus_size, mention_rate=0.3, seed=1),
+    }
+    gated_corpora = list(corpora)
+    if arguments.jsonl_path:
+        corpora['sampled'] = sample_jsonl(arguments.jsonl_path, arguments.samples)
+
+    results = profile(patterns, corpora, arguments.repeat, arguments.probe_timeout)
+    print_results(results, corpora)
+
+    if arguments.save_baseline:
+        with open(arguments.save_baseline, 'w') as file:
+            json.dump({name: {key: _json_number(value) for key, value in entry.items()} for name, entry in results.items()}, file, indent=1)
+        print(f"Baseline written to {arguments.save_baseline}")
+
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)
+        failures = compare_to_baseline(results, baseline, arguments.tolerance, arguments.strict_matches, gated_corpora)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            return 1
+        print("No regressions against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
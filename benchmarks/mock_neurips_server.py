@@ -0,0 +1,105 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Initializing argparse
+parser = argparse.ArgumentParser(description='Local stand-in for papers.nips.cc serving synthetic fixture pages for the NeurIPS scraper')
+parser.add_argument('-port', action="store", default=8001, dest="port", type=int, help='Port to listen on')
+parser.add_argument('-papers', action="store", default=50, dest="papers_per_year", type=int, help='Papers listed per year')
+parser.add_argument('-latency', action="store", default=0.05, dest="latency", type=float, help='Response latency in seconds')
+parser.add_argument('-error_rate', action="store", default=0.05, dest="error_rate", type=float, help='Share of metadata requests answered with 503')
+parser.add_argument('-max_concurrency', action="store", default=8, dest="max_concurrency", type=int, help='Concurrent requests above which 429 is returned')
+arguments = parser.parse_args()
+
+in_flight = 0
+counters = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'not_modified': 0, 'peak_concurrency': 0}
+lock = threading.Lock()
+
+
+def paper_hashes(year):
+    return [hashlib.md5(f"{year}-{i}".encode()).hexdigest() for i in range(arguments.papers_per_year)]
+
+
+def year_page(year):
+    items = ''.join(f'<li><a href="/paper/{year}/hash/{paper_hash}-Abstract.html">Paper {i}</a></li>'
+                    for i, paper_hash in enumerate(paper_hashes(year)))
+    return f'<html><body><div class="container-fluid"><ul>{items}</ul></div></body></html>'
+
+
+def metadata(year, paper_hash):
+    return {
+        'sourceid': paper_hash[:8],
+        'title': f'Paper {paper_hash[:8]} of {year}',
+        'abstract': 'We compare AUROC and AUPRC under class imbalance.',
+        'full_text': f'Full text of paper {paper_hash} reporting the area under the precision-recall curve.',
+        'authors': [{'given_name': 'Ada', 'family_name': 'Lovelace', 'institution': 'Analytical Engines'}],
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        global in_flight
+        with lock:
+            in_flight += 1
+            counters['requests'] += 1
+            counters['peak_concurrency'] = max(counters['peak_concurrency'], in_flight)
+            over_limit = in_flight > arguments.max_concurrency
+        try:
+            time.sleep(arguments.latency)
+            if over_limit:
+                counters['rate_limited'] += 1
+                self._send(429, '{}', headers={'Retry-After': '1'})
+                return
+            year_match = re.fullmatch(r'/paper/(\d{4})/?', self.path)
+            metadata_match = re.fullmatch(r'/paper/(\d{4})/file/([0-9a-f]+)-Metadata\.json', self.path)
+            if year_match:
+                page = year_page(year_match.group(1))
+                etag = '"%s"' % hashlib.md5(page.encode()).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    counters['not_modified'] += 1
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self._send(200, page, 'text/html', headers={'ETag': etag})
+            elif metadata_match:
+                if random.random() < arguments.error_rate:
+                    counters['errors'] += 1
+                    self._send(503, '{}')
+                    return
+                self._send(200, json.dumps(metadata(*metadata_match.groups())))
+            else:
+                self._send(404, '{}')
+        finally:
+            with lock:
+                in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+server = ThreadingHTTPServer(('127.0.0.1', arguments.port), Handler)
+print(f"Mock NeurIPS proceedings on http://127.0.0.1:{arguments.port}/paper/; Ctrl+C to stop")
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    print(f"Served {counters['requests']} requests ({counters['errors']} injected 503s, "
+          f"{counters['rate_limited']} rate limited, {counters['not_modified']} not modified); peak concurrency {counters['peak_concurrency']}")
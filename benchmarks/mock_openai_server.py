@@ -0,0 +1,136 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+def completion_content(request, response, malformed=0.0, echo=False):
+    """Answer batched prompts (JSON response format) per window, anything else with the fixed response
+    (or the user message with `echo`)."""
+    if (request.get('response_format') or {}).get('type') != 'json_object':
+        if echo:
+            return next((message.get('content') or '' for message in reversed(request.get('messages', []))
+                         if message.get('role') == 'user'), '')
+        return response
+    if random.random() < malformed:
+        return '{"results": ['
+    windows = []
+    for message in request.get('messages', []):
+        for part in (message.get('content') or '').split('\n\n'):
+            try:
+                value = json.loads(part)
+            except ValueError:
+                continue
+            if isinstance(value, list):
+                windows.extend(item for item in value if isinstance(item, dict) and 'id' in item)
+    return json.dumps({'results': [{'id': window['id'], 'response': response} for window in windows]})
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        settings = self.server.settings
+        counters = self.server.counters
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send(404, {'error': {'message': f'Unknown path {self.path}'}})
+            return
+        if not self.server.bucket.take():
+            with self.server.lock:
+                counters['rate_limited'] += 1
+            self._send(429, {'error': {'message': 'Rate limit reached', 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                       {'Retry-After': str(settings['retry_after'])})
+            return
+        time.sleep(random.expovariate(1 / settings['latency']) if settings['latency'] > 0 else 0)
+        with self.server.lock:
+            counters['ok'] += 1
+        content = completion_content(request, settings['response'], settings['malformed'], settings['echo'])
+        prompt_chars = sum(len(message.get('content') or '') for message in request.get('messages', []))
+        self._send(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'mock'),
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': prompt_chars // 4, 'completion_tokens': len(content) // 4,
+                      'total_tokens': (prompt_chars + len(content)) // 4},
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(port=8000, requests_per_second=50.0, burst=20, latency=0.2, retry_after=1.0,
+                response='{"claims": []}', malformed=0.0, echo=False):
+    """
+    Create the mock server; call `serve_forever()` on it, e.g. in a thread. Port 0 picks a free port,
+    see `server.server_address`. `server.counters` counts the completions and the 429 responses.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    server.settings = {'latency': latency, 'retry_after': retry_after, 'response': response,
+                       'malformed': malformed, 'echo': echo}
+    server.bucket = TokenBucket(requests_per_second, burst)
+    server.counters = {'ok': 0, 'rate_limited': 0}
+    server.lock = threading.Lock()
+    return server
+
+
+def main():
+    # Initializing argparse
+    parser = argparse.ArgumentParser(description='Local OpenAI-compatible chat completions server for exercising the claim search clients')
+    parser.add_argument('-port', action="store", default=8000, dest="port", type=int, help='Port to listen on')
+    parser.add_argument('-rps', action="store", default=50.0, dest="requests_per_second", type=float, help='Sustained requests per second before answering 429')
+    parser.add_argument('-burst', action="store", default=20, dest="burst", type=int, help='Requests allowed in a burst above the sustained rate')
+    parser.add_argument('-latency', action="store", default=0.2, dest="latency", type=float, help='Mean response latency in seconds')
+    parser.add_argument('-retry_after', action="store", default=1.0, dest="retry_after", type=float, help='Retry-After value sent with 429 responses')
+    parser.add_argument('-response', action="store", default='{"claims": []}', dest="response", type=str, help='Content returned for every completion')
+    parser.add_argument('-echo', action="store_true", dest="echo", help='Return the user message instead of -response, e.g. to check the order of answers')
+    parser.add_argument('-malformed', action="store", default=0.0, dest="malformed", type=float, help='Share of JSON-mode (batched) completions answered with invalid JSON')
+    arguments = parser.parse_args()
+
+    server = make_server(arguments.port, arguments.requests_per_second, arguments.burst, arguments.latency,
+                         arguments.retry_after, arguments.response, arguments.malformed, arguments.echo)
+    print(f"Mock OpenAI server on http://127.0.0.1:{arguments.port}/v1 "
+          f"({arguments.requests_per_second} req/s, burst {arguments.burst}); Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Served {server.counters['ok']} completions and {server.counters['rate_limited']} rate-limited responses")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+class CachedResponse:
+    """A response served from the cache, with the parts of the requests.Response interface the scraper uses."""
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def _atomic_write(path, data):
+    # Write to a temporary file and rename it, so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class HttpCache:
+    """
+    On-disk cache of successful GET responses, keyed by URL.
+
+    Every entry is a body file plus a small JSON file with the URL, status, the validators
+    (ETag, Last-Modified) and the time it was fetched. Entries are written atomically, so the
+    cache can be shared by concurrent threads and survives interrupted runs.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        folder = os.path.join(self.cache_dir, key[:2])
+        return folder, os.path.join(folder, key + '.json'), os.path.join(folder, key + '.body')
+
+    def get(self, url):
+        """Return the cached response for a URL, or None."""
+        _, meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            with open(body_path, 'rb') as file:
+                content = file.read()
+        except (OSError, ValueError):
+            return None
+        response = CachedResponse(url, meta['status_code'], meta['headers'], content)
+        response.fetched_at = meta.get('fetched_at')
+        return response
+
+    def put(self, url, response):
+        """Store a 200 response (requests.Response or CachedResponse)."""
+        folder, meta_path, body_path = self._paths(url)
+        os.makedirs(folder, exist_ok=True)
+        headers = {key: response.headers[key] for key in ('ETag', 'Last-Modified', 'Content-Type') if key in response.headers}
+        _atomic_write(body_path, response.content)
+        meta = {'url': url, 'status_code': response.status_code, 'headers': headers, 'fetched_at': time.time()}
+        _atomic_write(meta_path, json.dumps(meta).encode('utf-8'))
+
+    def validators(self, cached):
+        """Conditional request headers for revalidating a cached response."""
+        headers = {}
+        if 'ETag' in cached.headers:
+            headers['If-None-Match'] = cached.headers['ETag']
+        if 'Last-Modified' in cached.headers:
+            headers['If-Modified-Since'] = cached.headers['Last-Modified']
+        return headers
+
+
+class CompletionLedger:
+    """
+    Append-only record of the papers already written to the output, one key per line.
+
+    A key is appended only after its record has been written, so after an interruption every
+    listed paper is in the output and every other paper is fetched again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = set()
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                self.completed = {line.strip() for line in file if line.strip()}
+        self._file = open(path, 'a')
+
+    def __contains__(self, key):
+        return key in self.completed
+
+    def add(self, key):
+        self.completed.add(key)
+        self._file.write(key + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
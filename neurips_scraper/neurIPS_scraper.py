@@ -1,29 +1,21 @@
 import requests
 import argparse
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 from tqdm import tqdm
-from requests.exceptions import ConnectionError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 import os
 
-# Initializing argparse
-parser = argparse.ArgumentParser(description='Script to scrape NeurIPS Papers')
-
-parser.add_argument('-start', action="store", default=1987, dest="start_year", type=int, help='The start year to scrape the papers')
-parser.add_argument('-end', action="store", default=2023, dest="end_year", type=int, help='The end year to scrape the papers')
-parser.add_argument('-folder', action="store", default="data", dest="folder_path", type=str, help='Folder to save the scraped data')
-parser.add_argument('-filename', action="store", default="neurIPS_papers.jsonl", dest="filename", type=str, help='Filename for the output JSONL file')
-arguments = parser.parse_args()
-
-# Argparse conditions
-if arguments.start_year < 1987 or arguments.start_year > 2023:
-    raise ValueError("Please enter a valid start year. Possible values are [1987, 2023].")
-
-if arguments.end_year < 1987 or arguments.end_year > 2023:
-    raise ValueError("Please enter a valid end year. Possible values are [1987, 2023].")
-
-if arguments.start_year > arguments.end_year:
-    raise ValueError("Start year shouldn't be greater than end year.")
+try:
+    from .http_cache import HttpCache, CompletionLedger
+except ImportError:
+    # Run as a script from this folder
+    from http_cache import HttpCache, CompletionLedger
 
 # Constants
 BASE_URL = "https://papers.nips.cc/paper/"
@@ -31,125 +23,263 @@ PARSER = 'lxml'
 HEADERS = {
     "user-agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.183 Safari/537.36",
 }
-start_year = arguments.start_year
-end_year = arguments.end_year
-papers = []
-paper_authors = []
 
 
-def get_conference_url(start_year, end_year):
+def build_session(pool_size=16, retries=5, backoff_factor=0.5):
+    """
+    Return a requests session with a keep-alive connection pool and retries with exponential backoff.
+
+    Retries cover connection errors and 429/5xx responses; a Retry-After header is honored.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class HostLimiter:
+    """Caps the number of concurrent requests per host, shared by all worker threads."""
+
+    def __init__(self, max_per_host=4):
+        self.max_per_host = max_per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+
+def fetch(session, limiter, url, timeout=30, cache=None, offline=False, revalidate=True):
+    """
+    Return the response for a GET request, or None if the request failed after all retries.
+
+    With a cache, successful responses are stored in it. A cached URL is requested again only if
+    `revalidate` is set, as a conditional request (ETag/Last-Modified) that returns the cached copy
+    on 304 or when the request fails. With `offline`, only the cache is used.
+    """
+    cached = cache.get(url) if cache is not None else None
+    if cached is not None and not revalidate or offline:
+        return cached
+    headers = cache.validators(cached) if cached is not None else {}
+    try:
+        with limiter(url):
+            response = session.get(url, timeout=timeout, headers=headers)
+    except RequestException as error:
+        print(error)
+        return cached
+    if response.status_code == 304 and cached is not None:
+        return cached
+    if response.status_code == 200 and cache is not None:
+        cache.put(url, response)
+    return response
+
+
+def get_conference_url(start_year, end_year, base_url=BASE_URL):
     """Return all the URLs of conferences between start_year and end_year"""
 
     conferences = []
     print("Preparing data...")
-    for year in tqdm(range(start_year, end_year+1)):
-        year_url = BASE_URL + str(year)
+    for year in range(start_year, end_year+1):
+        year_url = base_url + str(year)
         conferences.append({"URL": year_url})
     return conferences
 
 
-def get_all_hashes(url):
+def get_all_hashes(session, limiter, url, cache=None, offline=False):
     """
         Context: The NeurIPS website follow a structured pattern by maintaining a hash for each paper.
 
         Return all the hashes for a particular year.
     """
+    # Year pages change when papers are added, so cached copies are revalidated
+    response = fetch(session, limiter, url, cache=cache, offline=offline, revalidate=True)
+    if response is not None and response.status_code == 200:
+        soup = BeautifulSoup(response.text, PARSER)
+
+        hashes = []
+        for li in soup.find("div", class_="container-fluid").find_all("li"):
+            paper_url = li.a.get('href')
+            paper_hash = paper_url.split("/")[-1].split("-")[0]
+            hashes.append(paper_hash)
+        return hashes
+    else:
+        print(f"Couldn't complete the request for URL: {url}")
+        return False
+
+
+def scrap_paper_and_authors(session, limiter, year_url, paper_hash, cache=None, offline=False):
+    """Scrap one paper and its authors; returns (paper, authors) or None"""
+
+    paper_url = year_url + "/file/" + paper_hash + "-Metadata.json"
+    # Paper metadata does not change once published, so a cached copy is used as is
+    response = fetch(session, limiter, paper_url, cache=cache, offline=offline, revalidate=False)
+    if response is None or response.status_code != 200:
+        print(f"Failed to get response for URL: {paper_url}")
+        return None
     try:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, PARSER)
-
-            hashes = []
-            for li in soup.find("div", class_="container-fluid").find_all("li"):
-                paper_url = li.a.get('href')
-                paper_hash = paper_url.split("/")[-1].split("-")[0]
-                hashes.append(paper_hash)
-            return hashes
-        else:
-            print("Couldn't complete the request.")
-            return False
-    except ConnectionError as error:
-        print(error)
+        doc = response.json()
+    except ValueError:
+        print(f"Invalid JSON response for URL: {paper_url}")
+        return None
 
+    # Extracting paper
+    paper = {
+        'source_id': doc.get('sourceid'),
+        'year': year_url.split("/")[-1],
+        'title': doc.get('title'),
+        'abstract': doc.get('abstract'),
+        'full_text': doc.get('full_text')
+    }
 
-def scrap_paper_and_authors(year_url, hashes):
-    """Scrap papers and authors using extracted hashes"""
+    # Extracting authors from a paper
+    authors = []
+    for author in doc.get('authors', []):
+        authors.append({
+            'source_id': doc.get('sourceid'),
+            'first_name': author.get('given_name'),
+            'last_name': author.get('family_name'),
+            'institution': author.get('institution')
+        })
+    return paper, authors
+
+
+def paper_record(paper):
+    """Transform a scraped paper to the JSONL format used by the filtering scripts"""
+    return {
+        "text": paper["full_text"],
+        "meta": {
+            "source_id": paper["source_id"],
+            "year": paper["year"],
+            "title": paper["title"],
+            "abstract": paper["abstract"]
+        }
+    }
 
-    for paper_hash in tqdm(hashes):
-        paper_url = year_url + "/file/" + paper_hash + "-Metadata.json"
-        try:
-            response = requests.get(paper_url, headers=HEADERS)
-            if response.status_code == 200:
-                try:
-                    doc = response.json()
-                except json.JSONDecodeError:
-                    print(f"Invalid JSON response for URL: {paper_url}")
-                    continue
 
-                # Extracting paper
-                paper = {
-                    'source_id': doc.get('sourceid'),
-                    'year': year_url.split("/")[-1],
-                    'title': doc.get('title'),
-                    'abstract': doc.get('abstract'),
-                    'full_text': doc.get('full_text')
-                }
-                papers.append(paper)
-
-                # Extracting authors from a paper
-                for author in doc.get('authors', []):
-                    author_details = {
-                        'source_id': doc.get('sourceid'),
-                        'first_name': author.get('given_name'),
-                        'last_name': author.get('family_name'),
-                        'institution': author.get('institution')
-                    }
-                    paper_authors.append(author_details)
-            else:
-                print(f"Failed to get response for URL: {paper_url}")
-        except ConnectionError as error:
-            print(error)
-
-
-
-def save_jsonl(file_name, data, folder_path):
-    """Save data in JSONL format in the specified folder."""
+def scrape(start_year, end_year, folder_path, filename, authors_filename=None, base_url=BASE_URL,
+           max_workers=16, max_per_host=8, retries=5, backoff_factor=0.5, cache_dir=None, offline=False, resume=True):
+    """
+    Scrape the NeurIPS papers of a range of years and stream them to a JSONL file.
+
+    Papers are fetched concurrently by `max_workers` threads over one pooled session, with at most
+    `max_per_host` requests in flight per host. Records are written as soon as they are available,
+    in the same order as a sequential scrape. Returns the number of papers written.
+
+    Responses are kept in an HTTP cache in `cache_dir` (None disables it); with `offline` only the
+    cache is read. Written papers are listed in a ledger next to the output (`<filename>.ledger`);
+    with `resume`, papers in the ledger are skipped and new ones are appended to the output, so an
+    interrupted run continues where it stopped and a rerun only fetches newly published papers.
+    Without `resume`, and always with `offline`, which re-parses every cached paper, the output and
+    ledger are started from scratch.
+    """
+    if offline:
+        if cache_dir is None:
+            raise ValueError("Offline mode needs the HTTP cache.")
+        resume = False
     # Check if the folder exists, create it if not
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
 
-    file_path = os.path.join(folder_path, file_name)
-    with open(file_path, 'w') as file:
-        for item in data:
-            json_record = json.dumps(item, ensure_ascii=False)
-            file.write(json_record + '\n')
-    print(f"Successfully saved {file_name} in '{folder_path}' folder")
-
-
-# Main execution logic
-conferences = get_conference_url(start_year, end_year)
-
-papers = []
-for year in conferences:
-    hashes = get_all_hashes(year["URL"])
-    if hashes:
-        scrap_paper_and_authors(year["URL"], hashes)
-
-if papers:
-    # Transforming to the required JSONL format
-    jsonl_data = []
-    for paper in papers:
-        jsonl_record = {
-            "text": paper["full_text"],
-            "meta": {
-                "source_id": paper["source_id"],
-                "year": paper["year"],
-                "title": paper["title"],
-                "abstract": paper["abstract"]
-            }
-        }
-        jsonl_data.append(jsonl_record)
+    session = build_session(pool_size=max(max_workers, max_per_host), retries=retries, backoff_factor=backoff_factor)
+    limiter = HostLimiter(max_per_host)
+    cache = HttpCache(cache_dir) if cache_dir else None
+    ledger_path = os.path.join(folder_path, filename + '.ledger')
+    if not resume and os.path.exists(ledger_path):
+        os.remove(ledger_path)
+    ledger = CompletionLedger(ledger_path)
+    mode = 'a' if ledger.completed else 'w'
+    num_papers = skipped = 0
+    authors_file = open(os.path.join(folder_path, authors_filename), mode) if authors_filename else None
+    try:
+        with open(os.path.join(folder_path, filename), mode) as file, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for year in get_conference_url(start_year, end_year, base_url):
+                hashes = get_all_hashes(session, limiter, year["URL"], cache=cache, offline=offline)
+                if not hashes:
+                    continue
+                year_name = year["URL"].rstrip("/").split("/")[-1]
+                pending = [paper_hash for paper_hash in hashes if f"{year_name}/{paper_hash}" not in ledger]
+                skipped += len(hashes) - len(pending)
+                results = executor.map(lambda paper_hash: scrap_paper_and_authors(session, limiter, year["URL"], paper_hash, cache=cache, offline=offline), pending)
+                for paper_hash, result in tqdm(zip(pending, results), total=len(pending), desc=year_name):
+                    if result is None:
+                        continue
+                    paper, authors = result
+                    file.write(json.dumps(paper_record(paper), ensure_ascii=False) + '\n')
+                    num_papers += 1
+                    if authors_file is not None:
+                        for author in authors:
+                            authors_file.write(json.dumps(author, ensure_ascii=False) + '\n')
+                        authors_file.flush()
+                    file.flush()
+                    ledger.add(f"{year_name}/{paper_hash}")
+    finally:
+        if authors_file is not None:
+            authors_file.close()
+        ledger.close()
+        session.close()
+
+    if skipped:
+        print(f"Skipped {skipped} papers already in {filename}")
+    if num_papers:
+        print(f"Successfully saved {num_papers} papers to {filename} in '{folder_path}' folder")
+    else:
+        print("No data to save!")
+    return num_papers
+
+
+def main(argv=None):
+    # Initializing argparse
+    parser = argparse.ArgumentParser(description='Script to scrape NeurIPS Papers')
+
+    parser.add_argument('-start', action="store", default=1987, dest="start_year", type=int, help='The start year to scrape the papers')
+    parser.add_argument('-end', action="store", default=2023, dest="end_year", type=int, help='The end year to scrape the papers')
+    parser.add_argument('-folder', action="store", default="data", dest="folder_path", type=str, help='Folder to save the scraped data')
+    parser.add_argument('-filename', action="store", default="neurIPS_papers.jsonl", dest="filename", type=str, help='Filename for the output JSONL file')
+    parser.add_argument('-authors_filename', action="store", default=None, dest="authors_filename", type=str, help='Optional filename for a JSONL file of paper authors')
+    parser.add_argument('-base_url', action="store", default=BASE_URL, dest="base_url", type=str, help='Base URL of the proceedings, e.g. a local stand-in server')
+    parser.add_argument('-workers', action="store", default=16, dest="max_workers", type=int, help='Number of concurrent fetcher threads')
+    parser.add_argument('-per_host', action="store", default=8, dest="max_per_host", type=int, help='Maximum concurrent requests per host')
+    parser.add_argument('-retries', action="store", default=5, dest="retries", type=int, help='Retries per request on connection errors, 429 and 5xx responses')
+    parser.add_argument('-cache_dir', action="store", default=None, dest="cache_dir", type=str, help='HTTP cache folder (defaults to <folder>/http_cache)')
+    parser.add_argument('-no_cache', action="store_true", dest="no_cache", help='Do not cache HTTP responses')
+    parser.add_argument('-offline', action="store_true", dest="offline", help='Only read responses from the HTTP cache and rewrite the output from them')
+    parser.add_argument('-restart', action="store_true", dest="restart", help='Ignore the completion ledger and rewrite the output from scratch')
+    arguments = parser.parse_args(argv)
+
+    # Argparse conditions
+    if arguments.start_year < 1987 or arguments.start_year > 2023:
+        raise ValueError("Please enter a valid start year. Possible values are [1987, 2023].")
+
+    if arguments.end_year < 1987 or arguments.end_year > 2023:
+        raise ValueError("Please enter a valid end year. Possible values are [1987, 2023].")
+
+    if arguments.start_year > arguments.end_year:
+        raise ValueError("Start year shouldn't be greater than end year.")
+
+    if arguments.offline and arguments.no_cache:
+        raise ValueError("Offline mode needs the HTTP cache.")
+
+    base_url = arguments.base_url if arguments.base_url.endswith("/") else arguments.base_url + "/"
+    cache_dir = None if arguments.no_cache else (arguments.cache_dir or os.path.join(arguments.folder_path, "http_cache"))
+    return scrape(arguments.start_year, arguments.end_year, arguments.folder_path, arguments.filename,
+                  authors_filename=arguments.authors_filename, base_url=base_url, max_workers=arguments.max_workers,
+                  max_per_host=arguments.max_per_host, retries=arguments.retries, cache_dir=cache_dir,
+                  offline=arguments.offline, resume=not arguments.restart)
+
 
-    save_jsonl(arguments.filename, jsonl_data, arguments.folder_path)
-else:
-    print("No data to save!")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,311 @@
-import pandas as pd
-import numpy as np
-from pathlib import Path
-from pdf_extraction import extract_text
-from tqdm import tqdm
-import re
-import json
-
-root_dir = Path('/path/to/pdfs_dir')
-
-res = []
-for i in tqdm(root_dir.glob('**/*.pdf')):
-    text = extract_text(i, page_limit = 10)
-    res.append({
-        'text': text,
-        'meta':{
-            'timestamp': re.findall('([0-9]+)', str(i))[0],
-            'arxiv_id': i.name,
-            'url': str(i)
-        }
-    })
-
-with open('./paper_texts.jsonl', 'w') as f:
-    for r in res:
-        json.dump(r, f)
-        f.write('\n')
\ No newline at end of file
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from multiprocessing.connection import wait
+from pathlib import Path
+
+from tqdm import tqdm
+
+from pdf_extraction import extract_text
+
+
+def iter_pdf_paths(root_dir):
+    """
+    Lazily yield the PDF files below a folder, so millions of files are never listed at once.
+    """
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith('.pdf'):
+                yield Path(dirpath) / filename
+
+
+def paper_record(path, text):
+    """
+    JSONL record of an extracted paper, in the layout the filtering scripts expect.
+    """
+    timestamps = re.findall('([0-9]+)', str(path))
+    return {
+        'text': text,
+        'meta': {
+            'timestamp': timestamps[0] if timestamps else None,
+            'arxiv_id': path.name,
+            'url': str(path)
+        }
+    }
+
+
+# Statuses after which an unchanged file is not extracted again (unless retrying failures); such files have an output record
+DONE_STATUSES = ('converted', 'no_text')
+
+
+def file_sha256(path, block_size=1 << 20):
+    """
+    SHA-256 of a file's content, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path):
+    """
+    Read a conversion manifest; the last record of every path wins.
+
+    Returns:
+    - dict: Path string to its manifest record (path, size, mtime, sha256, extractor, status).
+    """
+    manifest = {}
+    if not os.path.exists(manifest_path):
+        return manifest
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            manifest[record['path']] = record
+    return manifest
+
+
+def drop_superseded_records(output_path, paths, end_offset):
+    """
+    Rewrite an output JSONL file without the records of the given paths that start before byte `end_offset`.
+
+    Used after changed PDFs were processed again, so the records of earlier runs are replaced by the
+    new ones and every paper appears at most once in the output.
+    """
+    with open(output_path, 'rb') as file, open(output_path + '.tmp', 'wb') as output:
+        position = 0
+        for line in file:
+            if position >= end_offset or json.loads(line)['meta']['url'] not in paths:
+                output.write(line)
+            position += len(line)
+    os.replace(output_path + '.tmp', output_path)
+
+
+def _extraction_worker(connection, extract_options):
+    # Receives one (path, known sha256) task at a time and answers with a result dict; None stops the worker
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        path, known_sha256 = task
+        result = {'path': path, 'sha256': None, 'text': '', 'extractor': None, 'error': None, 'unchanged': False}
+        try:
+            result['sha256'] = file_sha256(path)
+            if known_sha256 is not None and result['sha256'] == known_sha256:
+                result['unchanged'] = True
+            else:
+                result['text'], result['extractor'] = extract_text(path, return_extractor=True, **extract_options)
+        except Exception as e:
+            result['error'] = str(e)
+        connection.send(result)
+
+
+class _Worker:
+    def __init__(self, extract_options):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_extraction_worker, args=(child_connection, extract_options), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.path = None
+        self.file_stat = None
+        self.started = None
+        self.tasks_done = 0
+
+    def submit(self, path, file_stat, known_sha256=None):
+        self.path = path
+        self.file_stat = file_stat
+        self.started = time.monotonic()
+        self.connection.send((path, known_sha256))
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self.process.join()
+        self.connection.close()
+
+
+def convert_pdfs(pdf_paths, output_path, num_workers=None, timeout=120, page_limit=10, max_tasks_per_worker=1000,
+                 manifest_path=None, retry_failed=False, max_extra_pages=5):
+    """
+    Extract the text of many PDFs in parallel worker processes and stream the records to a JSONL file.
+
+    Parameters:
+    - pdf_paths (iterable of Path): PDFs to convert, e.g. `iter_pdf_paths(root_dir)`.
+    - output_path (str): JSONL file the records are written to as they finish.
+    - num_workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+    - timeout (float, optional): Seconds a single PDF may take before its worker is killed. Defaults to 120.
+    - page_limit (int, optional): Number of pages extracted per PDF. Defaults to 10.
+    - max_tasks_per_worker (int, optional): PDFs a worker handles before it is replaced, bounding memory
+      leaked by the PDF libraries. Defaults to 1000.
+    - manifest_path (str, optional): JSONL manifest of processed files. Defaults to `<output_path>.manifest.jsonl`.
+    - retry_failed (bool, optional): Also reprocess unchanged files that failed, timed out or crashed before,
+      including files every extractor raised an error on. Defaults to False.
+    - max_extra_pages (int, optional): Pages of results/experiments sections added beyond `page_limit`. Defaults to 5.
+
+    Returns:
+    - dict: Counts of 'converted', 'no_text', 'failed', 'timed_out' and 'crashed' files, of 'unchanged' files
+      whose content hash matched the manifest, and of 'skipped' files whose size and mtime matched it.
+
+    Behavior:
+    - Every worker gets its own pipe and one PDF at a time, so a hanging or crashing worker can be
+      killed and replaced without affecting the others.
+    - Records are written in completion order and flushed as they arrive; failed, timed-out and crashed
+      files are reported and left out of the output. A file is 'failed' if every extractor raised an
+      error, and 'no_text' if an extractor opened it but found no text.
+    - Every processed file gets a manifest record (path, size, mtime, sha256, extractor, status), written
+      after its output record. On a rerun, files with the same size and mtime are skipped without being
+      read; files with the same size but a new mtime are hashed and only extracted if their content
+      changed. New records are appended to the existing output, and the old records of changed files are
+      removed from it at the end of the run, so every paper appears at most once.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    extract_options = {'page_limit': page_limit, 'max_extra_pages': max_extra_pages}
+    manifest_path = manifest_path or output_path + '.manifest.jsonl'
+    manifest = load_manifest(manifest_path)
+    stats = {'converted': 0, 'no_text': 0, 'failed': 0, 'timed_out': 0, 'crashed': 0, 'unchanged': 0, 'skipped': 0}
+    paths = iter(pdf_paths)
+    # Files processed again in this run whose records from earlier runs are outdated
+    superseded = set()
+
+    def next_task():
+        # Next file that needs work, with the content hash to compare against if only its mtime changed
+        for path in paths:
+            try:
+                file_stat = path.stat()
+            except OSError:
+                continue
+            entry = manifest.get(str(path))
+            if entry is not None and entry['size'] == file_stat.st_size and (entry['status'] in DONE_STATUSES or not retry_failed):
+                if entry['mtime'] == file_stat.st_mtime:
+                    stats['skipped'] += 1
+                    continue
+                return path, file_stat, entry.get('sha256')
+            return path, file_stat, None
+        return None
+
+    def manifest_record(path, file_stat, sha256, extractor, status):
+        record = {'path': str(path), 'size': file_stat.st_size, 'mtime': file_stat.st_mtime,
+                  'sha256': sha256, 'extractor': extractor, 'status': status}
+        manifest_file.write(json.dumps(record) + '\n')
+        manifest_file.flush()
+
+    exhausted = False
+    workers = [_Worker(extract_options) for _ in range(num_workers)]
+    previous_size = os.path.getsize(output_path) if manifest and os.path.exists(output_path) else 0
+    with open(output_path, 'a' if manifest else 'w', encoding='utf-8') as output, \
+            open(manifest_path, 'a', encoding='utf-8') as manifest_file, tqdm(unit='pdf') as progress:
+        try:
+            while True:
+                # Hand a new PDF to every idle worker
+                for i, worker in enumerate(workers):
+                    if worker.path is not None or exhausted:
+                        continue
+                    task = next_task()
+                    if task is None:
+                        exhausted = True
+                        break
+                    if worker.tasks_done >= max_tasks_per_worker:
+                        worker.stop()
+                        workers[i] = worker = _Worker(extract_options)
+                    worker.submit(*task)
+
+                busy = [worker for worker in workers if worker.path is not None]
+                if not busy:
+                    break
+
+                now = time.monotonic()
+                wait_time = max(0.0, min(worker.started + timeout - now for worker in busy))
+                ready = wait([worker.connection for worker in busy] + [worker.process.sentinel for worker in busy], timeout=wait_time)
+
+                for i, worker in enumerate(workers):
+                    if worker.path is None:
+                        continue
+                    path, file_stat = worker.path, worker.file_stat
+                    if worker.connection in ready:
+                        try:
+                            result = worker.connection.recv()
+                        except EOFError:
+                            result = 'crashed'
+                    elif worker.process.sentinel in ready:
+                        result = 'crashed'
+                    elif time.monotonic() - worker.started > timeout:
+                        result = 'timed_out'
+                    else:
+                        continue
+
+                    previous_status = manifest.get(str(path), {}).get('status')
+                    if previous_status in DONE_STATUSES and not (isinstance(result, dict) and result['unchanged']):
+                        # The earlier record is outdated whether or not the new extraction succeeds
+                        superseded.add(str(path))
+                    if isinstance(result, str):
+                        print(f"{path} {result.replace('_', ' ')}; restarting its worker")
+                        stats[result] += 1
+                        manifest_record(path, file_stat, None, None, result)
+                        worker.stop(kill=True)
+                        workers[i] = _Worker(extract_options)
+                    else:
+                        if result['unchanged']:
+                            status = manifest[str(path)]['status']
+                            stats['unchanged'] += 1
+                        elif result['error'] is not None:
+                            print(f"Error extracting {path}: {result['error']}")
+                            status = 'failed'
+                            stats[status] += 1
+                        elif result['extractor'] is None:
+                            print(f"Every extractor failed on {path}")
+                            status = 'failed'
+                            stats[status] += 1
+                        else:
+                            status = 'converted' if result['text'].strip() else 'no_text'
+                            stats[status] += 1
+                            output.write(json.dumps(paper_record(path, result['text'])) + '\n')
+                            output.flush()
+                        extractor = manifest[str(path)]['extractor'] if result['unchanged'] else result['extractor']
+                        manifest_record(path, file_stat, result['sha256'], extractor, status)
+                        worker.path = None
+                        worker.tasks_done += 1
+                    progress.update()
+        finally:
+            for worker in workers:
+                worker.stop(kill=worker.path is not None)
+            output.close()
+            if superseded:
+                drop_superseded_records(output_path, superseded, previous_size)
+
+    print(f"Converted {stats['converted']} PDFs to {output_path} ({stats['no_text']} without text); "
+          f"{stats['failed']} failed, {stats['timed_out']} timed out, {stats['crashed']} crashed; "
+          f"{stats['skipped'] + stats['unchanged']} unchanged files skipped")
+    return stats
+
+
+if __name__ == '__main__':
+    # Initializing argparse
+    parser = argparse.ArgumentParser(description='Convert a folder of PDFs to a JSONL file of texts in parallel')
+    parser.add_argument('-folder', action="store", default='/path/to/pdfs_dir', dest="root_dir", type=str, help='Folder searched recursively for PDFs')
+    parser.add_argument('-output', action="store", default='./paper_texts.jsonl', dest="output_path", type=str, help='Output JSONL file')
+    parser.add_argument('-workers', action="store", default=None, dest="num_workers", type=int, help='Number of worker processes (defaults to all CPUs)')
+    parser.add_argument('-timeout', action="store", default=120, dest="timeout", type=float, help='Seconds allowed per PDF before its worker is killed')
+    parser.add_argument('-page_limit', action="store", default=10, dest="page_limit", type=int, help='Number of pages extracted per PDF')
+    parser.add_argument('-extra_pages', action="store", default=5, dest="max_extra_pages", type=int, help='Pages of results/experiments sections added beyond the page limit')
+    parser.add_argument('-manifest', action="store", default=None, dest="manifest_path", type=str, help='Manifest of processed files (defaults to <output>.manifest.jsonl)')
+    parser.add_argument('-retry_failed', action="store_true", dest="retry_failed", help='Reprocess unchanged files that failed, timed out or crashed before')
+    arguments = parser.parse_args()
+
+    convert_pdfs(iter_pdf_paths(arguments.root_dir), arguments.output_path, num_workers=arguments.num_workers,
+                 timeout=arguments.timeout, page_limit=arguments.page_limit,
+                 manifest_path=arguments.manifest_path, retry_failed=arguments.retry_failed,
+                 max_extra_pages=arguments.max_extra_pages)
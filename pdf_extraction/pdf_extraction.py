@@ -1,55 +1,215 @@
 import os
+import re
 import sys
-import fitz 
+from contextlib import contextmanager
+
+import fitz
 import pypdfium2 as pdfium
 import PyPDF2
 
-def extract_text_pymupdf(filepath, page_limit=None):
+_SECTION_WORDS = r'(?:experimental results|experimental setup|experiments?|results|evaluation)'
+# Headings of the sections that are extracted even when they lie beyond the page limit: a numbered heading
+# ("5 Experiments", "IV. Results on ImageNet") or a short line of its own ("Results and Discussion"), so
+# body lines that merely start with "Results" or "Evaluation" do not count
+RESULTS_SECTION_PATTERN = re.compile(
+    r'^[ \t]*(?:(?:[0-9]+(?:\.[0-9]+)*\.?|[IVX]+\.)[ \t]+' + _SECTION_WORDS + r'\b[^\n]{0,60}'
+    r'|' + _SECTION_WORDS + r'\b(?:[ \t]+[^\s.]+){0,4}[ \t]*[.:]?)[ \t]*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+@contextmanager
+def open_pymupdf(filepath):
+    with fitz.open(filepath) as doc:
+        def read_page(num):
+            return doc.load_page(num).get_text()
+        # get_toc entries are [level, title, 1-based page]; entries without a destination have page -1
+        toc = [(level, title, page - 1 if page > 0 else None) for level, title, page in doc.get_toc(simple=True)]
+        yield doc.page_count, read_page, toc
+
+
+def _pypdfium2_toc_entry(item):
+    # pypdfium2 >= 5 returns bookmark objects, older versions outline tuples
+    if hasattr(item, 'get_title'):
+        dest = item.get_dest()
+        return item.level + 1, item.get_title(), dest.get_index() if dest is not None else None
+    return item.level + 1, item.title, item.page_index
+
+
+@contextmanager
+def open_pypdfium2(filepath):
+    doc = pdfium.PdfDocument(filepath)
     try:
-        doc = fitz.open(filepath)
-        text = ''
-        for num, page in enumerate(doc):
-            if page_limit is not None and num >= page_limit:
+        def read_page(num):
+            page = doc[num]
+            text_page = page.get_textpage()
+            try:
+                return text_page.get_text_bounded()
+            finally:
+                text_page.close()
+                page.close()
+        try:
+            toc = [entry for entry in map(_pypdfium2_toc_entry, doc.get_toc()) if entry[2] is not None]
+        except Exception:
+            toc = []
+        yield len(doc), read_page, toc
+    finally:
+        doc.close()
+
+
+def _pypdf2_outline(reader, outline, level=1):
+    toc = []
+    for item in outline:
+        if isinstance(item, list):
+            toc.extend(_pypdf2_outline(reader, item, level + 1))
+        else:
+            toc.append((level, item.title, reader.get_destination_page_number(item)))
+    return toc
+
+
+@contextmanager
+def open_pypdf2(filepath):
+    with open(filepath, 'rb') as pdf_file:
+        reader = PyPDF2.PdfReader(pdf_file)
+        def read_page(num):
+            return reader.pages[num].extract_text() or ''
+        try:
+            toc = _pypdf2_outline(reader, reader.outline)
+        except Exception:
+            toc = []
+        yield len(reader.pages), read_page, toc
+
+
+# Backends in the order they are tried; each opens a document as (number of pages, page reader, table of contents)
+BACKENDS = {
+    'pymupdf': open_pymupdf,
+    'pypdfium2': open_pypdfium2,
+    'pypdf2': open_pypdf2,
+}
+
+
+def select_pages(num_pages, read_page, toc, page_limit=10, section_pattern=RESULTS_SECTION_PATTERN, max_extra_pages=5,
+                 max_scan_pages=20):
+    """
+    Choose the pages to extract: the first `page_limit` pages plus the pages of matching sections after them.
+
+    Parameters:
+    - num_pages (int): Number of pages of the document.
+    - read_page (callable): Returns the text of a page number; only used when the document has no outline.
+    - toc (list of tuple): (level, title, page number) outline entries, possibly empty.
+    - page_limit (int, optional): Number of leading pages. None selects all pages. Defaults to 10.
+    - section_pattern (re.Pattern, optional): Section headings to include beyond the page limit, by default
+      results, experiments and evaluation. None disables the extra pages.
+    - max_extra_pages (int, optional): Maximum number of pages added beyond the page limit. Defaults to 5.
+    - max_scan_pages (int, optional): Without an outline, number of pages after the page limit searched for
+      headings. Defaults to 20.
+
+    Returns:
+    - list of int: Sorted page numbers.
+
+    Behavior:
+    - With an outline, a matching entry selects its pages up to the next entry of the same or a higher level.
+    - Without one, the pages after the page limit are read one by one until `max_extra_pages` pages are
+      selected or `max_scan_pages` pages were searched; a heading selects its page and the next one.
+    """
+    if page_limit is None or num_pages <= page_limit:
+        return list(range(num_pages))
+    pages = list(range(page_limit))
+    if section_pattern is None or max_extra_pages <= 0:
+        return pages
+
+    extra = []
+    if toc:
+        for i, (level, title, start) in enumerate(toc):
+            if start is None or not section_pattern.match(title):
+                continue
+            end = next((page for next_level, _, page in toc[i + 1:] if next_level <= level and page is not None), num_pages - 1)
+            extra.extend(range(max(start, page_limit), min(max(start, end), num_pages - 1) + 1))
+    else:
+        for num in range(page_limit, min(num_pages, page_limit + max_scan_pages)):
+            if len(set(extra)) >= max_extra_pages:
                 break
-            text += page.get_text()
-        return text
-    except Exception as e:
-        print(f"Error with PyMuPDF: {e}")
-    return None
+            if section_pattern.search(read_page(num)):
+                extra.extend(page for page in (num, num + 1) if page < num_pages)
+
+    extra = sorted(set(extra) - set(pages))[:max_extra_pages]
+    return pages + extra
+
+
+def extract_document(filepath, page_limit=10, section_pattern=RESULTS_SECTION_PATTERN, max_extra_pages=5,
+                     min_chars_per_page=100, backends=None, max_scan_pages=20):
+    """
+    Extract the text of a PDF with the first backend that yields plausible text.
+
+    Parameters:
+    - filepath (str or Path): The PDF file.
+    - page_limit, section_pattern, max_extra_pages, max_scan_pages: Page selection, see `select_pages`.
+    - min_chars_per_page (int, optional): Text density below which the next backend is tried, e.g. when
+      a backend returns only whitespace for scanned or oddly encoded pages. Defaults to 100.
+    - backends (list of str, optional): Names from BACKENDS to try, in order. Defaults to all.
+
+    Returns:
+    - dict: 'text', 'extractor' (backend name, None if every backend failed), 'pages' (extracted page
+      numbers), 'num_pages' and 'chars_per_page'. If no backend reaches `min_chars_per_page`, the
+      densest result is returned.
+
+    Behavior:
+    - Documents are opened in context managers and closed before the next backend is tried.
+    - Page texts are collected in a list and joined once.
+    """
+    best = {'text': '', 'extractor': None, 'pages': [], 'num_pages': 0, 'chars_per_page': 0.0}
+    for name in backends or BACKENDS:
+        try:
+            with BACKENDS[name](filepath) as (num_pages, read_page, toc):
+                page_texts = {}
+
+                def cached_read(num):
+                    if num not in page_texts:
+                        page_texts[num] = read_page(num)
+                    return page_texts[num]
+
+                pages = select_pages(num_pages, cached_read, toc, page_limit, section_pattern, max_extra_pages, max_scan_pages)
+                text = ''.join([cached_read(num) for num in pages])
+        except Exception as e:
+            print(f"Error with {name}: {e}")
+            continue
+
+        chars_per_page = len(text.strip()) / max(1, len(pages))
+        result = {'text': text, 'extractor': name, 'pages': pages, 'num_pages': num_pages, 'chars_per_page': chars_per_page}
+        if chars_per_page >= min_chars_per_page:
+            return result
+        if best['extractor'] is None or chars_per_page > best['chars_per_page']:
+            best = result
+    return best
+
+
+def _extract_with(name, filepath, page_limit):
+    result = extract_document(filepath, page_limit=page_limit, section_pattern=None, min_chars_per_page=0, backends=[name])
+    return result['text'] if result['extractor'] is not None else None
+
+def extract_text_pymupdf(filepath, page_limit=None):
+    return _extract_with('pymupdf', filepath, page_limit)
 
 def extract_text_pypdfium2(filepath, page_limit=None):
-    try:
-        doc = pdfium.PdfDocument(filepath)
-        text = ''
-        for num in range(len(doc)):
-            if page_limit is not None and num >= page_limit:
-                break
-            page = doc.get_page(num)
-            text_page = page.get_textpage()
-            text += text_page.get_text_bounded()
-        return text
-    except Exception as e:
-        print(f"Error with pypdfium2: {e}")
-    return None
+    return _extract_with('pypdfium2', filepath, page_limit)
 
 def extract_text_pypdf2(filepath, page_limit=None):
-    try:
-        pdf_file = open(filepath, 'rb')
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ''
-        for page_num in range(len(pdf_reader.pages)):
-            if page_limit is not None and page_num >= page_limit:
-                break
-            page = pdf_reader.pages[page_num]
-            text += page.extract_text()        
-        return text
-    except Exception as e:
-        print(f"Error with PyPDF2: {e}")
-    return None
-
-def extract_text(filepath, page_limit = 10):
-    for extractor in [extract_text_pymupdf, extract_text_pypdfium2, extract_text_pypdf2]:
-        text = extractor(filepath, page_limit = page_limit)
-        if text is not None:
-            return text
-    return ''
\ No newline at end of file
+    return _extract_with('pypdf2', filepath, page_limit)
+
+# Single-backend extractors by the names `extract_text` reports and the conversion manifest records
+EXTRACTORS = {
+    'pymupdf': extract_text_pymupdf,
+    'pypdfium2': extract_text_pypdfium2,
+    'pypdf2': extract_text_pypdf2,
+}
+
+def extract_text(filepath, page_limit = 10, return_extractor = False, **options):
+    """
+    Extract text with `extract_document`: PyMuPDF, pypdfium2 and PyPDF2 in turn, falling through on
+    failures and on suspiciously sparse text, with the results/experiments pages beyond `page_limit` included.
+
+    With `return_extractor=True`, returns (text, extractor name) instead of the text; the name is
+    None if every extractor failed. Further keyword options are passed to `extract_document`.
+    """
+    result = extract_document(filepath, page_limit = page_limit, **options)
+    return (result['text'], result['extractor']) if return_extractor else result['text']
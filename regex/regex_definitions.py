@@ -18,6 +18,11 @@ AUPRC_REGEXES = [
     r"\bPRC\b"
 ]
 
+# Literal terms of which every match of the regexes above contains at least one,
+# used to skip texts before LaTeX cleanup and regex matching
+AUROC_PREFILTER_TERMS = ["roc", "auc", "curve", "receiver", "specificity", "fpr", "false"]
+AUPRC_PREFILTER_TERMS = ["prc", "precision", "apr"]
+
 COMBINED_AUROC_REGEX = r"(?i)(" + '|'.join(AUROC_REGEXES) + r")"
 compiled_auroc_regex = re.compile(COMBINED_AUROC_REGEX)
 
@@ -1,111 +1,128 @@
-import json
 import os
 import re
-import pandas as pd
-from collections import defaultdict
-from multiprocessing import Pool, cpu_count
-from functools import partial
+from latex_cleaning import remove_latex_commands
+from metric_matching import MetricMatcher, keyword_alternation, prefilter_terms_from_keywords
+from filter_pipeline import process_file_rows, filter_files, filter_candidates, save_filter_output, report_stats
+from inverted_index import InvertedIndex
+from incremental_filtering import incremental_filter_files
 
 def create_keyword_pattern(keywords):
     """
     Create a regex pattern for keyword matching.
+
+    The keywords are folded into a prefix trie so shared prefixes are only tested once.
     """
-    pattern = r'(?:(?<=\W)|(?<=^))(' + '|'.join(map(re.escape, keywords)) + r')(?=\W|$)'
+    pattern = r'(?:(?<=\W)|(?<=^))(' + keyword_alternation(keywords) + r')(?=\W|$)'
     return re.compile(pattern, re.IGNORECASE)
 
-def remove_latex_commands(s):
-    """
-    Remove LaTeX commands from a string.
-    
-    Parameters:
-        s (str): The input string.
-        
-    Returns:
-        str: The string with LaTeX commands removed.
+def process_file(file_path, auroc_pattern, auprc_pattern, metadata_keys, remove_latex, start=0, end=None, prefilter_terms=None,
+                 search_terms=None):
     """
+    Process a single JSONL file, or the byte range [start, end) of it, to search for texts mentioning either AUROC or AUPRC, or both.
 
-    if s is None:
-        return ''
-    s = re.sub(r'\\[nrt]|[\n\r\t]', ' ', s)
-    s = re.sub(r'\\[nrt]|[\n\r\t]', ' ', s)
-    s = re.sub(r'\\[a-zA-Z]+', '', s)
-    s = re.sub(r'\\.', '', s)
-    s = re.sub(r'\\begin\{.*?\}.*?\\end\{.*?\}', '', s, flags=re.DOTALL)
-    s = re.sub(r'\$.*?\$', '', s)
-    s = re.sub(r'\\[.*?\\]', '', s)
-    s = re.sub(r'\\\(.*?\\\)', '', s)
-    s = re.sub(r'\\\[.*?\\\]', '', s)
-    s = re.sub(r'(?<=\W)\\|\\(?=\W)', '', s)
-    return s.strip()
-
-def process_file(file_path, auroc_pattern, auprc_pattern, metadata_keys, remove_latex):
+    Lines containing none of `prefilter_terms` are skipped before JSON decoding and LaTeX cleanup. Given only
+    `search_terms` (the AUROC and AUPRC keywords the patterns were built from), the terms are derived from them
+    as in `jsonl_folder_filtering`. Without either, every line is checked.
     """
-    Process a single JSONL file to search for texts mentioning either AUROC or AUPRC, or both.
+    if prefilter_terms is None and search_terms is not None:
+        prefilter_terms = prefilter_terms_from_keywords(search_terms)
+    matcher = MetricMatcher({'auroc': auroc_pattern, 'auprc': auprc_pattern}, prefilter_terms=prefilter_terms)
+    clean_text = remove_latex_commands if remove_latex else None
+    return process_file_rows(file_path, matcher, metadata_keys, clean_text, start, end)
+
+def jsonl_folder_filtering(input_folder_path, auroc_search_terms, auprc_search_terms, metadata_keys=[], output_folder_path=None, remove_latex=True, save_file=True, filename="filtered_data.json", total_texts_filename="total_texts.txt",
+                           stream_output=False, buffer_size=1000, shard_format="jsonl", return_dataframe=True,
+                           num_processes=None, chunk_size=None, prefilter=True, prefilter_terms=None, json_backend=None,
+                           output_format=None, compression="zstd", row_group_size=None, text_store_dir=None,
+                           index_path=None, incremental=False):
     """
-    output_data = []
-    total_texts = 0
+    Filter and process all JSONL files in a folder for AUROC and AUPRC related texts.
 
-    with open(file_path, 'r', encoding='utf-8') as file:
-        for line in file:
-            total_texts += 1
-            try:
-                entry = json.loads(line)
-                text = entry['text']
-                if remove_latex:
-                    text = remove_latex_commands(text)
-                meta_data = entry.get('meta', {})
+    With stream_output=True, workers write their matches to shard files in
+    `<output_folder_path>/<filename stem>_shards/` every `buffer_size` rows instead of returning
+    them, so peak memory no longer grows with the corpus. The combined DataFrame is then only
+    built (and saved) if return_dataframe is True; otherwise None is returned and the shards
+    are the output.
 
-                contains_auroc = auroc_pattern.search(text) is not None
-                contains_auprc = auprc_pattern.search(text) is not None
+    Files are split into byte ranges of about `chunk_size` bytes on line boundaries so that large
+    files are spread over all `num_processes` workers (defaults to the available CPUs).
 
-                if contains_auroc or contains_auprc:
-                    row_data = {key: meta_data.get(key, None) for key in metadata_keys}
-                    row_data['text'] = text
-                    row_data['contains_auroc'] = contains_auroc
-                    row_data['contains_auprc'] = contains_auprc
+    With prefilter=True, raw lines containing none of `prefilter_terms` (by default the longest
+    word of every search term) are skipped before JSON decoding and LaTeX cleanup. The number of
+    skipped texts is printed and stored with the counts in `df_output.attrs`.
 
-                    output_data.append(row_data)
+    Lines are parsed with the fastest installed JSON backend (simdjson, orjson, then json) unless
+    `json_backend` names one, and only 'text' and the requested metadata keys are extracted.
 
-            except json.JSONDecodeError as e:
-                print(f"Error loading line in {file_path}: {line}. Error: {e}")
+    The DataFrame is saved as Parquet or Arrow IPC when `filename` ends in .parquet or .arrow/.feather
+    (or `output_format` says so), compressed with `compression` in row groups of `row_group_size`
+    rows, and as CSV otherwise. Read it back with `table_io.read_table(path, columns=[...])` to load
+    only the needed columns, memory-mapped.
 
-    return output_data, total_texts
+    With `text_store_dir`, matching texts go to a content-addressed text store in that folder and the
+    DataFrame carries only their 64-bit 'text_id's (derived from the text hash), not the texts.
 
-def jsonl_folder_filtering(input_folder_path, auroc_search_terms, auprc_search_terms, metadata_keys=[], output_folder_path=None, remove_latex=True, save_file=True, filename="filtered_data.json", total_texts_filename="total_texts.txt"):
-    """
-    Filter and process all JSONL files in a folder for AUROC and AUPRC related texts.
+    With `index_path` (an index built by inverted_index.py over the same folder and remove_latex
+    setting), the keyword lists are resolved as phrases against the index and only the candidate
+    texts are read and matched, instead of the whole corpus. Not available with stream_output.
+
+    With `incremental=True`, only .jsonl files that are new or changed since the last incremental
+    run into the same output folder and filename are filtered; the stored rows and text counts of
+    the other files are merged in, and files that disappeared are dropped. The state lives in
+    `<output_folder_path>/<filename stem>_incremental/`, in one subfolder per combination of keyword
+    lists, metadata keys, prefilter and LaTeX setting, so switching between keyword lists reuses the
+    results of each.
     """
     auroc_pattern = create_keyword_pattern(auroc_search_terms)
     auprc_pattern = create_keyword_pattern(auprc_search_terms)
+    if prefilter and prefilter_terms is None:
+        prefilter_terms = prefilter_terms_from_keywords(list(auroc_search_terms) + list(auprc_search_terms))
+    matcher = MetricMatcher({'auroc': auroc_pattern, 'auprc': auprc_pattern}, prefilter_terms=prefilter_terms if prefilter else None)
+    clean_text = remove_latex_commands if remove_latex else None
 
     file_paths = [os.path.join(input_folder_path, file_name) for file_name in os.listdir(input_folder_path) if file_name.endswith(".jsonl")]
 
-    process_partial = partial(process_file, auroc_pattern=auroc_pattern, auprc_pattern=auprc_pattern, metadata_keys=metadata_keys, remove_latex=remove_latex)
-    with Pool(cpu_count()) as p:
-        results = p.map(process_partial, file_paths)
-
-    output_data = [item for sublist, _ in results for item in sublist]
-    total_texts = sum(total for _, total in results)
-
-    df_output = pd.DataFrame(output_data)
-
-    # Assigning a unique text_id for each unique text
-    df_output['text_id'] = pd.factorize(df_output['text'])[0]
-    
-    # Specifying the column order
-    keyword_columns = ['contains_auroc', 'contains_auprc']
-    column_order = ['text', 'text_id'] + metadata_keys + keyword_columns
-    df_output = df_output[column_order]
+    shard_dir = None
+    if stream_output:
+        if output_folder_path is None:
+            raise ValueError("output_folder_path is required when stream_output is True.")
+        shard_dir = os.path.join(output_folder_path, os.path.splitext(filename)[0] + "_shards")
+
+    if index_path is not None:
+        if stream_output:
+            raise ValueError("stream_output is not supported together with index_path.")
+        with InvertedIndex(index_path) as index:
+            index.check_compatible(remove_latex, file_paths)
+            candidates = index.locate(index.keyword_candidates(list(auroc_search_terms) + list(auprc_search_terms)))
+            total_texts = index.total_texts
+        # Candidates in the order of file_paths, so the rows come out in the order of a full scan
+        locations = {path: candidates[path] for path in map(os.path.abspath, file_paths) if path in candidates}
+        df_output, stats = filter_candidates(locations, total_texts, matcher, metadata_keys, clean_text=clean_text,
+                                             num_processes=num_processes, json_backend=json_backend,
+                                             text_store_dir=text_store_dir)
+    elif incremental:
+        if stream_output or output_folder_path is None:
+            raise ValueError("incremental requires output_folder_path and is not supported together with stream_output.")
+        settings = {'auroc_search_terms': list(auroc_search_terms), 'auprc_search_terms': list(auprc_search_terms),
+                    'metadata_keys': metadata_keys, 'remove_latex': remove_latex, 'prefilter_terms': prefilter_terms if prefilter else None,
+                    'text_store': text_store_dir is not None}
+        state_dir = os.path.join(output_folder_path, os.path.splitext(filename)[0] + "_incremental")
+        df_output, stats = incremental_filter_files(file_paths, matcher, metadata_keys, state_dir, settings, clean_text=clean_text,
+                                                    num_processes=num_processes, chunk_size=chunk_size,
+                                                    json_backend=json_backend, text_store_dir=text_store_dir)
+    else:
+        df_output, stats, _ = filter_files(file_paths, matcher, metadata_keys, clean_text=clean_text,
+                                           shard_dir=shard_dir, buffer_size=buffer_size,
+                                           shard_format=shard_format, return_dataframe=return_dataframe,
+                                           num_processes=num_processes, chunk_size=chunk_size, json_backend=json_backend,
+                                           text_store_dir=text_store_dir)
+    report_stats(df_output, stats)
 
     # Save data
     if save_file and output_folder_path is not None:
-        if not os.path.exists(output_folder_path):
-            os.makedirs(output_folder_path)
-        with open(os.path.join(output_folder_path, total_texts_filename), 'w') as f:
-            f.write(str(total_texts))
-
-        df_output.to_csv(os.path.join(output_folder_path, filename), index=False)
+        save_filter_output(df_output, stats['total_texts'], output_folder_path, filename, total_texts_filename,
+                           output_format=output_format, compression=compression, row_group_size=row_group_size)
     elif save_file:
         print("Warning: Output folder path is not provided. The DataFrame is not saved to a file.")
 
-    return df_output
\ No newline at end of file
+    return df_output
@@ -1,40 +1,11 @@
-import json
 import os
-import re
-import pandas as pd
-from collections import defaultdict
-from multiprocessing import Pool, cpu_count
-from functools import partial
+from latex_cleaning import remove_latex_commands
+from metric_matching import MetricMatcher
+from filter_pipeline import process_file_rows, filter_files, filter_candidates, save_filter_output, report_stats
+from inverted_index import InvertedIndex
+from incremental_filtering import incremental_filter_files
 
-def remove_latex_commands(s):
-    """
-    Removes LaTeX commands from a given string.
-
-    Parameters:
-    - s (str): A string potentially containing LaTeX commands.
-
-    Returns:
-    - str: The input string with LaTeX commands removed.
-
-    Behavior:
-    - This function cleans the input string by removing common LaTeX formatting commands,
-      such as command keywords preceded by backslashes, and content within LaTeX math environments.
-    - It aims to leave plain text content unaffected, making it more readable or suitable for further processing.
-    """
-    if s is None:
-        return ''
-    s = re.sub(r'\\[nrt]|[\n\r\t]', ' ', s)
-    s = re.sub(r'\\[a-zA-Z]+', '', s)
-    s = re.sub(r'\\.', '', s)
-    s = re.sub(r'\\begin\{.*?\}.*?\\end\{.*?\}', '', s, flags=re.DOTALL)
-    s = re.sub(r'\$.*?\$', '', s)
-    s = re.sub(r'\\[.*?\\]', '', s)
-    s = re.sub(r'\\\(.*?\\\)', '', s)
-    s = re.sub(r'\\\[.*?\\\]', '', s)
-    s = re.sub(r'(?<=\W)\\|\\(?=\W)', '', s)
-    return s.strip()
-
-def process_file(file_path, auroc_regex, auprc_regex, metadata_keys, remove_latex):
+def process_file(file_path, auroc_regex, auprc_regex, metadata_keys, remove_latex, start=0, end=None, prefilter_terms=None):
     """
     Processes a single file to extract relevant information based on regex patterns and optionally removes LaTeX commands.
 
@@ -44,6 +15,11 @@ def process_file(file_path, auroc_regex, auprc_regex, metadata_keys, remove_late
     - auprc_regex (compiled regex): A compiled regex pattern to search for AUPRC mentions.
     - metadata_keys (list of str): A list of keys to extract metadata from the file entries.
     - remove_latex (bool): Whether to remove LaTeX commands from the text.
+    - start (int, optional): Byte offset of the first line to process. Defaults to 0.
+    - end (int, optional): Byte offset at which to stop; None reads to the end of the file.
+    - prefilter_terms (list of str, optional): Literal terms of which every regex match contains at least one,
+      e.g. AUROC_PREFILTER_TERMS + AUPRC_PREFILTER_TERMS from regex_definitions. Lines containing none of them
+      are skipped before JSON decoding and LaTeX cleanup. Defaults to None (no prefilter).
 
     Returns:
     - tuple: A tuple containing two elements:
@@ -52,39 +28,18 @@ def process_file(file_path, auroc_regex, auprc_regex, metadata_keys, remove_late
 
     Behavior:
     - Reads and processes each line of the file assuming it is in JSON Lines format.
-    - Searches for specified patterns and extracts metadata, handling LaTeX commands based on the remove_latex parameter.
+    - Searches for both patterns in a single scan per text and extracts metadata, handling LaTeX commands based on the remove_latex parameter.
     - Aggregates results into a list and counts the total number of processed texts.
     """
-    output_data = []
-    total_texts = 0
-
-    with open(file_path, 'r', encoding='utf-8') as file:
-        for line in file:
-            total_texts += 1
-            try:
-                entry = json.loads(line)
-                text = entry['text']
-                if remove_latex:
-                    text = remove_latex_commands(text)
-                meta_data = entry.get('meta', {})
-
-                contains_auroc = auroc_regex.search(text) is not None
-                contains_auprc = auprc_regex.search(text) is not None
-
-                if contains_auroc or contains_auprc:
-                    row_data = {key: meta_data.get(key, None) for key in metadata_keys}
-                    row_data['text'] = text
-                    row_data['contains_auroc'] = contains_auroc
-                    row_data['contains_auprc'] = contains_auprc
-
-                    output_data.append(row_data)
-
-            except json.JSONDecodeError as e:
-                print(f"Error loading line in {file_path}: {line}. Error: {e}")
-
-    return output_data, total_texts
-
-def jsonl_folder_filtering(input_folder_path, auroc_regex, auprc_regex, metadata_keys=[], output_folder_path=None, remove_latex=True, save_file=True, filename="filtered_data.json", total_texts_filename="total_texts.txt"):
+    matcher = MetricMatcher({'auroc': auroc_regex, 'auprc': auprc_regex}, prefilter_terms=prefilter_terms)
+    clean_text = remove_latex_commands if remove_latex else None
+    return process_file_rows(file_path, matcher, metadata_keys, clean_text, start, end)
+
+def jsonl_folder_filtering(input_folder_path, auroc_regex, auprc_regex, metadata_keys=[], output_folder_path=None, remove_latex=True, save_file=True, filename="filtered_data.json", total_texts_filename="total_texts.txt",
+                           stream_output=False, buffer_size=1000, shard_format="jsonl", return_dataframe=True,
+                           num_processes=None, chunk_size=None, prefilter_terms=None, json_backend=None,
+                           output_format=None, compression="zstd", row_group_size=None, text_store_dir=None,
+                           index_path=None, incremental=False):
     """
     Filters files in a folder for specific patterns using multiprocessing, and optionally removes LaTeX commands from the text.
 
@@ -98,39 +53,84 @@ def jsonl_folder_filtering(input_folder_path, auroc_regex, auprc_regex, metadata
     - save_file (bool, optional): Whether to save the filtered data and total texts count to files. Defaults to True.
     - filename (str, optional): Filename for saving the filtered data. Defaults to "filtered_data.json".
     - total_texts_filename (str, optional): Filename for saving the total texts count. Defaults to "total_texts.txt".
+    - stream_output (bool, optional): Whether workers stream matches to shard files in
+      `<output_folder_path>/<filename stem>_shards/` instead of returning them. Requires output_folder_path. Defaults to False.
+    - buffer_size (int, optional): Rows each worker keeps in memory before writing a shard in streaming mode. Defaults to 1000.
+    - shard_format (str, optional): Shard file format in streaming mode, "jsonl" or "parquet". Defaults to "jsonl".
+    - return_dataframe (bool, optional): In streaming mode, whether to read the shards back into a DataFrame. Defaults to True.
+    - num_processes (int, optional): Number of worker processes. Defaults to the number of CPUs available to this process.
+    - chunk_size (int, optional): Target size in bytes of each work unit. Defaults to an even split of the input across workers.
+    - prefilter_terms (list of str, optional): Literal terms of which every regex match contains at least one,
+      e.g. AUROC_PREFILTER_TERMS + AUPRC_PREFILTER_TERMS from regex_definitions. Lines containing none of them
+      are skipped before JSON decoding and LaTeX cleanup. Defaults to None (no prefilter).
+    - json_backend (str, optional): JSON parser used to read the lines, "simdjson", "orjson" or "json". Defaults to the fastest installed one.
+    - output_format (str, optional): Format of the saved DataFrame, "parquet", "arrow" or "csv". Defaults to the format of
+      the filename's extension (.parquet, .arrow/.feather), and CSV for any other extension.
+    - compression (str, optional): Parquet/Arrow codec, e.g. "zstd", "lz4" or None. Defaults to "zstd".
+    - row_group_size (int, optional): Rows per Parquet row group or Arrow record batch. Defaults to about 64 MB of texts per group.
+    - text_store_dir (str, optional): Folder of a text store that receives the matching texts. The DataFrame then holds a
+      64-bit content-derived 'text_id' per row instead of the 'text'; see text_store.TextStore. Defaults to None.
+    - index_path (str, optional): Inverted index built with inverted_index.py over the same folder and remove_latex setting.
+      Only texts containing a token with one of `prefilter_terms` are read and checked against the regexes, which gives
+      the same result as a full scan; without prefilter_terms every text is checked. Not available with stream_output.
+    - incremental (bool, optional): Only process .jsonl files that are new or changed since the last incremental run into the
+      same output folder and filename, and merge their rows and text counts with the stored ones of the other files. The
+      state lives in `<output_folder_path>/<filename stem>_incremental/`, in one subfolder per combination of regexes, metadata
+      keys, prefilter terms and LaTeX setting, so switching between regex revisions reuses the results of each. Requires output_folder_path; not available with stream_output. Defaults to False.
 
     Returns:
-    - pandas.DataFrame: A DataFrame containing the filtered data.
+    - pandas.DataFrame: A DataFrame containing the filtered data, or None in streaming mode with return_dataframe=False.
 
     Behavior:
-    - Processes all .jsonl files found in the specified folder in parallel.
+    - Splits all .jsonl files found in the specified folder into line-aligned byte ranges and processes them in parallel.
     - Applies regex filtering and LaTeX command removal based on parameters.
     - Compiles the results into a DataFrame, optionally saving it and the total texts count to files.
+    - The number of texts rejected by the prefilter is printed and stored with the counts in `df_output.attrs`.
+    - In streaming mode, peak memory is bounded by `buffer_size` rows per worker regardless of corpus size.
     """
     file_paths = [os.path.join(input_folder_path, file_name) for file_name in os.listdir(input_folder_path) if file_name.endswith(".jsonl")]
 
-    # Set the number of processes to 6 explicitly
-    num_processes = 6
-
-    process_partial = partial(process_file, auroc_regex=auroc_regex, auprc_regex=auprc_regex, metadata_keys=metadata_keys, remove_latex=remove_latex)
-    with Pool(num_processes) as p:
-        results = p.map(process_partial, file_paths)
-
-    output_data = [item for sublist, _ in results for item in sublist]
-    total_texts = sum(total for _, total in results)
-
-    df_output = pd.DataFrame(output_data)
-    df_output['text_id'] = pd.factorize(df_output['text'])[0]
-    keyword_columns = ['contains_auroc', 'contains_auprc']
-    column_order = ['text', 'text_id'] + metadata_keys + keyword_columns
-    df_output = df_output[column_order]
+    matcher = MetricMatcher({'auroc': auroc_regex, 'auprc': auprc_regex}, prefilter_terms=prefilter_terms)
+    clean_text = remove_latex_commands if remove_latex else None
+
+    shard_dir = None
+    if stream_output:
+        if output_folder_path is None:
+            raise ValueError("output_folder_path is required when stream_output is True.")
+        shard_dir = os.path.join(output_folder_path, os.path.splitext(filename)[0] + "_shards")
+
+    if index_path is not None:
+        if stream_output:
+            raise ValueError("stream_output is not supported together with index_path.")
+        with InvertedIndex(index_path) as index:
+            index.check_compatible(remove_latex, file_paths)
+            candidates = index.locate(index.substring_candidates(prefilter_terms) if prefilter_terms else None)
+            total_texts = index.total_texts
+        # Candidates in the order of file_paths, so the rows come out in the order of a full scan
+        locations = {path: candidates[path] for path in map(os.path.abspath, file_paths) if path in candidates}
+        df_output, stats = filter_candidates(locations, total_texts, matcher, metadata_keys, clean_text=clean_text,
+                                             num_processes=num_processes, json_backend=json_backend,
+                                             text_store_dir=text_store_dir)
+    elif incremental:
+        if stream_output or output_folder_path is None:
+            raise ValueError("incremental requires output_folder_path and is not supported together with stream_output.")
+        settings = {'auroc_regex': auroc_regex, 'auprc_regex': auprc_regex, 'metadata_keys': metadata_keys,
+                    'remove_latex': remove_latex, 'prefilter_terms': prefilter_terms, 'text_store': text_store_dir is not None}
+        state_dir = os.path.join(output_folder_path, os.path.splitext(filename)[0] + "_incremental")
+        df_output, stats = incremental_filter_files(file_paths, matcher, metadata_keys, state_dir, settings, clean_text=clean_text,
+                                                    num_processes=num_processes, chunk_size=chunk_size,
+                                                    json_backend=json_backend, text_store_dir=text_store_dir)
+    else:
+        df_output, stats, _ = filter_files(file_paths, matcher, metadata_keys, clean_text=clean_text,
+                                           shard_dir=shard_dir, buffer_size=buffer_size,
+                                           shard_format=shard_format, return_dataframe=return_dataframe,
+                                           num_processes=num_processes, chunk_size=chunk_size, json_backend=json_backend,
+                                           text_store_dir=text_store_dir)
+    report_stats(df_output, stats)
 
     if save_file and output_folder_path is not None:
-        if not os.path.exists(output_folder_path):
-            os.makedirs(output_folder_path)
-        with open(os.path.join(output_folder_path, total_texts_filename), 'w') as f:
-            f.write(str(total_texts))
-        df_output.to_csv(os.path.join(output_folder_path, filename), index=False)
+        save_filter_output(df_output, stats['total_texts'], output_folder_path, filename, total_texts_filename,
+                           output_format=output_format, compression=compression, row_group_size=row_group_size)
     elif save_file:
         print("Warning: Output folder path is not provided. The DataFrame is not saved to a file.")
 
@@ -0,0 +1,211 @@
+import json
+import os
+
+from openai import OpenAI
+
+from prompt_messages import build_user_message
+from jsonl_io import JsonlReader
+from table_io import load_table, write_table
+
+# Limits of one OpenAI Batch API input file, with some headroom on the size
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 190 * 1024 * 1024
+CUSTOM_ID_PREFIX = 'window-'
+
+
+def custom_id_for(window_id):
+    """
+    Batch API custom id of a context window, derived from its DataFrame index label.
+    """
+    return f"{CUSTOM_ID_PREFIX}{window_id}"
+
+
+def custom_ids_for(index):
+    """
+    Map the custom id of every index label back to the label.
+
+    Raises ValueError if two labels give the same custom id, e.g. 1 and "1" or a duplicated label,
+    since their results could not be told apart.
+    """
+    window_ids = {}
+    for idx in index:
+        custom_id = custom_id_for(idx)
+        if custom_id in window_ids:
+            raise ValueError(f"Index labels {window_ids[custom_id]!r} and {idx!r} both map to the custom id {custom_id!r}; "
+                             "make the index unique, e.g. with reset_index().")
+        window_ids[custom_id] = idx
+    return window_ids
+
+
+def write_batch_requests(new_df, output_folder, model, system_prompt, introduction_statement_prompt=None,
+                         end_statement_prompt=None, filename_prefix='batch_requests', skip_ids=None,
+                         max_requests_per_file=MAX_REQUESTS_PER_FILE, max_bytes_per_file=MAX_BYTES_PER_FILE,
+                         endpoint='/v1/chat/completions', body_options=None):
+    """
+    Write the context windows of a DataFrame as OpenAI Batch API request files.
+
+    Parameters:
+    - new_df (pandas.DataFrame or str): DataFrame with a 'context_window' column, or the path of a window file;
+      its index provides the custom ids.
+    - output_folder (str): Folder the request files are written to; created if missing.
+    - model (str): Model identifier.
+    - system_prompt (str): System-level instructions for the model.
+    - introduction_statement_prompt, end_statement_prompt (str, optional): v4 prompts placed around each window.
+    - filename_prefix (str, optional): Files are named `<prefix>_<n>.jsonl`. Defaults to 'batch_requests'.
+    - skip_ids (collection, optional): Index labels to leave out, e.g. windows answered in an earlier run.
+    - max_requests_per_file (int, optional): Requests per file. Defaults to the Batch API limit of 50,000.
+    - max_bytes_per_file (int, optional): Bytes per file. Defaults to 190 MB, below the 200 MB limit.
+    - endpoint (str, optional): Endpoint of every request. Defaults to '/v1/chat/completions'.
+    - body_options (dict, optional): Extra fields of every request body, e.g. {"temperature": 0}.
+
+    Returns:
+    - list of str: Paths of the written request files.
+
+    Behavior:
+    - The request bodies are the same as in the live `process_all_context_windows` calls, so results
+      are interchangeable with live responses.
+    - Every line has the custom id `window-<index label>`, which `ingest_batch_results` maps back. Raises
+      ValueError if two index labels give the same custom id, see `custom_ids_for`.
+    """
+    new_df = load_table(new_df)
+    custom_ids_for(new_df.index)
+    os.makedirs(output_folder, exist_ok=True)
+    skip_ids = set(skip_ids or ())
+    paths = []
+    file = None
+    requests_in_file = bytes_in_file = total_requests = 0
+
+    for idx, context_window in new_df['context_window'].items():
+        if idx in skip_ids:
+            continue
+        body = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": build_user_message(context_window, introduction_statement_prompt, end_statement_prompt)}
+            ]
+        }
+        body.update(body_options or {})
+        line = (json.dumps({"custom_id": custom_id_for(idx), "method": "POST", "url": endpoint, "body": body},
+                           ensure_ascii=False) + '\n').encode('utf-8')
+        if len(line) > max_bytes_per_file:
+            raise ValueError(f"The request for context window {idx} alone exceeds max_bytes_per_file.")
+
+        if file is None or requests_in_file >= max_requests_per_file or bytes_in_file + len(line) > max_bytes_per_file:
+            if file is not None:
+                file.close()
+            path = os.path.join(output_folder, f"{filename_prefix}_{len(paths)}.jsonl")
+            file = open(path, 'wb')
+            paths.append(path)
+            requests_in_file = bytes_in_file = 0
+        file.write(line)
+        requests_in_file += 1
+        bytes_in_file += len(line)
+        total_requests += 1
+
+    if file is not None:
+        file.close()
+    print(f"Wrote {total_requests} requests to {len(paths)} batch files in {output_folder}")
+    return paths
+
+
+def submit_batch_files(paths, openai_api_key, endpoint='/v1/chat/completions', completion_window='24h'):
+    """
+    Upload request files and create one batch per file.
+
+    Returns:
+    - list of str: The ids of the created batches.
+    """
+    client = OpenAI(api_key=openai_api_key)
+    batch_ids = []
+    for path in paths:
+        with open(path, 'rb') as file:
+            input_file = client.files.create(file=file, purpose='batch')
+        batch = client.batches.create(input_file_id=input_file.id, endpoint=endpoint, completion_window=completion_window)
+        print(f"Submitted {path} as batch {batch.id}")
+        batch_ids.append(batch.id)
+    return batch_ids
+
+
+def download_batch_results(batch_ids, output_folder, openai_api_key):
+    """
+    Download the output and error files of finished batches.
+
+    Returns:
+    - tuple: (list of downloaded file paths, list of ids of batches that are not finished yet).
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    client = OpenAI(api_key=openai_api_key)
+    paths = []
+    unfinished = []
+    for batch_id in batch_ids:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status != 'completed':
+            print(f"Batch {batch_id} is {batch.status}")
+            unfinished.append(batch_id)
+            continue
+        for kind, file_id in (('output', batch.output_file_id), ('errors', batch.error_file_id)):
+            if file_id:
+                path = os.path.join(output_folder, f"{batch_id}_{kind}.jsonl")
+                client.files.content(file_id).write_to_file(path)
+                paths.append(path)
+    return paths, unfinished
+
+
+def ingest_batch_results(new_df, result_paths, column='gpt_response', journal=None, output_path=None, output_format=None,
+                         compression='zstd'):
+    """
+    Map Batch API output and error files back onto the DataFrame by custom id.
+
+    Parameters:
+    - new_df (pandas.DataFrame or str): The DataFrame or window file the requests were written from.
+    - result_paths (list of str): Output and/or error JSONL files of the batches.
+    - column (str, optional): Column receiving the responses. Defaults to 'gpt_response'.
+    - journal (checkpointing.CheckpointJournal, optional): Journal to record the responses in as well.
+    - output_path, output_format, compression: File the DataFrame with the responses is written to, see
+      `table_io.write_table`. Defaults to None (not written).
+
+    Returns:
+    - pandas.DataFrame: `new_df` with `column` set for every window that has a result. Failed requests get a
+      response starting with "Error:", like failed live requests. Counts are stored in `attrs['batch_stats']`.
+    """
+    new_df = load_table(new_df)
+    window_ids = custom_ids_for(new_df.index)
+    reader = JsonlReader(['custom_id', 'response.status_code', 'response.body.choices', 'response.body.error', 'error'])
+    responses = {}
+    failed = unknown = 0
+    for path in result_paths:
+        for record in reader.iter_file(path):
+            idx = window_ids.get(record.get('custom_id'))
+            if idx is None:
+                unknown += 1
+                continue
+            response = record.get('response') or {}
+            body = response.get('body') or {}
+            if response.get('status_code') == 200 and body.get('choices'):
+                responses[idx] = body['choices'][0]['message']['content']
+            else:
+                error = record.get('error') or body.get('error') or {}
+                if isinstance(error, dict):
+                    error = error.get('message', 'status ' + str(response.get('status_code')))
+                responses[idx] = f"Error: {error}"
+                failed += 1
+
+    ids = list(responses)
+    if ids:
+        new_df.loc[ids, column] = [responses[idx] for idx in ids]
+    if journal is not None:
+        for idx in ids:
+            journal.append(idx, responses[idx])
+
+    new_df.attrs['batch_stats'] = {
+        'results': len(responses),
+        'failed': failed,
+        'missing': len(new_df) - len(responses),
+        'unknown_custom_ids': unknown,
+    }
+    print(f"Ingested {len(responses)} batch results ({failed} failed); "
+          f"{len(new_df) - len(responses)} windows without a result, {unknown} unknown custom ids")
+    if output_path is not None:
+        write_table(new_df, output_path, table_format=output_format, compression=compression)
+    return new_df
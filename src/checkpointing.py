@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def _json_id(window_id):
+    # numpy scalars and MultiIndex tuples as plain JSON values
+    if isinstance(window_id, tuple):
+        return [_json_id(part) for part in window_id]
+    if hasattr(window_id, 'item'):
+        return window_id.item()
+    return window_id
+
+
+def _python_id(value):
+    if isinstance(value, list):
+        return tuple(_python_id(part) for part in value)
+    return value
+
+
+def shard_of(window_id, num_shards):
+    """
+    Deterministic shard number of a window id, identical on every machine and Python process.
+    """
+    digest = hashlib.sha1(json.dumps(_json_id(window_id)).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % num_shards
+
+
+class CheckpointJournal:
+    """
+    Append-only JSONL journal of completed context windows, one {"id": ..., "response": ...} per line.
+
+    Every response is written and flushed as soon as it arrives, so an interrupted run loses at
+    most the requests that were in flight. A line cut off by a crash is ignored when loading.
+
+    Parameters:
+    - path (str): Path of the journal file; created if missing, appended to otherwise.
+    - fsync (bool, optional): Also fsync after every record, surviving power loss at the cost of speed. Defaults to False.
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self, include_errors=False):
+        """
+        Read the responses recorded so far.
+
+        Parameters:
+        - include_errors (bool, optional): Also return responses starting with "Error:". Defaults to False,
+          so windows that failed are retried on resume.
+
+        Returns:
+        - dict: Window id to response; later records of the same id win.
+        """
+        responses = {}
+        if not os.path.exists(self.path):
+            return responses
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                window_id = _python_id(record['id'])
+                response = record['response']
+                if not include_errors and isinstance(response, str) and response.startswith("Error:"):
+                    responses.pop(window_id, None)
+                    continue
+                responses[window_id] = response
+        return responses
+
+    def append(self, window_id, response):
+        """
+        Record the response of one window.
+        """
+        line = json.dumps({'id': _json_id(window_id), 'response': response}, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+                if self._file.tell() > 0 and not self._ends_with_newline():
+                    # Terminate a record cut off by a crash so it does not swallow the next one
+                    self._file.write('\n')
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b'\n'
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def pending_windows(new_df, completed=None, shard_index=0, num_shards=1):
+    """
+    Select the context windows that still have to be sent.
+
+    Parameters:
+    - new_df (pandas.DataFrame): DataFrame with a 'context_window' column; its index provides the window ids.
+    - completed (dict, optional): Responses already recorded, e.g. from `CheckpointJournal.load`.
+    - shard_index (int, optional): Shard handled by this run. Defaults to 0.
+    - num_shards (int, optional): Total number of shards, e.g. one per machine. Defaults to 1.
+
+    Returns:
+    - list of tuple: (window id, context window) pairs of this shard without a completed response.
+    """
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}.")
+    completed = completed or {}
+    return [
+        (idx, context_window) for idx, context_window in new_df['context_window'].items()
+        if idx not in completed and (num_shards == 1 or shard_of(idx, num_shards) == shard_index)
+    ]
+
+
+def load_journals(paths, include_errors=False):
+    """
+    Merge the journals of several shards or runs into one dict of window id to response.
+    """
+    responses = {}
+    for path in paths:
+        responses.update(CheckpointJournal(path).load(include_errors=include_errors))
+    return responses
+
+
+def apply_responses(new_df, responses, column='gpt_response'):
+    """
+    Write responses keyed by window id into `new_df[column]`, ignoring ids not in the index.
+    """
+    ids = [idx for idx in responses if idx in new_df.index]
+    if ids:
+        new_df.loc[ids, column] = [responses[idx] for idx in ids]
+    return new_df
@@ -0,0 +1,259 @@
+import asyncio
+import time
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from rate_limiting import parse_retry_after
+from response_cache import response_cache_key
+from checkpointing import CheckpointJournal, pending_windows, apply_responses
+from prompt_messages import build_user_message
+from table_io import load_table, write_table
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD (additive increase, multiplicative decrease) limit on the number of requests in flight.
+
+    Every successful request raises the limit by `increase / limit`, i.e. by about `increase` per
+    round trip of the whole window. A rate-limited request multiplies the limit by
+    `decrease_factor` (at most once per `cooldown` seconds, so one burst of 429s counts as one
+    congestion event) and pauses all new requests until the server's Retry-After has passed.
+
+    Parameters:
+    - initial (int, optional): Starting concurrency. Defaults to 16.
+    - minimum (int, optional): Lower bound on the limit. Defaults to 1.
+    - maximum (int, optional): Upper bound on the limit. Defaults to 256.
+    - increase (float, optional): Additive increase per window of successes. Defaults to 1.
+    - decrease_factor (float, optional): Multiplicative decrease on a 429. Defaults to 0.5.
+    - cooldown (float, optional): Minimum seconds between two decreases. Defaults to 1.
+    """
+
+    def __init__(self, initial=16, minimum=1, maximum=256, increase=1.0, decrease_factor=0.5, cooldown=1.0):
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.rate_limited = 0
+        self._resume_at = 0.0
+        self._last_decrease = float('-inf')
+        self._condition = None
+
+    def _get_condition(self):
+        # Created lazily so the limiter can be built outside of a running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        condition = self._get_condition()
+        async with condition:
+            while True:
+                wait = self._resume_at - time.monotonic()
+                if wait > 0:
+                    try:
+                        await asyncio.wait_for(condition.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.in_flight < int(self.limit):
+                    break
+                await condition.wait()
+            self.in_flight += 1
+
+    async def release(self, rate_limited=False, retry_after=0.0):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if rate_limited:
+                self.rate_limited += 1
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+                self._resume_at = max(self._resume_at, now + retry_after)
+            else:
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            condition.notify_all()
+
+
+async def process_with_gpt_async(client, limiter, context_window, model, system_prompt,
+                                 introduction_statement_prompt=None, end_statement_prompt=None, max_retries=5,
+                                 rate_limiter=None, cache=None):
+    """
+    Generate a response for one context window through a shared async client and concurrency limiter.
+
+    Parameters:
+    - client (openai.AsyncOpenAI): Shared client; its connection pool is reused across requests.
+    - limiter (AdaptiveConcurrencyLimiter): Limiter shared by all requests of the run.
+    - context_window (str): The context window to classify.
+    - model (str): Model identifier.
+    - system_prompt (str): System-level instructions for the model.
+    - introduction_statement_prompt, end_statement_prompt (str, optional): v4 prompts placed around the window.
+    - max_retries (int, optional): Maximum number of attempts. Defaults to 5.
+    - rate_limiter (rate_limiting.RateLimiter, optional): Request/token budget awaited before each attempt.
+    - cache (response_cache.ResponseCache, optional): Disk cache consulted before calling the API.
+
+    Returns:
+    - str: The generated response text, or an error message starting with "Error:".
+    """
+    user_message = build_user_message(context_window, introduction_statement_prompt, end_statement_prompt)
+    if cache is not None:
+        cache_key = response_cache_key(model, system_prompt, user_message)
+        cached_response = cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response
+    retry_delay = 0.5
+    max_retry_delay = 16
+    if rate_limiter is not None:
+        estimated_tokens = rate_limiter.request_tokens(system_prompt, user_message)
+    for attempt in range(max_retries):
+        if rate_limiter is not None:
+            await rate_limiter.wait_async(estimated_tokens)
+        await limiter.acquire()
+        try:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_message}
+                ]
+            )
+        except openai.RateLimitError as e:
+            retry_after = parse_retry_after(e.response, default=retry_delay)
+            if rate_limiter is not None:
+                rate_limiter.penalize(retry_after)
+            await limiter.release(rate_limited=True, retry_after=retry_after)
+            retry_delay = min(retry_delay * 2, max_retry_delay)
+        except Exception as e:
+            await limiter.release()
+            print(f"Attempt {attempt + 1} failed with error: {e}")
+            if attempt == max_retries - 1:
+                return f"Error: {str(e)}"
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, max_retry_delay)
+        else:
+            await limiter.release()
+            if rate_limiter is not None:
+                rate_limiter.record_usage(estimated_tokens, response)
+            if cache is not None:
+                cache.put(cache_key, response.choices[0].message.content, model)
+            return response.choices[0].message.content
+    return "Error: Max retries exceeded."
+
+
+async def process_all_context_windows_async(new_df, model, system_prompt, openai_api_key,
+                                            introduction_statement_prompt=None, end_statement_prompt=None,
+                                            base_url=None, initial_concurrency=16, max_concurrency=256,
+                                            max_retries=5, request_timeout=60, progress_every=1000, client=None,
+                                            rate_limiter=None, cache=None, checkpoint_path=None,
+                                            shard_index=0, num_shards=1, output_path=None, output_format=None, compression="zstd"):
+    """
+    Asynchronously process a DataFrame of context windows with adaptive concurrency.
+
+    Parameters:
+    - new_df (pandas.DataFrame or str): DataFrame with a 'context_window' column, or the path of a window file.
+    - model (str): Model identifier to use for generating responses.
+    - system_prompt (str): System-level instructions for the model.
+    - openai_api_key (str): API key for OpenAI services authentication.
+    - introduction_statement_prompt, end_statement_prompt (str, optional): v4 prompts placed around each window.
+    - base_url (str, optional): Base URL of an OpenAI-compatible server, e.g. a local mock for testing.
+    - initial_concurrency (int, optional): Requests in flight at the start. Defaults to 16.
+    - max_concurrency (int, optional): Upper bound on requests in flight and pooled connections. Defaults to 256.
+    - max_retries (int, optional): Maximum attempts per context window. Defaults to 5.
+    - request_timeout (float, optional): Per-request timeout in seconds. Defaults to 60.
+    - progress_every (int, optional): Print progress after this many completed windows. Defaults to 1000.
+    - client (openai.AsyncOpenAI, optional): Client to use instead of creating one.
+    - rate_limiter (rate_limiting.RateLimiter, optional): Requests-per-minute and tokens-per-minute budget
+      that paces requests before they are sent, so the limiter rarely has to react to 429s.
+    - cache (response_cache.ResponseCache, optional): Disk cache of responses; windows answered in earlier
+      runs cost no API calls. Hit/miss statistics are printed at the end.
+    - checkpoint_path (str, optional): JSONL journal that every response is appended to as it completes;
+      rerunning with the same path skips windows that already have a (non-error) response.
+    - shard_index, num_shards (int, optional): Process only this shard of the windows, e.g. one per machine.
+    - output_path (str, optional): File the resulting DataFrame is written to with `table_io.write_table`,
+      as Parquet or Arrow IPC for .parquet/.arrow/.feather paths and CSV otherwise. Defaults to None (not written).
+    - output_format (str, optional): "parquet", "arrow" or "csv", overriding the extension of `output_path`.
+    - compression (str, optional): Parquet/Arrow codec of the output. Defaults to "zstd".
+
+    Returns:
+    - pandas.DataFrame: `new_df` with a 'gpt_response' column.
+
+    Behavior:
+    - One client with one pooled HTTP connection pool serves all requests.
+    - Concurrency follows AdaptiveConcurrencyLimiter: it grows while requests succeed and halves on
+      429 responses, pausing for the server's Retry-After. The client's own retries are disabled.
+    - In a notebook, `await` this coroutine; in a script, use `run_all_context_windows`.
+    """
+    new_df = load_table(new_df)
+    owns_client = client is None
+    if owns_client:
+        http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=max_concurrency,
+                                                            max_keepalive_connections=max_concurrency))
+        client = AsyncOpenAI(api_key=openai_api_key, base_url=base_url, max_retries=0,
+                             timeout=request_timeout, http_client=http_client)
+    limiter = AdaptiveConcurrencyLimiter(initial=initial_concurrency, maximum=max_concurrency)
+
+    responses = {}
+    journal = None
+    if checkpoint_path is not None:
+        journal = CheckpointJournal(checkpoint_path)
+        responses = journal.load()
+        if responses:
+            print(f"Resuming from {checkpoint_path}: {len(responses)} context windows already completed")
+    pending = pending_windows(new_df, responses, shard_index, num_shards)
+    queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    total = len(pending)
+    processed_texts = 0
+
+    async def worker():
+        nonlocal processed_texts
+        while True:
+            try:
+                idx, context_window = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                response = await process_with_gpt_async(client, limiter, context_window, model, system_prompt,
+                                                        introduction_statement_prompt, end_statement_prompt, max_retries,
+                                                        rate_limiter, cache)
+            except Exception as exc:
+                print(f'Context window at index {idx} generated an exception: {exc}')
+                response = "Error: Exception in processing"
+            responses[idx] = response
+            if journal is not None:
+                journal.append(idx, response)
+            processed_texts += 1
+            if processed_texts % progress_every == 0:
+                print(f"Processed {processed_texts}/{total} texts; concurrency limit {int(limiter.limit)}, "
+                      f"{limiter.rate_limited} rate-limited responses so far")
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max_concurrency)))
+    finally:
+        if owns_client:
+            await client.close()
+        if journal is not None:
+            journal.close()
+
+    if cache is not None:
+        cache.report()
+
+    # Update the DataFrame with all responses in one assignment
+    apply_responses(new_df, responses)
+    if output_path is not None:
+        write_table(new_df, output_path, table_format=output_format, compression=compression)
+    return new_df
+
+
+def run_all_context_windows(*args, **kwargs):
+    """
+    Blocking wrapper around `process_all_context_windows_async` for use outside of an event loop.
+    """
+    return asyncio.run(process_all_context_windows_async(*args, **kwargs))
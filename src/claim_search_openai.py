@@ -5,6 +5,7 @@ from tqdm import tqdm
 import pandas as pd
 from typing import List, Tuple
 import re
+from context_windows import WordIndex, merge_matches
 
 def create_keyword_pattern(keywords):
     """
@@ -16,34 +17,22 @@ def create_keyword_pattern(keywords):
 def get_context_windows(text, keywords, window_size):
     """
     Extract context windows around keywords in the text, ensuring that overlapping
-    windows are merged into one.
+    windows are merged into one. Words are indexed once per text, so the cost no longer
+    grows with the number of matches times the text length.
     """
     context_windows = []
     keyword_pattern = create_keyword_pattern(keywords)
 
     matches = list(keyword_pattern.finditer(text))
-    merged_matches = []
-
-    i = 0
-    while i < len(matches):
-        current_match = matches[i]
-        start_pos = current_match.start()
-        end_pos = current_match.end()
-
-        # Check if the next matches are within the window size
-        while i + 1 < len(matches) and matches[i + 1].start() - end_pos <= window_size * 2:
-            i += 1
-            end_pos = matches[i].end()
-
-        merged_matches.append((start_pos, end_pos))
-        i += 1
+    # Merge matches that are within the window size of each other
+    merged_matches = merge_matches(matches, window_size * 2)
+    if not merged_matches:
+        return context_windows
 
+    word_index = WordIndex(text)
     for start_pos, end_pos in merged_matches:
-        words = text.split()
-        start_word_pos = len(text[:start_pos].split()) - 1
-        end_word_pos = len(text[:end_pos].split())
-        context_words = words[max(0, start_word_pos - window_size):min(len(words), end_word_pos + window_size)]
-        context_str = ' '.join(context_words)
+        first_word, last_word = word_index.window(start_pos, end_pos, window_size)
+        context_str = ' '.join(word_index.words[first_word:last_word])
         context_windows.append(context_str)
 
     return context_windows
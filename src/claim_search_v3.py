@@ -2,7 +2,6 @@ import json
 import openai
 import time
 from tqdm import tqdm
-import pandas as pd
 from typing import List, Tuple
 import re
 
@@ -12,11 +11,17 @@ import time
 import subprocess
 import sys
 
+from context_windows import context_window_spans, collect_context_windows
+from table_io import load_table, write_table
+
 
 def get_context_windows(text, compiled_regexes, window_size):
     """
     Extract context windows around matches found by any of the compiled regexes in the text,
     ensuring that overlapping windows are merged into one.
+
+    The text is split into words once and word positions are found by binary search, so the
+    cost is O(words + matches * log(words)) rather than re-splitting the text for every match.
     
     Parameters:
         text (str): The text to search through.
@@ -26,82 +31,73 @@ def get_context_windows(text, compiled_regexes, window_size):
     Returns:
         List[str]: A list of context windows around the matches.
     """
-    context_windows = []
-    
-    # Combine matches from all compiled regexes
-    all_matches = []
-    for compiled_regex in compiled_regexes:
-        all_matches.extend(list(compiled_regex.finditer(text)))
-    
-    # Sort matches by their start position
-    all_matches.sort(key=lambda match: match.start())
-
-    # Merge overlapping or adjacent matches
-    merged_matches = []
-    i = 0
-    while i < len(all_matches):
-        current_match = all_matches[i]
-        start_pos = current_match.start()
-        end_pos = current_match.end()
-
-        while i + 1 < len(all_matches) and all_matches[i + 1].start() - end_pos <= window_size * 2 * len(' '):  # Estimate space size
-            i += 1
-            end_pos = all_matches[i].end()
-
-        merged_matches.append((start_pos, end_pos))
-        i += 1
-
-    # Extract context windows for merged matches
-    for start_pos, end_pos in merged_matches:
-        words = text.split()
-        start_word_pos = len(text[:start_pos].split()) - 1
-        end_word_pos = len(text[:end_pos].split())
-        context_words = words[max(0, start_word_pos - window_size):min(len(words), end_word_pos + window_size)]
-        context_str = ' '.join(context_words)
-        context_windows.append(context_str)
+    return [window for window, _, _ in context_window_spans(text, compiled_regexes, window_size, window_size * 2 * len(' '))]
 
-    return context_windows
 
-
-def extract_context_windows_df(df, text_column, compiled_regexes, window_size):
+def extract_context_windows_df(df, text_column, compiled_regexes, window_size, include_offsets=False, num_processes=1, text_store=None,
+                               output_path=None, output_format=None, compression="zstd"):
     """
     Extract context windows for each text in the specified column of a DataFrame,
     and return a new DataFrame with each context window as a row, along with the original metadata.
+
+    Windows are computed as columnar lists (source row, window text, offsets) and the metadata
+    is joined once by position, instead of copying every row with `to_dict()` per window.
     
     Parameters:
-        df (pd.DataFrame): The original DataFrame.
+        df (pd.DataFrame or str): The original DataFrame, or the path of a filter output file (Parquet, Arrow or CSV).
         text_column (str): The name of the column containing text to search through.
         compiled_regexes (List[re.Pattern]): A list of compiled regex objects used to find matches.
         window_size (int): The number of words around the match to include in the context window.
+        include_offsets (bool): Whether to add 'doc_index' (index label of the source row) and
+            'window_start'/'window_end' (character offsets of the window in the source text) columns.
+        num_processes (int): Number of processes used to compute the windows. None uses all CPUs.
+        text_store (text_store.TextStore): Store to read the texts from, by the 'text_id' column, when
+            `df` comes from a text store run and has no text column. Texts are decoded one at a time in
+            the workers; the windows are written to `text_column`.
+        output_path (str): File the windows are also written to with `table_io.write_table`, as Parquet or
+            Arrow IPC for .parquet/.arrow/.feather paths and CSV otherwise. Defaults to None (not written).
+        output_format (str): "parquet", "arrow" or "csv", overriding the extension of `output_path`.
+        compression (str): Parquet/Arrow codec of the output. Defaults to "zstd".
         
     Returns:
         pd.DataFrame: A new DataFrame where each row is a context window, with original metadata.
     """
-    context_rows = []
+    df = load_table(df)
+    if text_store is not None and text_column not in df.columns:
+        texts = text_store.texts(df['text_id'])
+    else:
+        texts = df[text_column].tolist()
+    doc_positions, windows, starts, ends = collect_context_windows(texts, compiled_regexes, window_size, num_processes=num_processes)
 
-    # Iterate over each row in the DataFrame
-    for index, row in df.iterrows():
-        text = row[text_column]
-        context_windows = get_context_windows(text, compiled_regexes, window_size)
-        
-        # For each context window, create a new row with the same metadata
-        for window in context_windows:
-            new_row = row.to_dict()  # Convert the row to a dictionary
-            new_row[text_column] = window  # Replace the text column with the context window
-            context_rows.append(new_row)
-    
-    # Create a new DataFrame from the list of context rows
-    context_df = pd.DataFrame(context_rows)
+    # Join the metadata once, without ever copying the full text column
+    if text_column in df.columns:
+        context_df = df.drop(columns=[text_column]).iloc[doc_positions].reset_index(drop=True)
+        context_df.insert(df.columns.get_loc(text_column), text_column, windows)
+    else:
+        context_df = df.iloc[doc_positions].reset_index(drop=True)
+        context_df.insert(0, text_column, windows)
 
+    if include_offsets:
+        context_df['doc_index'] = df.index[doc_positions]
+        context_df['window_start'] = starts
+        context_df['window_end'] = ends
+
+    if output_path is not None:
+        write_table(context_df, output_path, table_format=output_format, compression=compression)
     return context_df
 
 
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from openai import OpenAI
+from rate_limiting import parse_retry_after
+from response_cache import response_cache_key
+from checkpointing import CheckpointJournal, pending_windows, apply_responses
+from prompt_batching import make_batches, process_batch_with_gpt
+from functools import partial
 
 
-def process_with_gpt_with_retries(context_window, model, system_prompt, openai_api_key, max_retries=5):
+def process_with_gpt_with_retries(context_window, model, system_prompt, openai_api_key, max_retries=5, rate_limiter=None, cache=None):
     """
     Attempts to generate a response from the OpenAI API for a given context window,
     using specified model parameters. Handles rate limits with retries.
@@ -112,6 +108,8 @@ def process_with_gpt_with_retries(context_window, model, system_prompt, openai_a
     - system_prompt (str): System-level instructions or context provided alongside the user prompt.
     - openai_api_key (str): The API key for authenticating with OpenAI's services.
     - max_retries (int, optional): Maximum number of retry attempts if rate limited. Defaults to 5.
+    - rate_limiter (rate_limiting.RateLimiter, optional): Shared request/token budget to wait on before each attempt.
+    - cache (response_cache.ResponseCache, optional): Disk cache consulted before calling the API.
 
     Returns:
     - str: The generated response text if successful, or an error message if an error occurs or retries are exceeded.
@@ -119,13 +117,26 @@ def process_with_gpt_with_retries(context_window, model, system_prompt, openai_a
     Behavior:
     - Submits a chat completion request to the OpenAI API.
     - Implements an exponential backoff strategy for handling rate limit errors, with a maximum wait time limit.
+    - With a `rate_limiter`, waits for the request and token budget before sending and holds back all
+      workers for the server's Retry-After when a rate limit error still occurs.
+    - With a `cache`, returns the stored response for the same model, prompts and window without an API call,
+      and stores successful responses.
     - Returns either the response from the model or an error message indicating the failure reason.
     """
+    if cache is not None:
+        cache_key = response_cache_key(model, system_prompt, context_window)
+        cached_response = cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response
     client = OpenAI(api_key=openai_api_key)
     retry_delay = 0.5  # Reduced initial delay in seconds for retries
     max_retry_delay = 16  # Maximum delay, to avoid long waits
+    if rate_limiter is not None:
+        estimated_tokens = rate_limiter.request_tokens(system_prompt, context_window)
     for attempt in range(max_retries):
         try:
+            if rate_limiter is not None:
+                rate_limiter.wait(estimated_tokens)
             #openai.api_key = openai_api_key  # Set the API key here
             response = client.chat.completions.create(
                 model=model,
@@ -134,8 +145,17 @@ def process_with_gpt_with_retries(context_window, model, system_prompt, openai_a
                     {"role": "user", "content": context_window}
                 ]
             )
+            if rate_limiter is not None:
+                rate_limiter.record_usage(estimated_tokens, response)
+            if cache is not None:
+                cache.put(cache_key, response.choices[0].message.content, model)
             return response.choices[0].message.content
-        except openai.RateLimitError:
+        except openai.RateLimitError as e:
+            if rate_limiter is not None:
+                # The shared limiter delays the next attempt of every worker
+                rate_limiter.penalize(parse_retry_after(e.response, default=retry_delay))
+                print("Rate limit reached, pausing all workers.")
+                continue
             print(f"Rate limit reached, retrying in {retry_delay}")
             time.sleep(retry_delay)
             retry_delay = min(retry_delay * 2, max_retry_delay)  # Exponential backoff with max limit
@@ -147,19 +167,34 @@ def process_with_gpt_with_retries(context_window, model, system_prompt, openai_a
             retry_delay = min(retry_delay * 2, max_retry_delay)  # Exponential backoff with max limit
     return "Error: Max retries exceeded."
 
-def process_all_context_windows(new_df, model, system_prompt, openai_api_key, texts_before_pause=1000, pause_duration=5, max_workers= 1):
+def process_all_context_windows(new_df, model, system_prompt, openai_api_key, texts_before_pause=1000, pause_duration=5, max_workers= 1, rate_limiter=None, cache=None, checkpoint_path=None, shard_index=0, num_shards=1, batch_size=1, output_path=None, output_format=None, compression="zstd"):
     """
     Processes a DataFrame of context windows to generate model responses in parallel,
     utilizing a specified number of worker threads.
 
     Parameters:
-    - new_df (pandas.DataFrame): DataFrame containing the context windows to process. Must have a 'context_window' column.
+    - new_df (pandas.DataFrame or str): DataFrame containing the context windows to process, or the path of a window file
+      written by `extract_context_windows_df`. Must have a 'context_window' column.
     - model (str): Model identifier to use for generating responses.
     - system_prompt (str): System-level instructions or context for the model.
     - openai_api_key (str): API key for OpenAI services authentication.
     - texts_before_pause (int, optional): Number of texts to process before pausing, to manage rate limits or resource usage. Defaults to 1000.
     - pause_duration (int, optional): Duration in seconds to pause after processing `texts_before_pause` texts. Defaults to 5 seconds.
     - max_workers (int, optional): Maximum number of worker threads for parallel processing. Defaults to 1.
+    - rate_limiter (rate_limiting.RateLimiter, optional): Request/token budget shared by all workers, e.g.
+      `RateLimiter(requests_per_minute=5000, tokens_per_minute=800000, model=model)`. Replaces the periodic pause.
+    - cache (response_cache.ResponseCache, optional): Disk cache of responses, so windows answered in earlier
+      runs cost no API calls. Hit/miss statistics are printed at the end.
+    - checkpoint_path (str, optional): JSONL journal that every response is appended to as it completes.
+      Rerunning with the same path resumes the run: windows with a recorded (non-error) response are skipped.
+    - shard_index, num_shards (int, optional): Process only the windows whose id hashes to `shard_index` out of
+      `num_shards`, e.g. one shard per machine. Merge the shards' journals with `checkpointing.load_journals`.
+    - batch_size (int, optional): Context windows packed into one request with a JSON response format, so the
+      prompts are sent once per batch. Windows the batched answer does not cover are retried one by one. Defaults to 1.
+    - output_path (str, optional): File the resulting DataFrame is written to with `table_io.write_table`,
+      as Parquet or Arrow IPC for .parquet/.arrow/.feather paths and CSV otherwise. Defaults to None (not written).
+    - output_format (str, optional): "parquet", "arrow" or "csv", overriding the extension of `output_path`.
+    - compression (str, optional): Parquet/Arrow codec of the output. Defaults to "zstd".
 
     Returns:
     - pandas.DataFrame: The input DataFrame, `new_df`, with an additional 'gpt_response' column containing the generated responses or error messages.
@@ -168,32 +203,57 @@ def process_all_context_windows(new_df, model, system_prompt, openai_api_key, te
     - Processes each context window in parallel, up to `max_workers` at a time.
     - Applies rate limit handling and error capturing for each request.
     - Optionally pauses processing after a specified number of texts to avoid overloading the API or the local system.
+      No pause is taken when a `rate_limiter` paces the requests.
     - Updates the original DataFrame with responses, allowing for analysis or further processing.
     """
+    new_df = load_table(new_df)
     responses = {}
+    journal = None
+    if checkpoint_path is not None:
+        journal = CheckpointJournal(checkpoint_path)
+        responses = journal.load()
+        if responses:
+            print(f"Resuming from {checkpoint_path}: {len(responses)} context windows already completed")
+    pending = pending_windows(new_df, responses, shard_index, num_shards)
     processed_texts = 0
     with ThreadPoolExecutor(max_workers=max_workers) as executor:  # Adjust max_workers based on your environment
-        future_to_idx = {executor.submit(process_with_gpt_with_retries, row['context_window'], model, system_prompt, openai_api_key): idx for idx, row in new_df.iterrows()}
+        if batch_size > 1:
+            fallback = partial(process_with_gpt_with_retries, model=model, system_prompt=system_prompt, openai_api_key=openai_api_key, rate_limiter=rate_limiter, cache=cache)
+            future_to_ids = {executor.submit(process_batch_with_gpt, batch, model, system_prompt, openai_api_key, fallback, rate_limiter=rate_limiter, cache=cache): [idx for idx, _ in batch] for batch in make_batches(pending, batch_size)}
+        else:
+            future_to_ids = {executor.submit(process_with_gpt_with_retries, context_window, model, system_prompt, openai_api_key, rate_limiter=rate_limiter, cache=cache): [idx] for idx, context_window in pending}
 
-        for future in as_completed(future_to_idx):
-            idx = future_to_idx[future]
+        for future in as_completed(future_to_ids):
+            ids = future_to_ids[future]
             try:
-                response = future.result()
+                result = future.result()
+                batch_responses = result if batch_size > 1 else {ids[0]: result}
             except Exception as exc:
-                print(f'Context window at index {idx} generated an exception: {exc}')
-                response = "Error: Exception in processing"
-            
-            responses[idx] = response
-            processed_texts += 1
-
-            # Indicator for how many texts have been processed
-            if processed_texts % texts_before_pause == 0:
-                print(f"Processed {processed_texts}/{len(new_df)} texts; pausing for {pause_duration} seconds...")
-                time.sleep(pause_duration)
+                print(f'Context window at index {ids} generated an exception: {exc}')
+                batch_responses = {idx: "Error: Exception in processing" for idx in ids}
+
+            for idx, response in batch_responses.items():
+                responses[idx] = response
+                if journal is not None:
+                    journal.append(idx, response)
+                processed_texts += 1
+
+                # Indicator for how many texts have been processed
+                if processed_texts % texts_before_pause == 0:
+                    if rate_limiter is not None:
+                        print(f"Processed {processed_texts}/{len(pending)} texts")
+                    else:
+                        print(f"Processed {processed_texts}/{len(pending)} texts; pausing for {pause_duration} seconds...")
+                        time.sleep(pause_duration)
     
+    if journal is not None:
+        journal.close()
+    if cache is not None:
+        cache.report()
+
     # Update the DataFrame with the responses using .loc
-    for idx, response in responses.items():
-        if idx in new_df.index:
-            new_df.loc[idx, 'gpt_response'] = response
+    apply_responses(new_df, responses)
+    if output_path is not None:
+        write_table(new_df, output_path, table_format=output_format, compression=compression)
 
     return new_df
\ No newline at end of file
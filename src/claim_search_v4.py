@@ -4,10 +4,16 @@ import pandas as pd
 from typing import List, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from openai import OpenAI
+from rate_limiting import parse_retry_after
+from response_cache import response_cache_key
+from checkpointing import CheckpointJournal, pending_windows, apply_responses
+from table_io import load_table, write_table
+from prompt_batching import make_batches, process_batch_with_gpt
+from functools import partial
 import time
 
 
-def process_with_gpt_with_retries(context_window, model, system_prompt, introduction_statement_prompt, end_statement_prompt, openai_api_key, max_retries=5):
+def process_with_gpt_with_retries(context_window, model, system_prompt, introduction_statement_prompt, end_statement_prompt, openai_api_key, max_retries=5, rate_limiter=None, cache=None):
     """
     Attempts to generate a response from the OpenAI API for a given context window,
     using specified model parameters. Handles rate limits with retries.
@@ -18,6 +24,8 @@ def process_with_gpt_with_retries(context_window, model, system_prompt, introduc
     - system_prompt (str): System-level instructions or context provided alongside the user prompt.
     - openai_api_key (str): The API key for authenticating with OpenAI's services.
     - max_retries (int, optional): Maximum number of retry attempts if rate limited. Defaults to 5.
+    - rate_limiter (rate_limiting.RateLimiter, optional): Shared request/token budget to wait on before each attempt.
+    - cache (response_cache.ResponseCache, optional): Disk cache consulted before calling the API.
 
     Returns:
     - str: The generated response text if successful, or an error message if an error occurs or retries are exceeded.
@@ -25,15 +33,28 @@ def process_with_gpt_with_retries(context_window, model, system_prompt, introduc
     Behavior:
     - Submits a chat completion request to the OpenAI API.
     - Implements an exponential backoff strategy for handling rate limit errors, with a maximum wait time limit.
+    - With a `rate_limiter`, waits for the request and token budget before sending and holds back all
+      workers for the server's Retry-After when a rate limit error still occurs.
+    - With a `cache`, returns the stored response for the same model, prompts and window without an API call,
+      and stores successful responses.
     - Returns either the response from the model or an error message indicating the failure reason.
     """
-    client = OpenAI(api_key=openai_api_key)
     retry_delay = 0.5  # Reduced initial delay in seconds for retries
     max_retry_delay = 16  # Maximum delay, to avoid long waits
     # Modify the context window to include the additional prompts
     modified_context_window = f"{introduction_statement_prompt} {context_window} {end_statement_prompt}"
+    if cache is not None:
+        cache_key = response_cache_key(model, system_prompt, modified_context_window)
+        cached_response = cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response
+    client = OpenAI(api_key=openai_api_key)
+    if rate_limiter is not None:
+        estimated_tokens = rate_limiter.request_tokens(system_prompt, modified_context_window)
     for attempt in range(max_retries):
         try:
+            if rate_limiter is not None:
+                rate_limiter.wait(estimated_tokens)
             response = client.chat.completions.create(
                 model=model,
                 messages=[
@@ -41,8 +62,17 @@ def process_with_gpt_with_retries(context_window, model, system_prompt, introduc
                     {"role": "user", "content": modified_context_window}
                 ]
             )
+            if rate_limiter is not None:
+                rate_limiter.record_usage(estimated_tokens, response)
+            if cache is not None:
+                cache.put(cache_key, response.choices[0].message.content, model)
             return response.choices[0].message.content
-        except openai.RateLimitError:
+        except openai.RateLimitError as e:
+            if rate_limiter is not None:
+                # The shared limiter delays the next attempt of every worker
+                rate_limiter.penalize(parse_retry_after(e.response, default=retry_delay))
+                print("Rate limit reached, pausing all workers.")
+                continue
             print(f"Rate limit reached, retrying in {retry_delay} seconds.")
             time.sleep(retry_delay)
             retry_delay = min(retry_delay * 2, max_retry_delay)  # Exponential backoff with max limit
@@ -54,19 +84,34 @@ def process_with_gpt_with_retries(context_window, model, system_prompt, introduc
             retry_delay = min(retry_delay * 2, max_retry_delay)  # Exponential backoff with max limit
     return "Error: Max retries exceeded."
 
-def process_all_context_windows(new_df, model, system_prompt, introduction_statement_prompt, end_statement_prompt, openai_api_key, texts_before_pause=1000, pause_duration=5, max_workers=1):
+def process_all_context_windows(new_df, model, system_prompt, introduction_statement_prompt, end_statement_prompt, openai_api_key, texts_before_pause=1000, pause_duration=5, max_workers=1, rate_limiter=None, cache=None, checkpoint_path=None, shard_index=0, num_shards=1, batch_size=1, output_path=None, output_format=None, compression="zstd"):
     """
     Processes a DataFrame of context windows to generate model responses in parallel,
     utilizing a specified number of worker threads.
 
     Parameters:
-    - new_df (pandas.DataFrame): DataFrame containing the context windows to process. Must have a 'context_window' column.
+    - new_df (pandas.DataFrame or str): DataFrame containing the context windows to process, or the path of a window file
+      written by `extract_context_windows_df`. Must have a 'context_window' column.
     - model (str): Model identifier to use for generating responses.
     - system_prompt (str): System-level instructions or context for the model.
     - openai_api_key (str): API key for OpenAI services authentication.
     - texts_before_pause (int, optional): Number of texts to process before pausing, to manage rate limits or resource usage. Defaults to 1000.
     - pause_duration (int, optional): Duration in seconds to pause after processing `texts_before_pause` texts. Defaults to 5 seconds.
     - max_workers (int, optional): Maximum number of worker threads for parallel processing. Defaults to 1.
+    - rate_limiter (rate_limiting.RateLimiter, optional): Request/token budget shared by all workers, e.g.
+      `RateLimiter(requests_per_minute=5000, tokens_per_minute=800000, model=model)`. Replaces the periodic pause.
+    - cache (response_cache.ResponseCache, optional): Disk cache of responses, so windows answered in earlier
+      runs cost no API calls. Hit/miss statistics are printed at the end.
+    - checkpoint_path (str, optional): JSONL journal that every response is appended to as it completes.
+      Rerunning with the same path resumes the run: windows with a recorded (non-error) response are skipped.
+    - shard_index, num_shards (int, optional): Process only the windows whose id hashes to `shard_index` out of
+      `num_shards`, e.g. one shard per machine. Merge the shards' journals with `checkpointing.load_journals`.
+    - batch_size (int, optional): Context windows packed into one request with a JSON response format, so the
+      prompts are sent once per batch. Windows the batched answer does not cover are retried one by one. Defaults to 1.
+    - output_path (str, optional): File the resulting DataFrame is written to with `table_io.write_table`,
+      as Parquet or Arrow IPC for .parquet/.arrow/.feather paths and CSV otherwise. Defaults to None (not written).
+    - output_format (str, optional): "parquet", "arrow" or "csv", overriding the extension of `output_path`.
+    - compression (str, optional): Parquet/Arrow codec of the output. Defaults to "zstd".
 
     Returns:
     - pandas.DataFrame: The input DataFrame, `new_df`, with an additional 'gpt_response' column containing the generated responses or error messages.
@@ -75,32 +120,57 @@ def process_all_context_windows(new_df, model, system_prompt, introduction_state
     - Processes each context window in parallel, up to `max_workers` at a time.
     - Applies rate limit handling and error capturing for each request.
     - Optionally pauses processing after a specified number of texts to avoid overloading the API or the local system.
+      No pause is taken when a `rate_limiter` paces the requests.
     - Updates the original DataFrame with responses, allowing for analysis or further processing.
     """
+    new_df = load_table(new_df)
     responses = {}
+    journal = None
+    if checkpoint_path is not None:
+        journal = CheckpointJournal(checkpoint_path)
+        responses = journal.load()
+        if responses:
+            print(f"Resuming from {checkpoint_path}: {len(responses)} context windows already completed")
+    pending = pending_windows(new_df, responses, shard_index, num_shards)
     processed_texts = 0
     with ThreadPoolExecutor(max_workers=max_workers) as executor:  # Adjust max_workers based on your environment
-        future_to_idx = {executor.submit(process_with_gpt_with_retries, row['context_window'], model, system_prompt, introduction_statement_prompt, end_statement_prompt, openai_api_key): idx for idx, row in new_df.iterrows()}
+        if batch_size > 1:
+            fallback = partial(process_with_gpt_with_retries, model=model, system_prompt=system_prompt, introduction_statement_prompt=introduction_statement_prompt, end_statement_prompt=end_statement_prompt, openai_api_key=openai_api_key, rate_limiter=rate_limiter, cache=cache)
+            future_to_ids = {executor.submit(process_batch_with_gpt, batch, model, system_prompt, openai_api_key, fallback, introduction_statement_prompt, end_statement_prompt, rate_limiter=rate_limiter, cache=cache): [idx for idx, _ in batch] for batch in make_batches(pending, batch_size)}
+        else:
+            future_to_ids = {executor.submit(process_with_gpt_with_retries, context_window, model, system_prompt, introduction_statement_prompt, end_statement_prompt, openai_api_key, rate_limiter=rate_limiter, cache=cache): [idx] for idx, context_window in pending}
 
-        for future in as_completed(future_to_idx):
-            idx = future_to_idx[future]
+        for future in as_completed(future_to_ids):
+            ids = future_to_ids[future]
             try:
-                response = future.result()
+                result = future.result()
+                batch_responses = result if batch_size > 1 else {ids[0]: result}
             except Exception as exc:
-                print(f'Context window at index {idx} generated an exception: {exc}')
-                response = "Error: Exception in processing"
-            
-            responses[idx] = response
-            processed_texts += 1
+                print(f'Context window at index {ids} generated an exception: {exc}')
+                batch_responses = {idx: "Error: Exception in processing" for idx in ids}
+
+            for idx, response in batch_responses.items():
+                responses[idx] = response
+                if journal is not None:
+                    journal.append(idx, response)
+                processed_texts += 1
+
+                # Indicator for how many texts have been processed
+                if processed_texts % texts_before_pause == 0:
+                    if rate_limiter is not None:
+                        print(f"Processed {processed_texts}/{len(pending)} texts")
+                    else:
+                        print(f"Processed {processed_texts}/{len(pending)} texts; pausing for {pause_duration} seconds...")
+                        time.sleep(pause_duration)
 
-            # Indicator for how many texts have been processed
-            if processed_texts % texts_before_pause == 0:
-                print(f"Processed {processed_texts}/{len(new_df)} texts; pausing for {pause_duration} seconds...")
-                time.sleep(pause_duration)
+    if journal is not None:
+        journal.close()
+    if cache is not None:
+        cache.report()
 
     # Update the DataFrame with the responses using .loc
-    for idx, response in responses.items():
-        if idx in new_df.index:
-            new_df.loc[idx, 'gpt_response'] = response
+    apply_responses(new_df, responses)
+    if output_path is not None:
+        write_table(new_df, output_path, table_format=output_format, compression=compression)
 
     return new_df
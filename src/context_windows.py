@@ -0,0 +1,143 @@
+import re
+from bisect import bisect_left
+from multiprocessing import Pool
+from functools import partial
+
+# Same notion of whitespace as str.split(), so word i below is text.split()[i]
+_WORD_PATTERN = re.compile(r'\S+')
+
+
+class WordIndex:
+    """
+    One-time index of the whitespace-separated words of a text and their character offsets.
+
+    Parameters:
+    - text (str): The text to index.
+
+    Attributes:
+    - words (list of str): Equal to text.split().
+    - starts, ends (list of int): Character offsets of each word in the text, end exclusive.
+    """
+
+    def __init__(self, text):
+        self.words = []
+        self.starts = []
+        self.ends = []
+        for match in _WORD_PATTERN.finditer(text):
+            self.words.append(match.group())
+            self.starts.append(match.start())
+            self.ends.append(match.end())
+
+    def words_before(self, pos):
+        """
+        Number of words starting before character `pos`, i.e. len(text[:pos].split()).
+        """
+        return bisect_left(self.starts, pos)
+
+    def window(self, start_pos, end_pos, window_size):
+        """
+        Word range of the context window around the characters [start_pos, end_pos).
+
+        Returns:
+        - tuple: (first word index, last word index exclusive), clipped to the text.
+        """
+        start_word_pos = self.words_before(start_pos) - 1
+        end_word_pos = self.words_before(end_pos)
+        return max(0, start_word_pos - window_size), min(len(self.words), end_word_pos + window_size)
+
+
+def merge_matches(matches, max_gap):
+    """
+    Merge sorted regex matches into (start, end) spans when the gap to the previous match is at most `max_gap` characters.
+    """
+    merged_matches = []
+    i = 0
+    while i < len(matches):
+        start_pos = matches[i].start()
+        end_pos = matches[i].end()
+        while i + 1 < len(matches) and matches[i + 1].start() - end_pos <= max_gap:
+            i += 1
+            end_pos = matches[i].end()
+        merged_matches.append((start_pos, end_pos))
+        i += 1
+    return merged_matches
+
+
+def context_window_spans(text, compiled_regexes, window_size, max_gap=None):
+    """
+    Find the merged context windows of a text together with their character offsets.
+
+    Parameters:
+    - text (str): The text to search through.
+    - compiled_regexes (list of re.Pattern): Patterns whose matches anchor the windows.
+    - window_size (int): Number of words to include on each side of a (merged) match.
+    - max_gap (int, optional): Maximum character gap between matches that are merged into one
+      window. Defaults to window_size * 2.
+
+    Returns:
+    - list of tuple: (window text, start offset, end offset) with offsets into `text`, end exclusive.
+    """
+    if not isinstance(text, str):
+        return []
+    if max_gap is None:
+        max_gap = window_size * 2
+
+    all_matches = []
+    for compiled_regex in compiled_regexes:
+        all_matches.extend(compiled_regex.finditer(text))
+    all_matches.sort(key=lambda match: match.start())
+
+    merged_matches = merge_matches(all_matches, max_gap)
+    if not merged_matches:
+        return []
+
+    word_index = WordIndex(text)
+    spans = []
+    for start_pos, end_pos in merged_matches:
+        first_word, last_word = word_index.window(start_pos, end_pos, window_size)
+        if first_word < last_word:
+            spans.append((' '.join(word_index.words[first_word:last_word]), word_index.starts[first_word], word_index.ends[last_word - 1]))
+        else:
+            spans.append(('', start_pos, start_pos))
+    return spans
+
+
+def _collect_chunk(chunk, compiled_regexes, window_size):
+    offset, texts = chunk
+    doc_positions, windows, starts, ends = [], [], [], []
+    for position, text in enumerate(texts, start=offset):
+        for window, start, end in context_window_spans(text, compiled_regexes, window_size):
+            doc_positions.append(position)
+            windows.append(window)
+            starts.append(start)
+            ends.append(end)
+    return doc_positions, windows, starts, ends
+
+
+def collect_context_windows(texts, compiled_regexes, window_size, num_processes=1, chunk_size=256):
+    """
+    Compute the context windows of many texts as columnar lists.
+
+    Parameters:
+    - texts (list of str): The texts, e.g. one DataFrame column.
+    - compiled_regexes (list of re.Pattern): Patterns whose matches anchor the windows.
+    - window_size (int): Number of words to include on each side of a (merged) match.
+    - num_processes (int, optional): Worker processes; 1 runs in the current process. Defaults to 1.
+    - chunk_size (int, optional): Texts per task when running in parallel. Defaults to 256.
+
+    Returns:
+    - tuple: (positions of the source texts, window texts, window start offsets, window end offsets),
+      four lists with one entry per window, ordered by text and then by offset.
+    """
+    chunks = [(offset, texts[offset:offset + chunk_size]) for offset in range(0, len(texts), chunk_size)]
+    if num_processes is None or num_processes > 1:
+        with Pool(num_processes) as p:
+            results = p.map(partial(_collect_chunk, compiled_regexes=compiled_regexes, window_size=window_size), chunks)
+    else:
+        results = [_collect_chunk(chunk, compiled_regexes, window_size) for chunk in chunks]
+
+    columns = ([], [], [], [])
+    for result in results:
+        for column, values in zip(columns, result):
+            column.extend(values)
+    return columns
@@ -0,0 +1,323 @@
+import os
+import pandas as pd
+from multiprocessing import Pool
+from functools import partial
+from jsonl_io import ShardWriter, JsonlReader, read_shards, available_cpus, plan_work_units, file_order, iter_jsonl_lines, iter_jsonl_lines_at
+from table_io import write_table
+from text_store import TextStoreWriter, segment_name
+
+
+def iter_file_matches(file_path, matcher, metadata_keys, clean_text=None, stats=None, start=0, end=None, json_backend=None,
+                      text_writer=None, line_offsets=None):
+    """
+    Yield one row per text in a JSONL file (or a byte range of it) that matches at least one metric family.
+
+    Parameters:
+    - file_path (str): Path to the .jsonl file.
+    - matcher (MetricMatcher): Matcher with 'auroc' and 'auprc' families.
+    - metadata_keys (list of str): Keys to copy from each entry's 'meta' dict.
+    - clean_text (callable, optional): Function applied to each text before matching, e.g. LaTeX removal.
+    - stats (dict, optional): Counters updated in place; 'total_texts' counts every line read and
+      'prefiltered_texts' the lines rejected by the matcher's literal prefilter without being decoded.
+    - start, end (int, optional): Byte range of the file to process, as produced by `split_jsonl_file`.
+    - json_backend (str, optional): JSON parser for `JsonlReader`. Defaults to the fastest available one.
+    - text_writer (TextStoreWriter, optional): If given, matching texts are stored in it and rows carry
+      their 'text_id' instead of the 'text'.
+    - line_offsets (list of int, optional): Byte offsets of the only lines to read, e.g. index candidates.
+      Replaces `start` and `end`.
+
+    Yields:
+    - dict: Metadata, 'text' (or 'text_id'), 'contains_auroc' and 'contains_auprc' for each matching text.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault('total_texts', 0)
+    stats.setdefault('prefiltered_texts', 0)
+    reader = JsonlReader(['text'] + ['meta.' + key for key in metadata_keys], backend=json_backend)
+
+    lines = iter_jsonl_lines(file_path, start, end) if line_offsets is None else iter_jsonl_lines_at(file_path, line_offsets)
+    for line in lines:
+        stats['total_texts'] += 1
+        if not matcher.might_match(line):
+            stats['prefiltered_texts'] += 1
+            continue
+        try:
+            entry = reader.parse(line)
+            text = entry['text']
+            if clean_text is not None:
+                text = clean_text(text)
+            meta_data = entry.get('meta', {})
+
+            found = matcher.search(text)
+            if found:
+                row_data = {key: meta_data.get(key, None) for key in metadata_keys}
+                if text_writer is not None:
+                    row_data['text_id'] = text_writer.add(text)
+                else:
+                    row_data['text'] = text
+                row_data['contains_auroc'] = 'auroc' in found
+                row_data['contains_auprc'] = 'auprc' in found
+                yield row_data
+
+        except ValueError as e:
+            print(f"Error loading line in {file_path}: {line.decode('utf-8', 'replace')}. Error: {e}")
+
+
+def process_file_rows(file_path, matcher, metadata_keys, clean_text=None, start=0, end=None, json_backend=None):
+    """
+    Collect all matching rows of a JSONL file (or a byte range of it) in memory.
+
+    Returns:
+    - tuple: (list of row dicts, total number of texts read).
+    """
+    stats = {}
+    output_data = list(iter_file_matches(file_path, matcher, metadata_keys, clean_text, stats, start, end, json_backend))
+    return output_data, stats['total_texts']
+
+
+def _unit_text_writer(unit, text_store_dir, segment_prefix=''):
+    # Every work unit writes its own store segment, so workers never share a file
+    return TextStoreWriter(text_store_dir, segment_prefix + segment_name(unit)) if text_store_dir is not None else None
+
+
+def process_unit_rows(unit, matcher, metadata_keys, clean_text=None, json_backend=None, text_store_dir=None, segment_prefix=''):
+    """
+    Pool entry point for in-memory mode; `unit` is a (file path, start, end) byte range. `segment_prefix` is
+    prepended to the name of the unit's text store segment.
+
+    Returns:
+    - tuple: (file path, list of row dicts, stats dict). The path lets results be split per input file.
+    """
+    file_path, start, end = unit
+    stats = {}
+    text_writer = _unit_text_writer(unit, text_store_dir, segment_prefix)
+    try:
+        output_data = list(iter_file_matches(file_path, matcher, metadata_keys, clean_text, stats, start, end, json_backend, text_writer))
+    finally:
+        if text_writer is not None:
+            text_writer.close()
+    return file_path, output_data, stats
+
+
+def collect_unit_rows(file_paths, matcher, metadata_keys, clean_text=None, num_processes=None, chunk_size=None,
+                      json_backend=None, text_store_dir=None, segment_prefix=''):
+    """
+    Run the metric filter over a list of JSONL files with a process pool and return the results of every work unit.
+
+    Parameters:
+    - file_paths, matcher, metadata_keys, clean_text, num_processes, chunk_size, json_backend, text_store_dir: As for `filter_files`.
+    - segment_prefix (str, optional): Prefix of the text store segment names, so runs with different settings
+      sharing one store do not replace each other's segments. Defaults to ''.
+
+    Returns:
+    - list of tuple: (file path, list of row dicts, stats dict) per work unit, in the order of `file_paths` and of
+      the lines within each file.
+    """
+    if num_processes is None:
+        num_processes = available_cpus()
+    units = plan_work_units(file_paths, num_processes, chunk_size)
+    unit_key = file_order(file_paths)
+    process_partial = partial(process_unit_rows, matcher=matcher, metadata_keys=metadata_keys, clean_text=clean_text,
+                              json_backend=json_backend, text_store_dir=text_store_dir, segment_prefix=segment_prefix)
+    with Pool(num_processes) as p:
+        results = p.map(process_partial, units, chunksize=1)
+    # Units are scheduled largest first; put the results back in file and line order
+    return [result for _, result in sorted(zip(units, results), key=lambda pair: unit_key(pair[0]))]
+
+
+def stream_file_matches(task, matcher, metadata_keys, clean_text, shard_dir, buffer_size, shard_format, json_backend=None,
+                        text_store_dir=None):
+    """
+    Write the matching rows of a byte range of a JSONL file to shard files as they are found.
+
+    Parameters:
+    - task (tuple): (task index, (file path, start, end)). The index keeps shard names unique across workers.
+    - shard_dir (str): Folder receiving the shards.
+    - buffer_size (int): Rows held in memory before each write.
+    - shard_format (str): "jsonl" or "parquet".
+
+    Returns:
+    - tuple: (list of shard paths written, stats dict).
+    """
+    task_index, (file_path, start, end) = task
+    stats = {}
+    prefix = f"{task_index:05d}_{os.path.splitext(os.path.basename(file_path))[0]}"
+    text_writer = _unit_text_writer((file_path, start, end), text_store_dir)
+    try:
+        with ShardWriter(shard_dir, prefix, buffer_size=buffer_size, shard_format=shard_format) as writer:
+            for row_data in iter_file_matches(file_path, matcher, metadata_keys, clean_text, stats, start, end, json_backend, text_writer):
+                writer.write(row_data)
+    finally:
+        if text_writer is not None:
+            text_writer.close()
+    return writer.paths, stats
+
+
+def finalize_output_frame(df_output, metadata_keys):
+    """
+    Assign a text_id to every unique text and order the columns of a filter result.
+
+    Rows from a text store run already carry content-derived text ids and no text column.
+    """
+    keyword_columns = ['contains_auroc', 'contains_auprc']
+    if 'text' not in df_output.columns and 'text_id' in df_output.columns:
+        return df_output[['text_id'] + metadata_keys + keyword_columns]
+    column_order = ['text', 'text_id'] + metadata_keys + keyword_columns
+    if df_output.empty:
+        return pd.DataFrame(columns=column_order)
+
+    # Assigning a unique text_id for each unique text
+    df_output['text_id'] = pd.factorize(df_output['text'])[0]
+    return df_output[column_order]
+
+
+def filter_files(file_paths, matcher, metadata_keys, clean_text=None, num_processes=None, chunk_size=None,
+                 shard_dir=None, buffer_size=1000, shard_format='jsonl', return_dataframe=True, json_backend=None,
+                 text_store_dir=None):
+    """
+    Run the metric filter over a list of JSONL files with a process pool.
+
+    Files are split into byte ranges on line boundaries, so one very large shard is spread over
+    all workers instead of occupying a single core.
+
+    Parameters:
+    - file_paths (list of str): JSONL files to process.
+    - matcher (MetricMatcher): Matcher with 'auroc' and 'auprc' families.
+    - metadata_keys (list of str): Keys to copy from each entry's 'meta' dict.
+    - clean_text (callable, optional): Function applied to each text before matching.
+    - num_processes (int, optional): Worker processes. Defaults to the number of CPUs available to this process.
+    - chunk_size (int, optional): Target size in bytes of each work unit. See `plan_work_units`.
+    - shard_dir (str, optional): If given, workers stream their matches to shard files in this folder
+      instead of returning them, so memory is bounded by `buffer_size` rows per worker.
+    - buffer_size (int, optional): Rows each worker buffers before writing a shard. Defaults to 1000.
+    - shard_format (str, optional): "jsonl" or "parquet". Defaults to "jsonl".
+    - return_dataframe (bool, optional): In streaming mode, whether to read the shards back into a
+      DataFrame. Defaults to True.
+    - json_backend (str, optional): "simdjson", "orjson" or "json". Defaults to the fastest available one.
+    - text_store_dir (str, optional): If given, matching texts are written to a text store in this folder
+      (one segment per work unit) and the rows carry 64-bit content-derived 'text_id's instead of the texts.
+      Read the texts back with `text_store.TextStore(text_store_dir)`.
+
+    Returns:
+    - tuple: (DataFrame or None, stats dict with 'total_texts' and 'prefiltered_texts', list of shard paths).
+
+    Behavior:
+    - Units are scheduled largest first, but rows (and so the text_ids) follow the order of `file_paths`
+      and of the lines within each file, as with one worker per file.
+    """
+    if shard_dir is None:
+        results = collect_unit_rows(file_paths, matcher, metadata_keys, clean_text=clean_text, num_processes=num_processes,
+                                    chunk_size=chunk_size, json_backend=json_backend, text_store_dir=text_store_dir)
+        output_data = [item for _, sublist, _ in results for item in sublist]
+        stats = _sum_stats(unit_stats for _, _, unit_stats in results)
+        return finalize_output_frame(pd.DataFrame(output_data), metadata_keys), stats, []
+
+    if num_processes is None:
+        num_processes = available_cpus()
+    units = plan_work_units(file_paths, num_processes, chunk_size)
+    unit_key = file_order(file_paths)
+
+    with Pool(num_processes) as p:
+        stream_partial = partial(stream_file_matches, matcher=matcher, metadata_keys=metadata_keys, clean_text=clean_text,
+                                 shard_dir=shard_dir, buffer_size=buffer_size, shard_format=shard_format,
+                                 json_backend=json_backend, text_store_dir=text_store_dir)
+        shard_paths = []
+        all_stats = []
+        # Tasks run largest first, but their indexes follow the file and line order, so the sorted shard names do too
+        ranks = {unit: i for i, unit in enumerate(sorted(units, key=unit_key))}
+        for paths, unit_stats in p.imap_unordered(stream_partial, [(ranks[unit], unit) for unit in units]):
+            shard_paths.extend(paths)
+            all_stats.append(unit_stats)
+
+    shard_paths.sort()
+    df_output = finalize_output_frame(read_shards(shard_paths), metadata_keys) if return_dataframe else None
+    return df_output, _sum_stats(all_stats), shard_paths
+
+
+def process_candidate_rows(task, matcher, metadata_keys, clean_text=None, json_backend=None, text_store_dir=None):
+    """
+    Pool entry point for index queries; `task` is a (file path, list of line offsets) pair.
+
+    Returns:
+    - tuple: (list of row dicts, stats dict).
+    """
+    file_path, offsets = task
+    stats = {}
+    text_writer = None
+    if text_store_dir is not None:
+        text_writer = TextStoreWriter(text_store_dir, segment_name((file_path, offsets[0], None)) + '-candidates')
+    try:
+        output_data = list(iter_file_matches(file_path, matcher, metadata_keys, clean_text, stats, json_backend=json_backend,
+                                             text_writer=text_writer, line_offsets=offsets))
+    finally:
+        if text_writer is not None:
+            text_writer.close()
+    return output_data, stats
+
+
+def filter_candidates(locations, total_texts, matcher, metadata_keys, clean_text=None, num_processes=None,
+                      json_backend=None, text_store_dir=None, batch_size=1000):
+    """
+    Verify the metric regexes on candidate documents only, e.g. the ones an inverted index selected.
+
+    Parameters:
+    - locations (dict): {file path: sorted byte offsets of the candidate lines}, from `InvertedIndex.locate`.
+      Rows follow the order of the files in it.
+    - total_texts (int): Number of texts in the whole corpus, reported as 'total_texts'.
+    - matcher, metadata_keys, clean_text, json_backend, text_store_dir: As for `filter_files`.
+    - num_processes (int, optional): Worker processes. Defaults to the number of CPUs available to this process.
+    - batch_size (int, optional): Candidate lines per task. Defaults to 1000.
+
+    Returns:
+    - tuple: (DataFrame, stats dict with 'total_texts', 'prefiltered_texts' and 'candidate_texts').
+    """
+    if num_processes is None:
+        num_processes = available_cpus()
+    tasks = [(path, offsets[i:i + batch_size]) for path, offsets in locations.items()
+             for i in range(0, len(offsets), batch_size)]
+    process_partial = partial(process_candidate_rows, matcher=matcher, metadata_keys=metadata_keys, clean_text=clean_text,
+                              json_backend=json_backend, text_store_dir=text_store_dir)
+    with Pool(num_processes) as p:
+        results = p.map(process_partial, tasks, chunksize=1)
+    output_data = [item for sublist, _ in results for item in sublist]
+    stats = _sum_stats(task_stats for _, task_stats in results)
+    stats['candidate_texts'] = stats['total_texts']
+    stats['total_texts'] = total_texts
+    print(f"Index selected {stats['candidate_texts']} of {total_texts} texts as candidates.")
+    return finalize_output_frame(pd.DataFrame(output_data), metadata_keys), stats
+
+
+def _sum_stats(stats_list):
+    totals = {'total_texts': 0, 'prefiltered_texts': 0}
+    for stats in stats_list:
+        for key, value in stats.items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def report_stats(df_output, stats):
+    """
+    Print the prefilter counter and attach the run counters to the DataFrame's attrs.
+    """
+    if stats['prefiltered_texts']:
+        share = stats['prefiltered_texts'] / max(1, stats['total_texts'])
+        print(f"Prefilter rejected {stats['prefiltered_texts']} of {stats['total_texts']} texts ({share:.1%}) before decoding.")
+    if df_output is not None:
+        df_output.attrs.update(stats)
+
+
+def save_filter_output(df_output, total_texts, output_folder_path, filename, total_texts_filename,
+                       output_format=None, compression='zstd', row_group_size=None):
+    """
+    Write the total text count and, if given, the filtered DataFrame to the output folder.
+
+    The DataFrame is written with `write_table`: Parquet or Arrow IPC for .parquet/.arrow filenames
+    or an explicit `output_format`, CSV otherwise.
+    """
+    if not os.path.exists(output_folder_path):
+        os.makedirs(output_folder_path)
+    with open(os.path.join(output_folder_path, total_texts_filename), 'w') as f:
+        f.write(str(total_texts))
+    if df_output is not None:
+        write_table(df_output, os.path.join(output_folder_path, filename), table_format=output_format,
+                    compression=compression, row_group_size=row_group_size)
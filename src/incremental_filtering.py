@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import re
+
+import pandas as pd
+
+from filter_pipeline import collect_unit_rows, finalize_output_frame
+
+MANIFEST_FILENAME = 'manifest.json'
+
+
+def file_sha256(path, block_size=1 << 20):
+    """
+    SHA-256 of a file's content, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _settings_json(value):
+    # Compiled regexes by source and flags, so equal patterns give equal fingerprints
+    if isinstance(value, re.Pattern):
+        return {'pattern': value.pattern, 'flags': int(value.flags)}
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Cannot fingerprint {type(value).__name__}")
+
+
+def settings_fingerprint(settings):
+    """
+    SHA-256 of everything a filter result depends on besides the input files, e.g. the keyword lists or
+    regexes, metadata keys and LaTeX setting. Any change to them invalidates incremental results.
+
+    Parameters:
+    - settings (dict): JSON-serializable values; compiled regexes and sets are allowed.
+    """
+    payload = json.dumps(settings, sort_keys=True, default=_settings_json)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load_manifest(state_dir):
+    """
+    Read the manifest of an incremental filter state folder.
+
+    Returns:
+    - dict: 'settings' fingerprint and 'files' mapping input path to its fingerprint (size, mtime, sha256),
+      counters (total_texts, prefiltered_texts) and result file; empty if there is no manifest.
+    """
+    path = os.path.join(state_dir, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return {'settings': None, 'files': {}}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_manifest(state_dir, manifest):
+    """
+    Write the manifest atomically, so an interrupted run leaves the previous or the new version.
+    """
+    path = os.path.join(state_dir, MANIFEST_FILENAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def _result_filename(path):
+    return hashlib.sha1(path.encode('utf-8')).hexdigest()[:16] + '.jsonl'
+
+
+def file_unchanged(path, entry):
+    """
+    Whether an input file still matches its manifest entry. Only a file with the same size but a new
+    mtime is hashed; a matching hash updates the entry's mtime.
+    """
+    if entry is None:
+        return False
+    file_stat = os.stat(path)
+    if file_stat.st_size != entry['size']:
+        return False
+    if file_stat.st_mtime == entry['mtime']:
+        return True
+    if file_sha256(path) == entry['sha256']:
+        entry['mtime'] = file_stat.st_mtime
+        return True
+    return False
+
+
+def incremental_filter_files(file_paths, matcher, metadata_keys, state_dir, settings, clean_text=None, num_processes=None,
+                             chunk_size=None, json_backend=None, text_store_dir=None):
+    """
+    Run the metric filter only over new and changed JSONL files and merge the results with earlier runs.
+
+    Parameters:
+    - file_paths (list of str): All input files of this run, e.g. every .jsonl file of a snapshot folder.
+    - matcher, metadata_keys, clean_text, num_processes, chunk_size, json_backend, text_store_dir: As for `filter_files`.
+    - state_dir (str): Folder holding one subfolder per settings fingerprint, each with a manifest and the rows
+      found per input file. Created if missing.
+    - settings (dict): Everything the results depend on besides the files, see `settings_fingerprint`.
+
+    Returns:
+    - tuple: (DataFrame of all files' rows, stats dict with 'total_texts', 'prefiltered_texts', and the
+      'processed_files', 'reused_files' and 'removed_files' counts).
+
+    Behavior:
+    - A file is reprocessed if it is new or its size or content changed; its previous rows are replaced.
+    - All reprocessed files are filtered together in one process pool, and the rows split per file.
+    - Files are fingerprinted before they are filtered, so a file changed during the run is reprocessed next time.
+    - Files no longer in `file_paths` are dropped from the results and totals.
+    - Results are kept per settings fingerprint, so switching back to an earlier keyword list or regex revision
+      reuses its results. Subfolders of settings no longer needed can be deleted by hand.
+    - With a text store, segment names start with the fingerprint, so the settings' segments do not replace
+      each other.
+    - text_ids are assigned over the merged rows, as in a full run (content hashes with a text store).
+    """
+    fingerprint = settings_fingerprint(settings)
+    state_dir = os.path.join(state_dir, fingerprint[:16])
+    os.makedirs(state_dir, exist_ok=True)
+    manifest = load_manifest(state_dir)
+    if manifest['settings'] != fingerprint:
+        manifest = {'settings': fingerprint, 'files': {}}
+
+    # Rows are merged in the order of file_paths, as a full run over them returns them
+    file_paths = [os.path.abspath(path) for path in file_paths]
+    stats = {'processed_files': 0, 'reused_files': 0, 'removed_files': 0}
+    for path in set(manifest['files']) - set(file_paths):
+        result_path = os.path.join(state_dir, manifest['files'].pop(path)['result_file'])
+        if os.path.exists(result_path):
+            os.remove(result_path)
+        stats['removed_files'] += 1
+
+    fingerprints = {}
+    for path in file_paths:
+        if file_unchanged(path, manifest['files'].get(path)):
+            stats['reused_files'] += 1
+            continue
+        file_stat = os.stat(path)
+        fingerprints[path] = {'size': file_stat.st_size, 'mtime': file_stat.st_mtime, 'sha256': file_sha256(path)}
+
+    if fingerprints:
+        changed_paths = list(fingerprints)
+        results = collect_unit_rows(changed_paths, matcher, metadata_keys, clean_text=clean_text, num_processes=num_processes,
+                                    chunk_size=chunk_size, json_backend=json_backend, text_store_dir=text_store_dir,
+                                    segment_prefix=fingerprint[:16] + '-')
+        for path in changed_paths:
+            file_results = [(rows, unit_stats) for unit_path, rows, unit_stats in results if unit_path == path]
+            # Rows carry the text (text_ids are assigned over the merged rows) or its content-derived store id
+            df_file = pd.DataFrame([row for rows, _ in file_results for row in rows])
+            result_file = _result_filename(path)
+            df_file.to_json(os.path.join(state_dir, result_file), orient='records', lines=True, force_ascii=False)
+            manifest['files'][path] = dict(fingerprints[path], result_file=result_file,
+                                           total_texts=sum(unit_stats['total_texts'] for _, unit_stats in file_results),
+                                           prefiltered_texts=sum(unit_stats['prefiltered_texts'] for _, unit_stats in file_results))
+            stats['processed_files'] += 1
+    save_manifest(state_dir, manifest)
+
+    frames = []
+    for path in file_paths:
+        result_path = os.path.join(state_dir, manifest['files'][path]['result_file'])
+        if os.path.getsize(result_path):
+            frames.append(pd.read_json(result_path, orient='records', lines=True, dtype=False, convert_dates=False))
+    df_output = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    stats['total_texts'] = sum(manifest['files'][path]['total_texts'] for path in file_paths)
+    stats['prefiltered_texts'] = sum(manifest['files'][path]['prefiltered_texts'] for path in file_paths)
+    print(f"Incremental filtering: {stats['processed_files']} files processed, {stats['reused_files']} reused, "
+          f"{stats['removed_files']} removed.")
+    return finalize_output_frame(df_output, metadata_keys), stats
@@ -0,0 +1,309 @@
+import argparse
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+from tqdm import tqdm
+
+from jsonl_io import JsonlReader, available_cpus, iter_jsonl_lines, plan_work_units
+from latex_cleaning import remove_latex_commands
+
+# Tokens are maximal runs of lowercase ASCII letters and digits. Keyword regexes only match between
+# non-word characters, so every keyword match covers whole tokens and tokenizes like the keyword.
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+TOKENIZER_VERSION = '1'
+# Version of the table layout; indexes of another version are rejected
+INDEX_FORMAT = '2'
+
+# Bound SQLite query parameters per statement
+_MAX_PARAMS = 900
+
+
+def tokenize(text):
+    """
+    Split a text into the index terms, in order.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _index_unit(unit, remove_latex, json_backend=None):
+    # Tokenize the documents of one (file path, start, end) work unit; returns the number of lines and
+    # (line offset, line length, {term: positions as uint32 bytes}) per document
+    file_path, start, end = unit
+    reader = JsonlReader(['text'], backend=json_backend)
+    documents = []
+    offset = start
+    num_lines = 0
+    for line in iter_jsonl_lines(file_path, start, end):
+        line_offset, offset = offset, offset + len(line)
+        num_lines += 1
+        if not line.strip():
+            continue
+        try:
+            text = reader.parse(line)['text']
+        except (ValueError, KeyError) as e:
+            print(f"Skipping line at byte {line_offset} of {file_path}: {e}")
+            continue
+        if remove_latex:
+            text = remove_latex_commands(text)
+        positions = defaultdict(list)
+        for position, term in enumerate(tokenize(text)):
+            positions[term].append(position)
+        documents.append((line_offset, len(line), {term: np.asarray(found, dtype='<u4').tobytes() for term, found in positions.items()}))
+    return file_path, num_lines, documents
+
+
+def build_index(input_folder_path, index_path, remove_latex=True, num_processes=None, chunk_size=None, json_backend=None):
+    """
+    Tokenize every text of a folder of JSONL files once into an on-disk inverted index.
+
+    Parameters:
+    - input_folder_path (str): Folder with the .jsonl files, as passed to `jsonl_folder_filtering`.
+    - index_path (str): SQLite file of the index. An existing index is replaced once the new one is complete.
+    - remove_latex (bool, optional): Whether texts are cleaned of LaTeX commands before tokenizing. Must
+      match the `remove_latex` of the filter runs that query the index. Defaults to True.
+    - num_processes (int, optional): Tokenizing worker processes. Defaults to the available CPUs.
+    - chunk_size (int, optional): Target size in bytes of each work unit. See `plan_work_units`.
+    - json_backend (str, optional): "simdjson", "orjson" or "json". Defaults to the fastest available one.
+
+    Returns:
+    - int: Number of indexed documents.
+
+    Behavior:
+    - Tables: files (path, size, mtime, number of lines), docs (file and byte offset/length of the JSONL line),
+      terms (term, document frequency) and postings (term, doc, token positions as little-endian uint32).
+    - Workers tokenize byte ranges of the files in parallel; the parent process assigns ids and writes.
+    """
+    num_processes = num_processes or available_cpus()
+    file_paths = sorted(os.path.abspath(os.path.join(input_folder_path, name))
+                        for name in os.listdir(input_folder_path) if name.endswith('.jsonl'))
+    units = sorted(plan_work_units(file_paths, num_processes, chunk_size), key=lambda unit: unit[:2])
+
+    tmp_path = index_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.executescript(
+        "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);"
+        "CREATE TABLE files (file_id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, mtime REAL, lines INTEGER DEFAULT 0);"
+        "CREATE TABLE docs (doc_id INTEGER PRIMARY KEY, file_id INTEGER, offset INTEGER, length INTEGER);"
+        "CREATE TABLE terms (term_id INTEGER PRIMARY KEY, term TEXT UNIQUE, doc_freq INTEGER);"
+        "CREATE TABLE postings (term_id INTEGER, doc_id INTEGER, positions BLOB);"
+    )
+    connection.executemany("INSERT INTO meta VALUES (?, ?)",
+                           [('remove_latex', str(bool(remove_latex))), ('tokenizer', TOKENIZER_VERSION),
+                            ('format', INDEX_FORMAT)])
+    file_ids = {}
+    for path in file_paths:
+        file_stat = os.stat(path)
+        file_ids[path] = connection.execute("INSERT INTO files (path, size, mtime) VALUES (?, ?, ?)",
+                                            (path, file_stat.st_size, file_stat.st_mtime)).lastrowid
+
+    vocabulary = {}
+    doc_freq = defaultdict(int)
+    num_docs = 0
+    index_partial = partial(_index_unit, remove_latex=remove_latex, json_backend=json_backend)
+    with Pool(num_processes) as p:
+        # Units come back in file and offset order, so doc ids follow the corpus order
+        for file_path, num_lines, documents in tqdm(p.imap(index_partial, units), total=len(units), desc="Indexing"):
+            # Every line counts towards the file's texts, as in a full scan, including blank and unparsable ones
+            connection.execute("UPDATE files SET lines = lines + ? WHERE file_id = ?", (num_lines, file_ids[file_path]))
+            postings = []
+            for line_offset, length, positions in documents:
+                num_docs += 1
+                connection.execute("INSERT INTO docs VALUES (?, ?, ?, ?)", (num_docs, file_ids[file_path], line_offset, length))
+                for term, term_positions in positions.items():
+                    term_id = vocabulary.setdefault(term, len(vocabulary) + 1)
+                    doc_freq[term_id] += 1
+                    postings.append((term_id, num_docs, term_positions))
+            connection.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+            connection.commit()
+
+    connection.executemany("INSERT INTO terms VALUES (?, ?, ?)",
+                           ((term_id, term, doc_freq[term_id]) for term, term_id in vocabulary.items()))
+    # Indexes are created after the bulk load, which is much faster than maintaining them per insert
+    connection.execute("CREATE INDEX postings_term ON postings (term_id, doc_id)")
+    connection.commit()
+    connection.close()
+    os.replace(tmp_path, index_path)
+    print(f"Indexed {num_docs} texts with {len(vocabulary)} distinct terms into {index_path}")
+    return num_docs
+
+
+class InvertedIndex:
+    """
+    Read access to an index written by `build_index`, resolving keyword and substring queries to
+    candidate documents.
+
+    Candidates are a superset of the documents the corresponding regexes match in the cleaned texts,
+    so verifying the regexes on the candidates only gives the same result as a full scan.
+
+    Parameters:
+    - index_path (str): SQLite file of the index.
+    """
+
+    def __init__(self, index_path):
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"No index at {index_path}; build it with inverted_index.py first.")
+        self.index_path = index_path
+        self._connection = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+        self.meta = dict(self._connection.execute("SELECT key, value FROM meta"))
+        self.num_docs = self._connection.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+        self.paths = [path for path, in self._connection.execute("SELECT path FROM files ORDER BY file_id")]
+
+    @property
+    def total_texts(self):
+        """
+        Number of lines of the indexed files, i.e. the 'total_texts' of a full scan. Unlike `num_docs`,
+        this includes blank and unparsable lines.
+        """
+        return self._connection.execute("SELECT COALESCE(SUM(lines), 0) FROM files").fetchone()[0]
+
+    def check_compatible(self, remove_latex, file_paths):
+        """
+        Raise ValueError if the index was built with another LaTeX setting or tokenizer, over another set
+        of files than `file_paths`, or if any indexed file changed since, as its results would no longer
+        match a full scan of `file_paths`.
+        """
+        if self.meta.get('format') != INDEX_FORMAT:
+            raise ValueError("The index was built by an older version of inverted_index.py; rebuild it.")
+        if self.meta.get('remove_latex') != str(bool(remove_latex)):
+            raise ValueError(f"The index was built with remove_latex={self.meta.get('remove_latex')}; rebuild it or match the setting.")
+        if self.meta.get('tokenizer') != TOKENIZER_VERSION:
+            raise ValueError("The index was built with another tokenizer version; rebuild it.")
+        requested = {os.path.abspath(path) for path in file_paths}
+        indexed = set(self.paths)
+        if requested != indexed:
+            missing = sorted(requested - indexed)
+            extra = sorted(indexed - requested)
+            example = f"{missing[0]} is not indexed" if missing else f"{extra[0]} is indexed but not among the input files"
+            raise ValueError(f"The index covers other files than the input ({len(missing)} not indexed, {len(extra)} "
+                             f"not in the input), e.g. {example}; rebuild it over the input folder.")
+        stale = []
+        for path, size, mtime in self._connection.execute("SELECT path, size, mtime FROM files"):
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                stale.append(path)
+                continue
+            if file_stat.st_size != size or file_stat.st_mtime != mtime:
+                stale.append(path)
+        if stale:
+            raise ValueError(f"{len(stale)} indexed files changed or disappeared since the index was built, e.g. {stale[0]}; rebuild it.")
+
+    def _term_ids(self, terms):
+        rows = []
+        for i in range(0, len(terms), _MAX_PARAMS):
+            chunk = terms[i:i + _MAX_PARAMS]
+            rows.extend(self._connection.execute(
+                f"SELECT term, term_id, doc_freq FROM terms WHERE term IN ({','.join('?' * len(chunk))})", chunk))
+        return {term: (term_id, doc_freq) for term, term_id, doc_freq in rows}
+
+    def _postings(self, term_id, doc_ids=None):
+        # {doc id: positions} of a term, restricted to `doc_ids` if given
+        rows = self._connection.execute("SELECT doc_id, positions FROM postings WHERE term_id = ?", (term_id,))
+        return {doc_id: np.frombuffer(positions, dtype='<u4') for doc_id, positions in rows
+                if doc_ids is None or doc_id in doc_ids}
+
+    def phrase_docs(self, tokens):
+        """
+        Return the set of documents in which the tokens occur consecutively, in order.
+        """
+        term_ids = self._term_ids(list(set(tokens)))
+        if len(term_ids) < len(set(tokens)):
+            return set()
+        # Start from the rarest term, and only load the others' positions for the remaining documents
+        order = sorted(range(len(tokens)), key=lambda i: term_ids[tokens[i]][1])
+        first = order[0]
+        starts = {doc_id: positions.astype(np.int64) - first for doc_id, positions in self._postings(term_ids[tokens[first]][0]).items()}
+        for i in order[1:]:
+            if not starts:
+                break
+            postings = self._postings(term_ids[tokens[i]][0], starts)
+            starts = {doc_id: np.intersect1d(doc_starts, postings[doc_id].astype(np.int64) - i, assume_unique=True)
+                      for doc_id, doc_starts in starts.items() if doc_id in postings}
+            starts = {doc_id: doc_starts for doc_id, doc_starts in starts.items() if len(doc_starts)}
+        return set(starts)
+
+    def keyword_candidates(self, keywords):
+        """
+        Return the documents that may match any of the literal or phrase keywords, or None if some
+        keyword has no index terms (e.g. only punctuation) and every document is a candidate.
+        """
+        candidates = set()
+        for keyword in keywords:
+            tokens = tokenize(keyword)
+            if not tokens:
+                return None
+            candidates |= self.phrase_docs(tokens)
+        return candidates
+
+    def substring_candidates(self, terms):
+        """
+        Return the documents containing any of the literal terms, e.g. regex prefilter terms, anywhere
+        in a token, or None if some term has no letters or digits and every document is a candidate.
+
+        Every occurrence of a term's longest alphanumeric word lies inside one token, so the vocabulary
+        is scanned for tokens containing it and their documents are returned.
+        """
+        words = []
+        for term in terms:
+            term_words = tokenize(term)
+            if not term_words:
+                return None
+            words.append(max(term_words, key=len))
+        clause = ' OR '.join(['instr(term, ?) > 0'] * len(words))
+        term_ids = [term_id for term_id, in self._connection.execute(f"SELECT term_id FROM terms WHERE {clause}", words)]
+        candidates = set()
+        for i in range(0, len(term_ids), _MAX_PARAMS):
+            chunk = term_ids[i:i + _MAX_PARAMS]
+            candidates.update(doc_id for doc_id, in self._connection.execute(
+                f"SELECT DISTINCT doc_id FROM postings WHERE term_id IN ({','.join('?' * len(chunk))})", chunk))
+        return candidates
+
+    def locate(self, doc_ids=None):
+        """
+        Return the JSONL lines of documents as {file path: sorted byte offsets}; None locates all documents.
+        """
+        locations = defaultdict(list)
+        query = "SELECT files.path, docs.offset FROM docs JOIN files USING (file_id)"
+        if doc_ids is None:
+            rows = self._connection.execute(query)
+        else:
+            doc_ids = sorted(doc_ids)
+            rows = (row for i in range(0, len(doc_ids), _MAX_PARAMS)
+                    for row in self._connection.execute(
+                        f"{query} WHERE docs.doc_id IN ({','.join('?' * len(doc_ids[i:i + _MAX_PARAMS]))})",
+                        doc_ids[i:i + _MAX_PARAMS]))
+        for path, offset in rows:
+            locations[path].append(offset)
+        return {path: sorted(offsets) for path, offsets in locations.items()}
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+if __name__ == '__main__':
+    # Initializing argparse
+    parser = argparse.ArgumentParser(description='Build an inverted index over a folder of JSONL texts for index-backed filtering')
+    parser.add_argument('-input', action="store", default='/path/to/jsonl_dir', dest="input_folder_path", type=str, help='Folder with the .jsonl files')
+    parser.add_argument('-index', action="store", default='./corpus_index.sqlite', dest="index_path", type=str, help='Output SQLite index file')
+    parser.add_argument('-keep_latex', action="store_true", dest="keep_latex", help='Tokenize the texts without removing LaTeX commands')
+    parser.add_argument('-workers', action="store", default=None, dest="num_processes", type=int, help='Number of worker processes (defaults to all CPUs)')
+    parser.add_argument('-json_backend', action="store", default=None, dest="json_backend", type=str, help='JSON parser: simdjson, orjson or json')
+    arguments = parser.parse_args()
+
+    build_index(arguments.input_folder_path, arguments.index_path, remove_latex=not arguments.keep_latex,
+                num_processes=arguments.num_processes, json_backend=arguments.json_backend)
@@ -0,0 +1,316 @@
+import json
+import os
+
+# Smallest byte range worth handing to a worker on its own
+MIN_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def available_cpus():
+    """
+    Return the number of CPUs this process may run on, honouring affinity masks where supported.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def split_jsonl_file(file_path, chunk_size):
+    """
+    Split a JSONL file into byte ranges of roughly `chunk_size` bytes that start and end on line boundaries.
+
+    Parameters:
+    - file_path (str): Path to the .jsonl file.
+    - chunk_size (int): Target size of each range in bytes.
+
+    Returns:
+    - list of tuple: (file_path, start, end) ranges covering the whole file, end exclusive.
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    file_size = os.path.getsize(file_path)
+    if file_size <= chunk_size:
+        return [(file_path, 0, file_size)]
+
+    boundaries = [0]
+    with open(file_path, 'rb') as file:
+        target = chunk_size
+        while target < file_size:
+            # Step back one byte so a target that already sits on a line start is kept
+            file.seek(target - 1)
+            file.readline()
+            boundary = file.tell()
+            if boundary >= file_size:
+                break
+            boundaries.append(boundary)
+            target = boundary + chunk_size
+    boundaries.append(file_size)
+    return [(file_path, start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+def plan_work_units(file_paths, num_workers, chunk_size=None):
+    """
+    Turn a list of JSONL files into evenly sized byte-range work units for a process pool.
+
+    Parameters:
+    - file_paths (list of str): JSONL files to split.
+    - num_workers (int): Number of workers that will consume the units.
+    - chunk_size (int, optional): Target unit size in bytes. Defaults to a quarter of each worker's
+      share of the total input, but never less than MIN_CHUNK_SIZE.
+
+    Returns:
+    - list of tuple: (file_path, start, end) ranges, largest first so stragglers are small.
+      Use `file_order` to put results back into the order of the files and lines.
+    """
+    if chunk_size is not None and chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    if chunk_size is None:
+        total_size = sum(os.path.getsize(path) for path in file_paths)
+        chunk_size = max(MIN_CHUNK_SIZE, total_size // max(1, num_workers * 4))
+    units = [unit for path in file_paths for unit in split_jsonl_file(path, chunk_size)]
+    units.sort(key=lambda unit: unit[2] - unit[1], reverse=True)
+    return units
+
+
+def file_order(file_paths):
+    """
+    Sort key that orders work units by the position of their file in `file_paths`, then by start offset.
+    """
+    rank = {path: i for i, path in enumerate(file_paths)}
+    return lambda unit: (rank[unit[0]], unit[1])
+
+
+def available_json_backends():
+    """
+    Return the names of the JSON parsers that can be imported, fastest first.
+    """
+    backends = []
+    for name in ('simdjson', 'orjson'):
+        try:
+            __import__(name)
+            backends.append(name)
+        except ImportError:
+            pass
+    backends.append('json')
+    return backends
+
+
+def _materialize(value):
+    # simdjson returns lazy proxies for containers; turn them into plain Python objects
+    if hasattr(value, 'as_dict'):
+        return value.as_dict()
+    if hasattr(value, 'as_list'):
+        return value.as_list()
+    return value
+
+
+class JsonlReader:
+    """
+    Parser for JSONL lines that uses the fastest available JSON backend and can extract only selected fields.
+
+    Parameters:
+    - fields (list of str, optional): Fields to extract. Nested fields use dots, e.g. "meta.arxiv_id".
+      Missing fields are left out of the result. None returns the whole record.
+    - backend (str, optional): "simdjson", "orjson" or "json". Defaults to the first available of these.
+
+    Behavior:
+    - With simdjson, lines are parsed lazily and only the requested fields are converted to Python
+      objects, so long unused values (e.g. full texts) are never copied.
+    - With orjson and json the whole line is parsed and the requested fields are picked from it.
+    - Lines a fast backend rejects are parsed again with json, which also accepts e.g. NaN and lone
+      surrogate escapes, so every backend accepts the same lines.
+    - Invalid lines raise ValueError (json.JSONDecodeError for the json and orjson backends).
+    """
+
+    def __init__(self, fields=None, backend=None):
+        self.backend = backend or available_json_backends()[0]
+        self.fields = [tuple(field.split('.')) for field in fields] if fields is not None else None
+        if self.backend == 'simdjson':
+            import simdjson
+            self._parser = simdjson.Parser()
+            self._loads = self._parser.parse
+        elif self.backend == 'orjson':
+            import orjson
+            self._loads = orjson.loads
+        elif self.backend == 'json':
+            self._loads = json.loads
+        else:
+            raise ValueError(f"Unknown JSON backend: {self.backend}")
+
+    def parse(self, line):
+        """
+        Parse one line (bytes or str) and return a dict with the requested fields.
+        """
+        try:
+            document = self._loads(line)
+        except ValueError:
+            if self.backend == 'json':
+                raise
+            document = json.loads(line)
+        if self.fields is None:
+            return _materialize(document)
+
+        record = {}
+        for path in self.fields:
+            value = document
+            try:
+                for key in path:
+                    value = value[key]
+            except (KeyError, TypeError, IndexError):
+                continue
+            target = record
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = _materialize(value)
+        return record
+
+    def iter_file(self, file_path, start=0, end=None):
+        """
+        Yield the parsed records of a JSONL file, or of the byte range [start, end) of it.
+        """
+        for line in iter_jsonl_lines(file_path, start, end):
+            if line.strip():
+                yield self.parse(line)
+
+
+def iter_jsonl_lines(file_path, start=0, end=None):
+    """
+    Yield the raw lines (bytes) of a JSONL file whose first byte lies in [start, end).
+    """
+    with open(file_path, 'rb', buffering=1024 * 1024) as file:
+        file.seek(start)
+        position = start
+        for line in file:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            yield line
+
+
+def iter_jsonl_lines_at(file_path, offsets):
+    """
+    Yield the raw lines (bytes) of a JSONL file that start at the given byte offsets, in the order given.
+    """
+    with open(file_path, 'rb') as file:
+        for offset in offsets:
+            file.seek(offset)
+            yield file.readline()
+
+
+class ShardWriter:
+    """
+    Buffered writer that spreads rows over numbered shard files.
+
+    Rows are held in memory until `buffer_size` of them have accumulated and are then appended
+    to the current shard, so memory stays bounded by the buffer regardless of how many rows are
+    written. A new shard is started every `shard_size` rows.
+
+    Parameters:
+    - output_dir (str): Folder to write the shard files into. Created if it does not exist.
+    - prefix (str): Filename prefix of the shards, e.g. "arxiv_000" gives "arxiv_000-00000.jsonl".
+    - buffer_size (int, optional): Number of rows kept in memory before flushing. Defaults to 1000.
+    - shard_size (int, optional): Maximum number of rows per shard file. Defaults to 100000.
+    - shard_format (str, optional): "jsonl" or "parquet". Parquet requires pyarrow. Defaults to "jsonl".
+    """
+
+    def __init__(self, output_dir, prefix, buffer_size=1000, shard_size=100000, shard_format='jsonl'):
+        if shard_format not in ('jsonl', 'parquet'):
+            raise ValueError(f"Unsupported shard format: {shard_format}")
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.buffer_size = max(1, buffer_size)
+        self.shard_size = max(self.buffer_size, shard_size)
+        self.shard_format = shard_format
+        self.paths = []
+        self.rows_written = 0
+        self._buffer = []
+        self._rows_in_shard = 0
+        self._parquet_writer = None
+
+    def write(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        while self._buffer:
+            if not self.paths or self._rows_in_shard >= self.shard_size:
+                self._start_shard()
+            room = self.shard_size - self._rows_in_shard
+            rows, self._buffer = self._buffer[:room], self._buffer[room:]
+            if self.shard_format == 'jsonl':
+                with open(self.paths[-1], 'a', encoding='utf-8') as file:
+                    file.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+            else:
+                self._write_parquet(rows)
+            self._rows_in_shard += len(rows)
+            self.rows_written += len(rows)
+
+    def _start_shard(self):
+        self._close_parquet()
+        path = os.path.join(self.output_dir, f"{self.prefix}-{len(self.paths):05d}.{self.shard_format}")
+        if os.path.exists(path):
+            os.remove(path)
+        self.paths.append(path)
+        self._rows_in_shard = 0
+
+    def _write_parquet(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist(rows)
+        if self._parquet_writer is not None:
+            try:
+                table = table.cast(self._parquet_writer.schema)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, ValueError):
+                # Column types changed (e.g. a metadata key that was always null so far);
+                # continue in a fresh shard with the new schema
+                self._start_shard()
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self.paths[-1], table.schema)
+        self._parquet_writer.write_table(table)
+
+    def _close_parquet(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def close(self):
+        """
+        Flush the remaining rows and return the list of shard paths written.
+        """
+        self.flush()
+        self._close_parquet()
+        return self.paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_shards(paths, columns=None):
+    """
+    Read shard files written by `ShardWriter` back into a pandas DataFrame.
+
+    Parameters:
+    - paths (list of str): Paths of .jsonl and/or .parquet shards.
+    - columns (list of str, optional): Columns to keep. Parquet shards only read these columns. Defaults to all.
+
+    Returns:
+    - pandas.DataFrame: The concatenated rows of all shards, in the order given.
+    """
+    import pandas as pd
+    from table_io import read_table
+
+    frames = []
+    for path in paths:
+        if path.endswith('.parquet'):
+            frames.append(read_table(path, columns=columns))
+        else:
+            frame = pd.read_json(path, lines=True, dtype=False, convert_dates=False)
+            frames.append(frame[columns] if columns is not None else frame)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,93 @@
+import re
+
+# Each token is an optional run of LaTeX commands (dropped) followed by one of:
+#   1. a "\n", "\r" or "\t" escape, which becomes a space
+#   2. a backslash that does not start a command
+#   3. "$", which opens or closes inline math
+#   4. a run of plain text
+# A run of commands at the very end of the text matches on its own with no group set.
+_TOKEN_PATTERN = re.compile(
+    r'(?:\\[a-mo-qsu-zA-Z][a-zA-Z]*(?![a-zA-Z]))*'
+    r'(?:(\\[nrt])|(\\)(?![a-zA-Z])|(\$)|([^\\$]+))'
+    r'|\\[a-zA-Z]+'
+)
+_WHITESPACE_TABLE = str.maketrans('\n\r\t', '   ')
+_SPACE, _BACKSLASH, _DOLLAR, _TEXT = 1, 2, 3, 4
+
+
+def remove_latex_commands_chained(s):
+    """
+    Reference implementation of `remove_latex_commands` as a chain of `re.sub` passes.
+
+    Kept for equivalence checks and benchmarks; use `remove_latex_commands` in the pipeline.
+    """
+    if s is None:
+        return ''
+    s = re.sub(r'\\[nrt]|[\n\r\t]', ' ', s)
+    s = re.sub(r'\\[a-zA-Z]+', '', s)
+    s = re.sub(r'\\.', '', s)
+    s = re.sub(r'\\begin\{.*?\}.*?\\end\{.*?\}', '', s, flags=re.DOTALL)
+    s = re.sub(r'\$.*?\$', '', s)
+    s = re.sub(r'\\[.*?\\]', '', s)
+    s = re.sub(r'\\\(.*?\\\)', '', s)
+    s = re.sub(r'\\\[.*?\\\]', '', s)
+    s = re.sub(r'(?<=\W)\\|\\(?=\W)', '', s)
+    return s.strip()
+
+
+def remove_latex_commands(s):
+    """
+    Remove LaTeX commands from a string in a single traversal.
+
+    Produces exactly the same output as `remove_latex_commands_chained`, but tokenizes the text
+    once instead of running ten `re.sub` passes that each copy the whole document.
+
+    Parameters:
+    - s (str): A string potentially containing LaTeX commands.
+
+    Returns:
+    - str: The input string with LaTeX commands and inline math removed.
+
+    Behavior:
+    - "\\n", "\\r", "\\t" escapes and raw newlines/tabs become spaces.
+    - Commands (a backslash followed by letters) are dropped. Any other backslash is dropped
+      together with the character that follows it once commands are gone.
+    - Text between pairs of "$" is dropped; an unmatched final "$" and what follows it is kept.
+    - A trailing lone backslash is dropped if it follows a non-word character, and the result is stripped.
+    """
+    if s is None:
+        return ''
+
+    out = []
+    pending_backslash = False
+    math_start = -1
+
+    for match in _TOKEN_PATTERN.finditer(s):
+        kind = match.lastindex
+        if kind is None:
+            continue
+        if pending_backslash:
+            # The escaped character is removed along with its backslash
+            pending_backslash = False
+            if kind == _TEXT:
+                out.append(match.group(_TEXT)[1:])
+        elif kind == _TEXT:
+            out.append(match.group(_TEXT))
+        elif kind == _SPACE:
+            out.append(' ')
+        elif kind == _BACKSLASH:
+            pending_backslash = True
+        elif math_start < 0:
+            math_start = len(out)
+            out.append('$')
+        else:
+            del out[math_start:]
+            math_start = -1
+
+    if pending_backslash:
+        out.append('\\')
+    # Raw newlines and tabs map one-to-one onto spaces, so they are converted once at the end
+    result = ''.join(out).translate(_WHITESPACE_TABLE)
+    if len(result) > 1 and result[-1] == '\\' and not (result[-2].isalnum() or result[-2] == '_'):
+        result = result[:-1]
+    return result.strip()
@@ -0,0 +1,173 @@
+import re
+
+# Inline flag letters that may be used in a scoped ``(?flags:...)`` group
+_FLAG_LETTERS = [
+    (re.IGNORECASE, 'i'),
+    (re.MULTILINE, 'm'),
+    (re.DOTALL, 's'),
+    (re.VERBOSE, 'x'),
+    (re.ASCII, 'a'),
+]
+_LETTER_FLAGS = {letter: flag for flag, letter in _FLAG_LETTERS}
+_LEADING_FLAGS = re.compile(r'^\(\?([aiLmsux]+)\)')
+
+
+def keyword_alternation(keywords):
+    """
+    Build a regex alternation for a list of literal keywords, factored into a prefix trie.
+
+    Parameters:
+    - keywords (list of str): Literal keywords to match.
+
+    Returns:
+    - str: A regex fragment (without surrounding group) matching exactly the given keywords.
+
+    Behavior:
+    - Keywords sharing a prefix share a single branch, so the regex engine tests each
+      prefix once per position instead of once per keyword.
+    - Matches the same spans as `'|'.join(map(re.escape, keywords))`: of two keywords that can match
+      at the same position, one is a prefix of the other, and such keywords are tried in list order.
+    """
+    suffixes = list(dict.fromkeys(keyword for keyword in keywords if keyword))
+    return _trie_to_regex(suffixes) if suffixes else '(?!)'
+
+
+def prefilter_terms_from_keywords(keywords):
+    """
+    Derive literal prefilter terms from a keyword list.
+
+    Every keyword contributes its longest alphanumeric word, so any text matching the keyword
+    contains at least one of the returned terms. Terms containing another term are dropped.
+
+    Parameters:
+    - keywords (list of str): Literal keywords, as passed to `keyword_alternation`.
+
+    Returns:
+    - list of str: Lowercase terms suitable for `MetricMatcher(prefilter_terms=...)`.
+    """
+    terms = set()
+    for keyword in keywords:
+        words = re.findall(r'[a-z0-9]+', keyword.lower())
+        if not words:
+            # Keywords without any word character cannot be prefiltered safely
+            return []
+        terms.add(max(words, key=len))
+    return sorted(term for term in terms if not any(other != term and other in term for other in terms))
+
+
+def _trie_to_regex(suffixes):
+    # Alternation of distinct suffixes in priority order. Branches starting with different characters never
+    # match at the same position, so only the empty suffix (a keyword ending here) splits the branches into
+    # those tried before it and those tried after it.
+    end = suffixes.index('') if '' in suffixes else len(suffixes)
+    options = []
+    for part in (suffixes[:end], suffixes[end + 1:]):
+        branches = {}
+        for suffix in part:
+            branches.setdefault(suffix[0], []).append(suffix[1:])
+        options.append([re.escape(char) + _trie_to_regex(rest) for char, rest in sorted(branches.items())])
+    before, after = options
+    if end == len(suffixes):
+        return before[0] if len(before) == 1 else '(?:' + '|'.join(before) + ')'
+    if not before and not after:
+        return ''
+    if not after:
+        return '(?:' + '|'.join(before) + ')?'
+    if not before:
+        return '(?:' + '|'.join(after) + ')??'
+    return '(?:' + '|'.join(before + [''] + after) + ')'
+
+
+def _split_pattern(pattern):
+    """
+    Return the source of a pattern with its leading global inline flags removed, and those flags.
+    """
+    if isinstance(pattern, re.Pattern):
+        source, flags = pattern.pattern, pattern.flags
+    else:
+        source, flags = pattern, 0
+    match = _LEADING_FLAGS.match(source)
+    while match:
+        for letter in match.group(1):
+            flags |= _LETTER_FLAGS.get(letter, 0)
+        source = source[match.end():]
+        match = _LEADING_FLAGS.match(source)
+    return source, flags
+
+
+class MetricMatcher:
+    """
+    Single-pass matcher reporting which metric families (e.g. AUROC, AUPRC) occur in a text.
+
+    All families are combined into one compiled alternation of named groups, so a document is
+    scanned once regardless of how many families are searched for. Once a family has been found
+    it is dropped from the alternation and the scan resumes at the position of the last hit,
+    which keeps the result identical to searching every family separately.
+
+    An optional literal prefilter lets callers reject raw JSONL lines before decoding and cleaning
+    them: `might_match` returns False when none of the prefilter terms occurs in the line
+    (ASCII case-insensitive). The terms must be chosen so that every match of every family
+    contains one of them; LaTeX that splits a term (e.g. "AU$x$C") is not accounted for.
+
+    Parameters:
+    - families (dict): Mapping of family name to a regex string or compiled pattern. Names must be
+      valid Python identifiers. Patterns must not use numbered backreferences.
+    - prefilter_terms (list of str, optional): Literal terms for `might_match`. None disables the prefilter.
+    """
+
+    def __init__(self, families, prefilter_terms=None):
+        self.families = list(families)
+        self.prefilter_terms = None
+        if prefilter_terms:
+            self.prefilter_terms = tuple(sorted({term.lower().encode('utf-8') for term in prefilter_terms}, key=len))
+        self._sources = {}
+        for name, pattern in families.items():
+            if not name.isidentifier():
+                raise ValueError(f"Family name '{name}' is not a valid regex group name.")
+            source, flags = _split_pattern(pattern)
+            letters = ''.join(letter for flag, letter in _FLAG_LETTERS if flags & flag)
+            self._sources[name] = f"(?P<{name}>(?{letters}:{source}))" if letters else f"(?P<{name}>{source})"
+        self._compiled = {}
+
+    def _pattern_for(self, remaining):
+        pattern = self._compiled.get(remaining)
+        if pattern is None:
+            pattern = re.compile('|'.join(self._sources[name] for name in self.families if name in remaining))
+            self._compiled[remaining] = pattern
+        return pattern
+
+    def might_match(self, raw_line):
+        """
+        Cheap check on a raw (bytes) JSONL line; False means no family can match the line's text.
+        """
+        if self.prefilter_terms is None:
+            return True
+        lowered = raw_line.lower()
+        for term in self.prefilter_terms:
+            if term in lowered:
+                return True
+        return False
+
+    def search(self, text):
+        """
+        Scan a text once and return the set of family names with at least one match.
+        """
+        found = set()
+        remaining = frozenset(self.families)
+        pos = 0
+        while remaining:
+            match = self._pattern_for(remaining).search(text, pos)
+            if match is None:
+                break
+            hits = {name for name in remaining if match.group(name) is not None}
+            found |= hits
+            remaining = remaining - hits
+            pos = match.start()
+        return found
+
+    def contains(self, text):
+        """
+        Return a dict mapping every family name to whether it occurs in the text.
+        """
+        found = self.search(text)
+        return {name: name in found for name in self.families}
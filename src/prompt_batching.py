@@ -0,0 +1,178 @@
+import json
+import time
+
+import openai
+from openai import OpenAI
+
+from rate_limiting import parse_retry_after
+from prompt_messages import build_user_message
+from response_cache import response_cache_key
+
+BATCH_INSTRUCTIONS = (
+    "You will receive several context windows as a JSON list of objects with an \"id\" and a \"text\". "
+    "Treat every context window independently, exactly as if it had been sent on its own, and answer it "
+    "following the instructions above. Reply with a JSON object of the form "
+    "{\"results\": [{\"id\": <id>, \"response\": <your answer for that context window>}, ...]} "
+    "containing exactly one entry for every id."
+)
+
+
+def make_batches(items, batch_size):
+    """
+    Split a list into consecutive batches of at most `batch_size` items.
+    """
+    return [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+
+
+def build_batch_message(context_windows, introduction_statement_prompt=None, end_statement_prompt=None):
+    """
+    Build the user message for a batch of context windows, numbered 1..N.
+
+    Parameters:
+    - context_windows (list of str): The context windows of the batch.
+    - introduction_statement_prompt, end_statement_prompt (str, optional): v4 prompts, stated once for the whole batch.
+
+    Returns:
+    - str: The user message.
+    """
+    windows = [{"id": number, "text": context_window} for number, context_window in enumerate(context_windows, start=1)]
+    parts = [introduction_statement_prompt, BATCH_INSTRUCTIONS, json.dumps(windows, ensure_ascii=False), end_statement_prompt]
+    return "\n\n".join(part for part in parts if part)
+
+
+def parse_batch_response(content, num_windows):
+    """
+    Split a batched JSON answer into one response per context window.
+
+    Parameters:
+    - content (str): The model's reply.
+    - num_windows (int): Number of windows in the batch.
+
+    Returns:
+    - dict: Window number (1..num_windows) to response text, for every window that was answered exactly once.
+      Non-string answers are serialized as JSON.
+
+    Raises:
+    - ValueError: If the reply is not a JSON object with a "results" list.
+    """
+    data = json.loads(content)
+    results = data.get('results') if isinstance(data, dict) else None
+    if not isinstance(results, list):
+        raise ValueError("Batched response has no 'results' list.")
+    answers = {}
+    duplicates = set()
+    for result in results:
+        if not isinstance(result, dict) or 'response' not in result:
+            continue
+        try:
+            number = int(result.get('id'))
+        except (TypeError, ValueError):
+            continue
+        if not 1 <= number <= num_windows:
+            continue
+        if number in answers:
+            duplicates.add(number)
+        response = result['response']
+        answers[number] = response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
+    for number in duplicates:
+        del answers[number]
+    return answers
+
+
+def process_batch_with_gpt(batch, model, system_prompt, openai_api_key, fallback,
+                           introduction_statement_prompt=None, end_statement_prompt=None,
+                           max_retries=5, rate_limiter=None, cache=None):
+    """
+    Classify several context windows with one chat completion request.
+
+    Parameters:
+    - batch (list of tuple): (window id, context window) pairs.
+    - model (str): The model identifier.
+    - system_prompt (str): System-level instructions, sent once for the whole batch.
+    - openai_api_key (str): The API key for authenticating with OpenAI's services.
+    - fallback (callable): Called with a single context window for every window the batched answer does not
+      cover, e.g. a `functools.partial` of `process_with_gpt_with_retries`.
+    - introduction_statement_prompt, end_statement_prompt (str, optional): v4 prompts, sent once for the whole batch.
+    - max_retries (int, optional): Maximum attempts on rate limit errors. Defaults to 5.
+    - rate_limiter (rate_limiting.RateLimiter, optional): Shared request/token budget.
+    - cache (response_cache.ResponseCache, optional): Disk cache of per-window responses from batched requests.
+
+    Returns:
+    - dict: Window id to response text.
+
+    Behavior:
+    - Requests a JSON object response and validates that every window is answered exactly once.
+    - Windows missing from the answer, or all windows if the request fails or the reply is not valid JSON,
+      are sent again one by one through `fallback`.
+    - If every attempt is rate limited, the windows get an "Error: Rate limit exceeded." response instead of
+      being retried one by one, which would multiply the requests hitting the limit by the batch size. Error
+      responses are not cached or checkpointed as done, so the windows are retried on the next run.
+    """
+    responses = {}
+    cache_keys = {}
+    if cache is not None:
+        # Batched answers are cached apart from single-window answers to the same prompts
+        for window_id, context_window in batch:
+            user_message = build_user_message(context_window, introduction_statement_prompt, end_statement_prompt)
+            cache_keys[window_id] = response_cache_key(model, BATCH_INSTRUCTIONS + system_prompt, user_message)
+            cached_response = cache.get(cache_keys[window_id])
+            if cached_response is not None:
+                responses[window_id] = cached_response
+    remaining = [(window_id, context_window) for window_id, context_window in batch if window_id not in responses]
+    if not remaining:
+        return responses
+
+    user_message = build_batch_message([context_window for _, context_window in remaining],
+                                       introduction_statement_prompt, end_statement_prompt)
+    # Rate limits are retried below, so the client's own retries would only multiply the requests
+    client = OpenAI(api_key=openai_api_key, max_retries=0)
+    retry_delay = 0.5
+    max_retry_delay = 16
+    if rate_limiter is not None:
+        estimated_tokens = rate_limiter.request_tokens(system_prompt, user_message)
+    answers = {}
+    rate_limited = False
+    for attempt in range(max_retries):
+        try:
+            if rate_limiter is not None:
+                rate_limiter.wait(estimated_tokens)
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_message}
+                ],
+                response_format={"type": "json_object"}
+            )
+            if rate_limiter is not None:
+                rate_limiter.record_usage(estimated_tokens, response)
+            answers = parse_batch_response(response.choices[0].message.content, len(remaining))
+            rate_limited = False
+            break
+        except openai.RateLimitError as e:
+            rate_limited = True
+            if rate_limiter is not None:
+                rate_limiter.penalize(parse_retry_after(e.response, default=retry_delay))
+                continue
+            print(f"Rate limit reached, retrying in {retry_delay}")
+            time.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, max_retry_delay)
+        except Exception as e:
+            print(f"Batched request of {len(remaining)} windows failed ({e}); falling back to single requests.")
+            rate_limited = False
+            break
+
+    if rate_limited:
+        print(f"Batched request of {len(remaining)} windows was rate limited {max_retries} times; leaving them for the next run.")
+        for window_id, _ in remaining:
+            responses[window_id] = "Error: Rate limit exceeded."
+        return responses
+
+    for number, (window_id, context_window) in enumerate(remaining, start=1):
+        if number in answers:
+            responses[window_id] = answers[number]
+            if cache is not None:
+                cache.put(cache_keys[window_id], answers[number], model)
+        else:
+            responses[window_id] = fallback(context_window)
+    return responses
@@ -0,0 +1,9 @@
+def build_user_message(context_window, introduction_statement_prompt=None, end_statement_prompt=None):
+    """
+    Return the user message for a context window, wrapped in the v4 introduction/end prompts when given.
+
+    Shared by the live clients and the Batch API writer, so both send identical requests.
+    """
+    if introduction_statement_prompt is None and end_statement_prompt is None:
+        return context_window
+    return f"{introduction_statement_prompt or ''} {context_window} {end_statement_prompt or ''}"
@@ -0,0 +1,226 @@
+import asyncio
+import email.utils
+import threading
+import time
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Tokens the chat format adds around every message and around the reply
+_TOKENS_PER_MESSAGE = 4
+_TOKENS_PER_REPLY = 3
+_encodings = {}
+
+
+def _encoding_for(model):
+    encoding = _encodings.get(model)
+    if encoding is None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding('cl100k_base')
+        _encodings[model] = encoding
+    return encoding
+
+
+def estimate_tokens(text, model=None):
+    """
+    Estimate the number of tokens of a text.
+
+    Parameters:
+    - text (str): The text to count.
+    - model (str, optional): Model identifier used to pick the tokenizer.
+
+    Returns:
+    - int: The exact token count when `tiktoken` is installed, otherwise about one token per four characters.
+    """
+    if not text:
+        return 0
+    if tiktoken is not None:
+        return len(_encoding_for(model or 'gpt-4').encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def estimate_request_tokens(messages, model=None, expected_output_tokens=0):
+    """
+    Estimate the tokens a chat completion request counts against a tokens-per-minute limit.
+
+    Parameters:
+    - messages (list of dict): Chat messages with a 'content' field.
+    - model (str, optional): Model identifier used to pick the tokenizer.
+    - expected_output_tokens (int, optional): Tokens reserved for the reply. Defaults to 0.
+
+    Returns:
+    - int: Estimated prompt tokens plus `expected_output_tokens`.
+    """
+    prompt_tokens = sum(estimate_tokens(message.get('content') or '', model) + _TOKENS_PER_MESSAGE for message in messages)
+    return prompt_tokens + _TOKENS_PER_REPLY + expected_output_tokens
+
+
+def parse_retry_after(response, default=1.0):
+    """
+    Read the server's requested wait in seconds from a 429 response.
+
+    Parameters:
+    - response (httpx.Response or None): The rate-limited response.
+    - default (float, optional): Wait used when the response carries no usable header. Defaults to 1 second.
+
+    Returns:
+    - float: Seconds to wait, from 'retry-after-ms' or 'retry-after' (seconds or an HTTP date).
+    """
+    if response is None:
+        return default
+    headers = response.headers
+    try:
+        if headers.get('retry-after-ms') is not None:
+            return max(0.0, float(headers['retry-after-ms']) / 1000)
+        retry_after = headers.get('retry-after')
+        if retry_after is not None:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                retry_at = email.utils.parsedate_to_datetime(retry_after).timestamp()
+                return max(0.0, retry_at - time.time())
+    except (TypeError, ValueError):
+        pass
+    return default
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations instead of blocking.
+
+    `reserve` always takes the requested amount, letting the level go negative, and returns how
+    long the caller has to wait before the reservation is covered by the refill. Callers waiting
+    on their reservations are therefore served in the order they reserved, and the lock is only
+    held for the bookkeeping, so the bucket can be shared by threads and coroutines alike.
+
+    Parameters:
+    - capacity (float): Maximum level, i.e. the largest burst.
+    - refill_per_second (float): Refill rate.
+    """
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def reserve(self, amount):
+        """
+        Take `amount` from the bucket and return the seconds until it is covered.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level -= amount
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.refill_per_second
+
+    def adjust(self, amount):
+        """
+        Give back (positive) or take (negative) tokens after the fact, e.g. once actual usage is known.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level = min(self.capacity, self.level + amount)
+
+    def drain(self, seconds):
+        """
+        Empty the bucket so that nothing is handed out for the next `seconds`.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level = min(self.level, -seconds * self.refill_per_second)
+
+
+class RateLimiter:
+    """
+    Proactive requests-per-minute and tokens-per-minute limit shared by all workers of a run.
+
+    Before each request a worker reserves one request and the request's estimated tokens
+    (system prompt, user message and `expected_output_tokens`) and sleeps until both budgets
+    cover it, so requests go out at the provider's ceiling without waiting for 429 responses.
+    Once a response arrives, `record_usage` corrects the token budget with the actual usage.
+    A 429 that still gets through drains both budgets for the server's Retry-After.
+
+    Parameters:
+    - requests_per_minute (int, optional): Request budget. None disables the request limit.
+    - tokens_per_minute (int, optional): Token budget. None disables the token limit.
+    - model (str, optional): Model identifier used to pick the tokenizer for estimates.
+    - expected_output_tokens (int, optional): Tokens reserved per request for the reply. Defaults to 0.
+    - headroom (float, optional): Fraction of the limits to use, leaving room for estimation error
+      and other clients on the same key. Defaults to 0.95.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, model=None, expected_output_tokens=0, headroom=0.95):
+        self.model = model
+        self.expected_output_tokens = expected_output_tokens
+        self.request_bucket = None
+        self.token_bucket = None
+        if requests_per_minute:
+            limit = requests_per_minute * headroom
+            self.request_bucket = TokenBucket(limit, limit / 60)
+        if tokens_per_minute:
+            limit = tokens_per_minute * headroom
+            self.token_bucket = TokenBucket(limit, limit / 60)
+
+    def request_tokens(self, system_prompt, user_message):
+        """
+        Estimated tokens of a request made of a system prompt and a user message.
+        """
+        if self.token_bucket is None:
+            return 0
+        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_message}]
+        return estimate_request_tokens(messages, self.model, self.expected_output_tokens)
+
+    def reserve(self, tokens):
+        """
+        Reserve one request and `tokens` tokens; returns the seconds to wait before sending.
+        """
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            wait = max(wait, self.token_bucket.reserve(tokens))
+        return wait
+
+    def wait(self, tokens):
+        """
+        Block the calling thread until a request of `tokens` tokens may be sent.
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, tokens):
+        """
+        Suspend the calling coroutine until a request of `tokens` tokens may be sent.
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def record_usage(self, estimated_tokens, response):
+        """
+        Correct the token budget with the usage reported in a chat completion response.
+        """
+        usage = getattr(response, 'usage', None)
+        if self.token_bucket is None or usage is None or usage.total_tokens is None:
+            return
+        self.token_bucket.adjust(estimated_tokens - usage.total_tokens)
+
+    def penalize(self, seconds):
+        """
+        Hold back all workers for `seconds`, e.g. the Retry-After of a 429 response.
+        """
+        for bucket in (self.request_bucket, self.token_bucket):
+            if bucket is not None:
+                bucket.drain(seconds)
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# Puts between two recounts of the stored size, which pick up writes and evictions of other processes
+RECOUNT_EVERY = 1000
+
+
+def response_cache_key(model, system_prompt, user_message):
+    """
+    Content address of a chat completion request: SHA-256 of the model, system prompt and user message.
+    """
+    payload = json.dumps([model, system_prompt, user_message], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Disk-backed cache of model responses keyed by `response_cache_key`, stored in SQLite.
+
+    Reruns with the same model, prompts and context windows are answered from the cache
+    instead of the API. Error responses (starting with "Error:") are never stored, so failed
+    windows are retried on the next run. The cache can be shared by threads of one process
+    and by several processes using the same file.
+
+    Parameters:
+    - path (str): Path of the SQLite database file; created if missing.
+    - max_size_bytes (int, optional): Upper bound on the stored response text. When exceeded, the
+      least recently used entries are evicted. None keeps everything. The stored size is tracked in
+      memory and recounted every RECOUNT_EVERY puts, so with several writing processes the bound
+      may be exceeded briefly.
+
+    Attributes:
+    - hits, misses (int): Lookups answered and not answered by this instance.
+    """
+
+    def __init__(self, path, max_size_bytes=None):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._stored_size = None
+        self._puts_since_recount = 0
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, "
+            "size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def get(self, key):
+        """
+        Return the cached response for `key`, or None on a miss.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key, response, model=None):
+        """
+        Store a response under `key`. Error responses and non-string responses are ignored.
+        """
+        if not isinstance(response, str) or response.startswith("Error:"):
+            return
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self._lock:
+            replaced = None
+            if self.max_size_bytes is not None:
+                replaced = self._connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            if self.max_size_bytes is not None:
+                self._track_size(size - (replaced[0] if replaced else 0))
+                if self._stored_size > self.max_size_bytes:
+                    self._evict()
+
+    def _track_size(self, delta):
+        # Running total of the stored size, so a put does not have to sum the whole table
+        self._puts_since_recount += 1
+        if self._stored_size is None or self._puts_since_recount >= RECOUNT_EVERY:
+            self._stored_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self._puts_since_recount = 0
+        else:
+            self._stored_size += delta
+
+    def _evict(self):
+        excess = self._stored_size - self.max_size_bytes
+        freed = 0
+        stale_keys = []
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            stale_keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+        self._stored_size -= freed
+
+    def stats(self):
+        """
+        Return a dict with this instance's hits, misses and hit rate and the number and size of stored entries.
+        """
+        with self._lock:
+            entries, size = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'size_bytes': size,
+        }
+
+    def report(self):
+        """
+        Print the cache statistics.
+        """
+        stats = self.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate); "
+              f"{stats['entries']} entries, {stats['size_bytes'] / 1e6:.1f} MB")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,118 @@
+import os
+
+# Uncompressed size aimed for per Parquet row group / Arrow record batch when no row count is given
+ROW_GROUP_BYTES = 64 * 1024 * 1024
+
+# File extensions and the formats they are read and written as; anything else is CSV
+TABLE_FORMATS = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+    '.csv': 'csv',
+}
+
+
+def resolve_table_format(path, table_format=None):
+    """
+    Return the format of a table file: the given one, or the one implied by the path's extension.
+
+    Parameters:
+    - path (str): Path of the table file.
+    - table_format (str, optional): "parquet", "arrow" or "csv". Defaults to the format of the extension,
+      CSV for unknown extensions (e.g. the legacy "filtered_data.json", which always held CSV).
+
+    Returns:
+    - str: "parquet", "arrow" or "csv".
+    """
+    if table_format is None:
+        table_format = TABLE_FORMATS.get(os.path.splitext(path)[1].lower(), 'csv')
+    if table_format not in ('parquet', 'arrow', 'csv'):
+        raise ValueError(f"Unsupported table format: {table_format}")
+    return table_format
+
+
+def row_group_rows(df, target_bytes=ROW_GROUP_BYTES):
+    """
+    Number of rows that makes a row group of about `target_bytes` of in-memory data.
+
+    Rows holding full paper texts are a thousand times larger than rows of short context windows,
+    so a fixed row count gives row groups that are either huge or tiny.
+    """
+    if df.empty:
+        return 1
+    row_bytes = df.memory_usage(index=False, deep=True).sum() / len(df)
+    return max(1, int(target_bytes // max(1, row_bytes)))
+
+
+def write_table(df, path, table_format=None, compression='zstd', row_group_size=None):
+    """
+    Write a DataFrame as Parquet, Arrow IPC (Feather v2) or CSV, depending on the file extension.
+
+    Parameters:
+    - df (pandas.DataFrame): The table to write; the index is not stored.
+    - path (str): Output file. See `resolve_table_format` for how the extension selects the format.
+    - table_format (str, optional): "parquet", "arrow" or "csv", overriding the extension.
+    - compression (str, optional): Columnar codec, e.g. "zstd", "lz4", "snappy" or None. Defaults to "zstd".
+      Ignored for CSV.
+    - row_group_size (int, optional): Rows per Parquet row group or Arrow record batch. Defaults to
+      about ROW_GROUP_BYTES of data per group, see `row_group_rows`.
+
+    Behavior:
+    - Parquet and Arrow require pyarrow, which is imported only when one of them is written.
+    - Uncompressed Arrow files (compression=None) can be memory-mapped by `read_table` without copying;
+      compressed ones are smaller but decompressed into memory on read.
+    """
+    table_format = resolve_table_format(path, table_format)
+    if table_format == 'csv':
+        df.to_csv(path, index=False)
+        return
+
+    import pyarrow as pa
+
+    row_group_size = row_group_size or row_group_rows(df)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if table_format == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, path, compression=compression or 'none', row_group_size=row_group_size)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, path, compression=compression or 'uncompressed', chunksize=row_group_size)
+
+
+def read_table(path, columns=None, table_format=None, memory_map=True):
+    """
+    Read a table written by `write_table` (or any Parquet, Arrow IPC or CSV file) into a DataFrame.
+
+    Parameters:
+    - path (str): Input file. See `resolve_table_format` for how the extension selects the format.
+    - columns (list of str, optional): Columns to read. Parquet and Arrow skip the data of the other
+      columns entirely, e.g. the full texts when only ids and context windows are needed. Defaults to all.
+    - table_format (str, optional): "parquet", "arrow" or "csv", overriding the extension.
+    - memory_map (bool, optional): Memory-map Parquet and Arrow files instead of reading them. Defaults to True.
+
+    Returns:
+    - pandas.DataFrame: The selected columns.
+    """
+    import pandas as pd
+
+    table_format = resolve_table_format(path, table_format)
+    if table_format == 'csv':
+        return pd.read_csv(path, usecols=columns)
+    if table_format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns=columns, memory_map=memory_map).to_pandas()
+    import pyarrow.feather as feather
+    return feather.read_table(path, columns=columns, memory_map=memory_map).to_pandas()
+
+
+def load_table(table, columns=None):
+    """
+    Return `table` if it is a DataFrame, or read it from a table file with `read_table`.
+
+    Lets a pipeline stage take the previous stage's output file instead of a DataFrame.
+    """
+    if isinstance(table, (str, os.PathLike)):
+        return read_table(os.fspath(table), columns=columns)
+    return table
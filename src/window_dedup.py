@@ -0,0 +1,216 @@
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from table_io import load_table, write_table
+
+# Universal hashing (a * x + b) mod p of 32-bit shingle hashes; a < 2**31 keeps a * x + b below 2**64
+_PRIME = np.uint64(4294967311)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_window(text):
+    """
+    Canonical form of a context window for duplicate detection: collapsed whitespace, stripped.
+    """
+    if not isinstance(text, str):
+        return ''
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _union(parent, i, j):
+    root_i, root_j = _find(parent, i), _find(parent, j)
+    if root_i != root_j:
+        # The earlier window stays the representative
+        if root_j < root_i:
+            root_i, root_j = root_j, root_i
+        parent[root_j] = root_i
+
+
+def _lsh_bands(num_perm, threshold, recall=0.99):
+    """
+    Pick (bands, rows) so that a pair with similarity `threshold` shares a band with probability >= `recall`.
+
+    Candidates are verified on the full signature afterwards, so false positives only cost time; among
+    the settings meeting the recall, the one with the most rows per band (fewest candidates) is used.
+    """
+    for rows in range(num_perm, 0, -1):
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= recall:
+            return bands, rows
+    return num_perm, 1
+
+
+class MinHasher:
+    """
+    MinHash signatures of word shingles, for estimating the Jaccard similarity of two texts.
+
+    Parameters:
+    - num_perm (int, optional): Signature length. Defaults to 128.
+    - shingle_size (int, optional): Words per shingle. Defaults to 5.
+    - seed (int, optional): Seed of the hash permutations. Defaults to 1.
+    """
+
+    def __init__(self, num_perm=128, shingle_size=5, seed=1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 2 ** 31, size=num_perm, dtype=np.int64).astype(np.uint64)[:, None]
+        self._b = rng.randint(0, 2 ** 31, size=num_perm, dtype=np.int64).astype(np.uint64)[:, None]
+
+    def shingle_hashes(self, text):
+        words = text.lower().split()
+        size = self.shingle_size
+        if len(words) <= size:
+            shingles = [' '.join(words)]
+        else:
+            shingles = {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+        return np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64)
+
+    def signature(self, text):
+        """
+        Return the MinHash signature of a text as a uint64 array of length `num_perm`.
+        """
+        hashes = self.shingle_hashes(text)
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1)
+
+
+def find_duplicate_windows(windows, near_duplicates=False, threshold=0.9, num_perm=128, shingle_size=5, seed=1):
+    """
+    Group context windows into clusters of duplicates.
+
+    Parameters:
+    - windows (list of str): The context windows.
+    - near_duplicates (bool, optional): Also merge windows whose estimated Jaccard similarity of word
+      shingles is at least `threshold` (MinHash with LSH banding). Defaults to False (exact duplicates only).
+    - threshold (float, optional): Similarity above which two windows count as near-duplicates. Defaults to 0.9.
+    - num_perm (int, optional): MinHash signature length. Defaults to 128.
+    - shingle_size (int, optional): Words per shingle. Defaults to 5.
+    - seed (int, optional): Seed of the MinHash permutations. Defaults to 1.
+
+    Returns:
+    - list of int: For every window, the position of its cluster's representative (the cluster's first window).
+
+    Behavior:
+    - Exact duplicates are found by hashing the whitespace-normalized text.
+    - Near-duplicates are only searched among the exact representatives. All pairs of windows sharing an
+      LSH band are candidates and are merged if their signatures agree on at least `threshold` of the
+      positions; clusters are the connected components (union-find) of the merged pairs.
+    """
+    parent = list(range(len(windows)))
+    first_seen = {}
+    for position, window in enumerate(windows):
+        key = normalize_window(window)
+        if key in first_seen:
+            parent[position] = first_seen[key]
+        else:
+            first_seen[key] = position
+
+    if near_duplicates and len(first_seen) > 1:
+        hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size, seed=seed)
+        positions = list(first_seen.values())
+        signatures = np.vstack([hasher.signature(text) for text in first_seen])
+        bands, rows = _lsh_bands(num_perm, threshold)
+        for band in range(bands):
+            buckets = {}
+            band_values = signatures[:, band * rows:(band + 1) * rows]
+            for i in range(len(positions)):
+                buckets.setdefault(band_values[i].tobytes(), []).append(i)
+            for members in buckets.values():
+                # Every pair of a bucket is a candidate; pairs already in one cluster are not compared again
+                for k, first in enumerate(members):
+                    for other in members[k + 1:]:
+                        if _find(parent, positions[first]) == _find(parent, positions[other]):
+                            continue
+                        if np.mean(signatures[first] == signatures[other]) >= threshold:
+                            _union(parent, positions[first], positions[other])
+
+    return [_find(parent, position) for position in range(len(windows))]
+
+
+def deduplicate_context_windows(new_df, column='context_window', near_duplicates=False, threshold=0.9, **minhash_kwargs):
+    """
+    Keep one representative row per cluster of duplicate context windows.
+
+    Parameters:
+    - new_df (pandas.DataFrame): DataFrame of context windows, e.g. from `extract_context_windows_df`.
+    - column (str, optional): Column holding the windows. Defaults to 'context_window'.
+    - near_duplicates, threshold, **minhash_kwargs: See `find_duplicate_windows`.
+
+    Returns:
+    - tuple: (DataFrame of the representative rows, pandas.Series with the index of `new_df` holding the
+      position of every row's representative in `new_df`). Positions rather than index labels are used,
+      as frames concatenated from several files often repeat labels. The statistics are stored in the
+      returned DataFrame's `attrs['dedup_stats']` and printed.
+    """
+    representatives = find_duplicate_windows(new_df[column].tolist(), near_duplicates=near_duplicates,
+                                             threshold=threshold, **minhash_kwargs)
+    representative_positions = pd.Series(representatives, index=new_df.index, dtype='int64')
+    unique_positions = sorted(set(representatives))
+    unique_df = new_df.iloc[unique_positions]
+
+    total, unique = len(new_df), len(unique_positions)
+    unique_df.attrs['dedup_stats'] = {
+        'total_windows': total,
+        'unique_windows': unique,
+        'reduction_ratio': 1 - unique / total if total else 0.0,
+    }
+    print(f"Deduplication: {total} context windows -> {unique} representatives "
+          f"({unique_df.attrs['dedup_stats']['reduction_ratio']:.1%} fewer requests)")
+    return unique_df, representative_positions
+
+
+def fan_out_responses(new_df, unique_df, representative_positions, column='gpt_response'):
+    """
+    Copy each representative's response to all members of its cluster.
+
+    Parameters:
+    - new_df (pandas.DataFrame): All context windows.
+    - unique_df (pandas.DataFrame): The representative rows, in the order returned by `deduplicate_context_windows`.
+    - representative_positions (pandas.Series): Position of every row's representative, from `deduplicate_context_windows`.
+
+    Returns:
+    - pandas.DataFrame: `new_df` with `column` filled for every row whose representative has a response.
+    """
+    # unique_df holds the representatives in position order, so a representative's row is its rank
+    unique_positions = np.unique(representative_positions.to_numpy())
+    if len(unique_df) != len(unique_positions):
+        raise ValueError(f"Expected {len(unique_positions)} representative rows, got {len(unique_df)}.")
+    responses = unique_df[column].to_numpy()
+    new_df[column] = responses[np.searchsorted(unique_positions, representative_positions.to_numpy())]
+    return new_df
+
+
+def process_deduplicated(process_function, new_df, *args, near_duplicates=False, threshold=0.9, output_path=None,
+                         output_format=None, compression='zstd', **kwargs):
+    """
+    Run a claim search function on one representative per cluster of duplicate windows.
+
+    Parameters:
+    - process_function (callable): E.g. `claim_search_v3.process_all_context_windows` or
+      `claim_search_async.run_all_context_windows`; called as `process_function(unique_df, *args, **kwargs)`
+      and expected to return the DataFrame with a 'gpt_response' column.
+    - new_df (pandas.DataFrame or str): DataFrame with a 'context_window' column, or the path of a window file.
+    - near_duplicates, threshold: See `find_duplicate_windows`.
+    - output_path, output_format, compression: File all rows are written to after the fan-out, see
+      `table_io.write_table`. Defaults to None (not written).
+
+    Returns:
+    - pandas.DataFrame: `new_df` with the representatives' responses in 'gpt_response' for every row.
+    """
+    new_df = load_table(new_df)
+    unique_df, representative_positions = deduplicate_context_windows(new_df, near_duplicates=near_duplicates, threshold=threshold)
+    unique_df = process_function(unique_df.copy(), *args, **kwargs)
+    new_df = fan_out_responses(new_df, unique_df, representative_positions)
+    if output_path is not None:
+        write_table(new_df, output_path, table_format=output_format, compression=compression)
+    return new_df
@@ -0,0 +1,68 @@
+import importlib.util
+import json
+import os
+import random
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for folder in ('src', 'regex', 'keyword_lists'):
+    sys.path.insert(0, os.path.join(ROOT, folder))
+
+# Sentences mixed into the synthetic papers; some mention AUROC/AUPRC, most do not
+SENTENCES = [
+    "We train the model with stochastic gradient descent.",
+    "The AUROC of the classifier is 0.91 on the test set.",
+    "Figure 2 shows the receiver operating characteristic of all baselines.",
+    "We report the average precision and the precision-recall curve.",
+    "Results are averaged over five random seeds.",
+    "The \\textbf{AUPRC} is more informative under class imbalance.",
+    "Hyperparameters were tuned on $\\mathcal{D}_{val}$.",
+    "The process of curve fitting is described in the appendix.",
+]
+
+
+def write_jsonl(path, records):
+    with open(path, 'w', encoding='utf-8') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+
+
+def make_records(count, seed, prefix='paper'):
+    rng = random.Random(seed)
+    return [{'text': ' '.join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 6))),
+             'meta': {'arxiv_id': f'{prefix}-{seed}-{i}', 'timestamp': f'2023-01-{i % 28 + 1:02d}'}}
+            for i in range(count)]
+
+
+@pytest.fixture
+def jsonl_folder(tmp_path):
+    """Folder of three small arXiv-like JSONL shards."""
+    folder = tmp_path / 'corpus'
+    folder.mkdir()
+    for seed in range(3):
+        write_jsonl(folder / f'arxiv_{seed:03d}.jsonl', make_records(60 + 20 * seed, seed))
+    return folder
+
+
+@pytest.fixture
+def openai_server():
+    """Factory starting benchmarks/mock_openai_server.py in a thread on a free port; yields (base URL, server)."""
+    spec = importlib.util.spec_from_file_location('mock_openai_server', os.path.join(ROOT, 'benchmarks', 'mock_openai_server.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    servers = []
+
+    def start(**settings):
+        settings.setdefault('latency', 0)
+        server = module.make_server(port=0, **settings)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_address[1]}/v1', server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
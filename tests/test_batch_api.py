@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('openai')
+import batch_api
+from batch_api import write_batch_requests, ingest_batch_results
+
+
+def result_line(custom_id, content=None, error=None, status_code=200):
+    if error is not None:
+        return {'custom_id': custom_id, 'response': None, 'error': error}
+    body = {'choices': [{'message': {'content': content}}]}
+    return {'custom_id': custom_id, 'response': {'status_code': status_code, 'body': body}, 'error': None}
+
+
+def test_requests_round_trip_through_custom_ids(tmp_path):
+    df = pd.DataFrame({'context_window': ['a', 'b', 'c']}, index=[5, 7, 9])
+    paths = write_batch_requests(df, str(tmp_path / 'requests'), 'model', 'system', max_requests_per_file=2)
+    assert len(paths) == 2
+    with open(paths[0]) as file:
+        request = json.loads(file.readline())
+    assert request['body']['messages'][1]['content'] == 'a'
+
+    results = tmp_path / 'results.jsonl'
+    results.write_text('\n'.join(json.dumps(line) for line in [
+        result_line('window-5', 'Yes'),
+        result_line('window-7', error={'message': 'server error'}),
+        result_line('window-9', error='quota exceeded'),
+        result_line('window-42', 'No'),
+    ]) + '\n')
+    df = ingest_batch_results(df, [str(results)])
+    assert df['gpt_response'].tolist() == ['Yes', 'Error: server error', 'Error: quota exceeded']
+    assert df.attrs['batch_stats'] == {'results': 3, 'failed': 2, 'missing': 0, 'unknown_custom_ids': 1}
+
+
+@pytest.mark.parametrize('index', [[1, '1'], [3, 3]])
+def test_colliding_custom_ids_are_rejected(tmp_path, index):
+    df = pd.DataFrame({'context_window': ['a', 'b']}, index=index)
+    with pytest.raises(ValueError):
+        write_batch_requests(df, str(tmp_path), 'model', 'system')
+    with pytest.raises(ValueError):
+        ingest_batch_results(df, [])
+
+
+def test_batch_api_does_not_import_the_async_engine():
+    code = "import sys, batch_api; sys.exit('claim_search_async' in sys.modules)"
+    assert subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(batch_api.__file__)).returncode == 0
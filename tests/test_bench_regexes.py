@@ -0,0 +1,84 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import bench_regexes
+
+SCRIPT = os.path.join(ROOT, 'benchmarks', 'bench_regexes.py')
+# One keyword pattern on two tiny corpora; the generous tolerance keeps timing noise out of the gate
+ARGS = ['-size', '3000', '-repeat', '1', '-probe_timeout', '10', '-pattern', 'keywords_auroc.', '-tolerance', '0.95']
+
+
+@pytest.fixture(scope='module')
+def baseline(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('bench') / 'baseline.json')
+    assert bench_regexes.main(ARGS + ['-save_baseline', path]) == 0
+    return path
+
+
+def edited_baseline(baseline, tmp_path, edit):
+    with open(baseline) as file:
+        results = json.load(file)
+    for entry in results.values():
+        edit(entry)
+    path = str(tmp_path / 'edited.json')
+    with open(path, 'w') as file:
+        json.dump(results, file)
+    return path
+
+
+def add_match(entry):
+    entry['matches']['dense'] += 1
+
+
+def test_saved_baseline(baseline):
+    with open(baseline) as file:
+        results = json.load(file)
+    assert list(results) == ['keywords_auroc.auroc_search_terms']
+    entry = results['keywords_auroc.auroc_search_terms']
+    assert entry['matches']['dense'] > 0 and entry['superlinear'] is False
+
+
+def test_unchanged_run_passes_the_gate(baseline, capsys):
+    assert bench_regexes.main(ARGS + ['-baseline', baseline]) == 0
+    assert 'No regressions against the baseline' in capsys.readouterr().out
+
+
+def test_changed_match_counts_fail_only_with_strict_matches(baseline, tmp_path, capsys):
+    path = edited_baseline(baseline, tmp_path, add_match)
+    assert bench_regexes.main(ARGS + ['-baseline', path]) == 0
+    assert 'Changed: keywords_auroc.auroc_search_terms' in capsys.readouterr().out
+    assert bench_regexes.main(ARGS + ['-baseline', path, '-strict_matches']) == 1
+    assert 'REGRESSION keywords_auroc.auroc_search_terms' in capsys.readouterr().out
+
+
+def test_throughput_drop_fails(baseline, tmp_path):
+    def speed_up(entry):
+        entry['relative_speed'] = {corpus: speed * 100 for corpus, speed in entry['relative_speed'].items()}
+
+    assert bench_regexes.main(ARGS + ['-baseline', edited_baseline(baseline, tmp_path, speed_up)]) == 1
+
+
+def test_exit_status_of_the_script(baseline, tmp_path):
+    run = [sys.executable, SCRIPT] + ARGS + ['-strict_matches', '-baseline']
+    assert subprocess.run(run + [baseline], capture_output=True).returncode == 0
+    assert subprocess.run(run + [edited_baseline(baseline, tmp_path, add_match)], capture_output=True).returncode == 1
+
+
+@pytest.mark.parametrize('source', [r'(a+)+$', r'(\w+\s?)+$'])
+def test_catastrophic_pattern_is_flagged(source):
+    pattern = re.compile(source)
+    assert 'nested unbounded quantifiers' in bench_regexes.static_risks(pattern)
+    results = bench_regexes.profile({'catastrophic': pattern}, {'tiny': ['aaa b']}, 1, 2)
+    assert results['catastrophic']['superlinear']
+    baseline = {'catastrophic': dict(results['catastrophic'], superlinear=False, static_risks=[])}
+    failures = bench_regexes.compare_to_baseline(results, baseline, 0.3, False, ['tiny'])
+    assert any('new superlinear backtracking' in failure for failure in failures)
+    assert any('new static risks' in failure for failure in failures)
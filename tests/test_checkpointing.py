@@ -0,0 +1,47 @@
+import pandas as pd
+
+from checkpointing import CheckpointJournal, pending_windows, load_journals, apply_responses
+
+
+def windows_df(count=20):
+    return pd.DataFrame({'context_window': [f'window {i}' for i in range(count)]})
+
+
+def test_resume_skips_completed_and_retries_errors(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    with CheckpointJournal(path) as journal:
+        journal.append(0, 'Yes')
+        journal.append(1, 'Error: timeout')
+        journal.append(2, 'No')
+    completed = CheckpointJournal(path).load()
+    assert completed == {0: 'Yes', 2: 'No'}
+    assert [idx for idx, _ in pending_windows(windows_df(4), completed)] == [1, 3]
+
+
+def test_record_cut_off_by_a_crash_is_ignored(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    path.write_text('{"id": 0, "response": "Yes"}\n{"id": 1, "resp')
+    journal = CheckpointJournal(str(path))
+    assert journal.load() == {0: 'Yes'}
+    with journal:
+        journal.append(2, 'No')
+    assert CheckpointJournal(str(path)).load() == {0: 'Yes', 2: 'No'}
+
+
+def test_shards_partition_the_windows():
+    df = windows_df(100)
+    shards = [{idx for idx, _ in pending_windows(df, shard_index=i, num_shards=3)} for i in range(3)]
+    assert sum(len(shard) for shard in shards) == 100
+    assert set().union(*shards) == set(df.index)
+
+
+def test_multiindex_ids_round_trip(tmp_path):
+    df = windows_df(4)
+    df.index = pd.MultiIndex.from_tuples([('a', 0), ('a', 1), ('b', 0), ('b', 1)])
+    paths = [str(tmp_path / f'shard{i}.jsonl') for i in range(2)]
+    for i, path in enumerate(paths):
+        with CheckpointJournal(path) as journal:
+            for idx, _ in pending_windows(df, shard_index=i, num_shards=2):
+                journal.append(idx, f'response {idx}')
+    df = apply_responses(df, load_journals(paths))
+    assert df['gpt_response'].tolist() == [f'response {idx}' for idx in df.index]
@@ -0,0 +1,81 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('openai')
+pytest.importorskip('httpx')
+
+from claim_search_async import AdaptiveConcurrencyLimiter, process_with_gpt_async, run_all_context_windows
+from openai import AsyncOpenAI
+from response_cache import ResponseCache
+
+
+def windows_frame(count):
+    return pd.DataFrame({'context_window': [f'window {i} reports an AUROC of 0.{i:03d}' for i in range(count)]})
+
+
+def test_every_window_answered_in_order(openai_server):
+    base_url, server = openai_server(echo=True, requests_per_second=1000, burst=1000)
+    df = windows_frame(60)
+    result = run_all_context_windows(df, 'mock', 'system', 'key', base_url=base_url, initial_concurrency=8, max_concurrency=16)
+    assert result['gpt_response'].tolist() == df['context_window'].tolist()
+    assert server.counters['ok'] == 60
+
+
+def test_rate_limits_shrink_then_grow_the_limit(openai_server):
+    base_url, server = openai_server(echo=True, requests_per_second=40, burst=4, retry_after=0.05)
+    limiter = AdaptiveConcurrencyLimiter(initial=16, cooldown=0.2)
+    history = []
+    release = limiter.release
+
+    async def recording_release(rate_limited=False, retry_after=0.0):
+        await release(rate_limited, retry_after)
+        history.append((rate_limited, limiter.limit))
+
+    limiter.release = recording_release
+
+    async def run():
+        client = AsyncOpenAI(api_key='key', base_url=base_url, max_retries=0)
+        try:
+            return await asyncio.gather(*(process_with_gpt_async(client, limiter, f'window {i}', 'mock', 'system', max_retries=50)
+                                          for i in range(40)))
+        finally:
+            await client.close()
+
+    responses = asyncio.run(run())
+    assert responses == [f'window {i}' for i in range(40)]
+    assert server.counters['rate_limited'] > 0
+    assert limiter.rate_limited == server.counters['rate_limited']
+    # Multiplicative decrease on the 429s, then additive increase on the successes that follow
+    last_decrease = max(i for i, (rate_limited, _) in enumerate(history) if rate_limited)
+    lowest = history[last_decrease][1]
+    assert lowest < 16
+    assert any(not rate_limited for rate_limited, _ in history[last_decrease:])
+    assert limiter.limit > lowest
+
+
+def test_limiter_bounds():
+    async def run():
+        limiter = AdaptiveConcurrencyLimiter(initial=4, minimum=2, maximum=5, cooldown=0)
+        for _ in range(3):
+            await limiter.acquire()
+            await limiter.release(rate_limited=True)
+        assert limiter.limit == 2
+        for _ in range(100):
+            await limiter.acquire()
+            await limiter.release()
+        assert limiter.limit == 5
+
+    asyncio.run(run())
+
+
+def test_rerun_is_answered_from_the_cache(openai_server, tmp_path):
+    base_url, server = openai_server(echo=True, requests_per_second=1000, burst=1000)
+    df = windows_frame(20)
+    with ResponseCache(str(tmp_path / 'cache.sqlite')) as cache:
+        first = run_all_context_windows(df.copy(), 'mock', 'system', 'key', base_url=base_url, cache=cache)
+        second = run_all_context_windows(df.copy(), 'mock', 'system', 'key', base_url=base_url, cache=cache)
+        assert cache.hits == 20
+    assert server.counters['ok'] == 20
+    assert second['gpt_response'].tolist() == first['gpt_response'].tolist() == df['context_window'].tolist()
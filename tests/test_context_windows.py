@@ -0,0 +1,148 @@
+import random
+import re
+
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from claim_search_v3 import extract_context_windows_df
+from context_windows import WordIndex, merge_matches, context_window_spans
+
+WHITESPACE = [' ', '  ', '\n', '\t', '\r\n', ' ', ' ', '\x1c', '\x0b']
+WORDS = ['AUROC', 'auc', 'the', 'ROC-curve', 'x', 'précision', '0.91', '(AUPRC)']
+
+
+def random_text(rng, words):
+    return ''.join(rng.choice(WHITESPACE) + rng.choice(WORDS) for _ in range(words)) + rng.choice(WHITESPACE)
+
+
+def baseline_windows(text, compiled_regexes, window_size):
+    # get_context_windows before the word index: re-splits the text for every merged match
+    all_matches = []
+    for compiled_regex in compiled_regexes:
+        all_matches.extend(compiled_regex.finditer(text))
+    all_matches.sort(key=lambda match: match.start())
+    merged_matches = []
+    i = 0
+    while i < len(all_matches):
+        start_pos, end_pos = all_matches[i].start(), all_matches[i].end()
+        while i + 1 < len(all_matches) and all_matches[i + 1].start() - end_pos <= window_size * 2:
+            i += 1
+            end_pos = all_matches[i].end()
+        merged_matches.append((start_pos, end_pos))
+        i += 1
+    windows = []
+    for start_pos, end_pos in merged_matches:
+        words = text.split()
+        start_word_pos = len(text[:start_pos].split()) - 1
+        end_word_pos = len(text[:end_pos].split())
+        windows.append(' '.join(words[max(0, start_word_pos - window_size):min(len(words), end_word_pos + window_size)]))
+    return windows
+
+
+def spans(text, pattern, max_gap):
+    return merge_matches(sorted(re.finditer(pattern, text), key=lambda match: match.start()), max_gap)
+
+
+def test_word_index_matches_split_at_every_position():
+    rng = random.Random(0)
+    for _ in range(50):
+        text = random_text(rng, rng.randint(0, 30))
+        index = WordIndex(text)
+        assert index.words == text.split()
+        for pos in range(len(text) + 1):
+            assert index.words_before(pos) == len(text[:pos].split())
+
+
+@pytest.mark.parametrize('text', ['', '   ', '\n\t  '])
+def test_word_index_of_whitespace_only_text_is_empty(text):
+    index = WordIndex(text)
+    assert index.words == [] and index.words_before(len(text)) == 0
+    assert index.window(0, len(text), 3) == (0, 0)
+
+
+def test_merge_overlapping_spans_keep_the_last_end():
+    # Unchanged from the original loop: the end of the last merged match wins
+    matches = sorted([re.search('abcdef', 'abcdef'), re.search('bc', 'abcdef')], key=lambda match: match.start())
+    assert merge_matches(matches, 0) == [(0, 3)]
+
+
+def test_merge_adjacent_and_gapped_spans():
+    assert spans('AUCAUC', 'AUC', 0) == [(0, 6)]
+    assert spans('AUC AUC', 'AUC', 0) == [(0, 3), (4, 7)]
+    assert spans('AUC AUC', 'AUC', 1) == [(0, 7)]
+
+
+def test_merge_spans_at_start_and_end_of_text():
+    assert spans('AUC', 'AUC', 10) == [(0, 3)]
+    assert spans('AUC middle words AUC', 'AUC', 2) == [(0, 3), (17, 20)]
+    assert merge_matches([], 5) == []
+
+
+@pytest.mark.parametrize('text', ['', '   ', '\n\n'])
+def test_whitespace_only_text_has_empty_windows(text):
+    assert context_window_spans(text, [re.compile('AUC')], 3) == []
+    # A match of whitespace only gives an empty window, as in the baseline
+    found = context_window_spans(text, [re.compile(r'\s+')], 3)
+    assert [window for window, _, _ in found] == baseline_windows(text, [re.compile(r'\s+')], 3)
+
+
+@pytest.mark.parametrize('window_size', [0, 1, 3])
+def test_windows_match_baseline_implementation(window_size):
+    rng = random.Random(window_size)
+    regexes = [re.compile(r'\bAUROC\b|\(AUPRC\)'), re.compile(r'(?i)auc'), re.compile(r'ROC-')]
+    for _ in range(200):
+        text = random_text(rng, rng.randint(0, 40))
+        found = context_window_spans(text, regexes, window_size)
+        assert [window for window, _, _ in found] == baseline_windows(text, regexes, window_size)
+        for window, start, end in found:
+            assert ' '.join(text[start:end].split()) == window
+
+
+def baseline_windows_df(df, text_column, compiled_regexes, window_size):
+    # extract_context_windows_df before the columnar rewrite: one to_dict() copy per window
+    context_rows = []
+    for index, row in df.iterrows():
+        for window in baseline_windows(row[text_column], compiled_regexes, window_size):
+            new_row = row.to_dict()
+            new_row[text_column] = window
+            context_rows.append(new_row)
+    return pd.DataFrame(context_rows)
+
+
+METRIC_REGEXES = [re.compile(r'(?i)\bAUC?-?ROC\b|\bAUC\b|receiver operating'), re.compile(r'(?i)\bAUC?-?PRC\b|precision')]
+DOCUMENTS = [
+    'AUROC at the very start of the text, nothing else here',
+    'nothing here until the very end: AUPRC',
+    'AUC',
+    'both metrics: AUROC 0.9 and AUPRC 0.4 in one sentence',
+    # Overlapping matches of the two families, and of two alternatives of one family
+    'the AUC-PRC score and the AUC-ROC score',
+    'receiver operating characteristic and average precision, far apart ' + 'filler ' * 40 + 'AUROC again',
+    'no metric at all',
+    '',
+]
+
+
+@pytest.mark.parametrize('num_processes', [1, 2])
+@pytest.mark.parametrize('window_size', [0, 2, 10])
+def test_windows_frame_matches_iterrows_implementation(num_processes, window_size):
+    rng = random.Random(window_size)
+    texts = DOCUMENTS + [random_text(rng, rng.randint(0, 40)) for _ in range(100)]
+    df = pd.DataFrame({'text': texts, 'text_id': range(len(texts)), 'arxiv_id': [f'id-{i}' for i in range(len(texts))],
+                       'contains_auroc': [i % 2 == 0 for i in range(len(texts))]},
+                      index=[7 * i for i in range(len(texts))])
+    regexes = METRIC_REGEXES + [re.compile(r'\bAUROC\b|\(AUPRC\)')]
+    expected = baseline_windows_df(df, 'text', regexes, window_size)
+    result = extract_context_windows_df(df, 'text', regexes, window_size, num_processes=num_processes)
+    assert len(result) > len(DOCUMENTS)
+    pdt.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_windows_frame_offsets_point_into_the_source_rows():
+    df = pd.DataFrame({'text': DOCUMENTS, 'arxiv_id': range(len(DOCUMENTS))}, index=[0, 0, 1, 1, 2, 2, 3, 3])
+    result = extract_context_windows_df(df, 'text', METRIC_REGEXES, 2, include_offsets=True, num_processes=1)
+    for _, row in result.iterrows():
+        source = df.iloc[row['arxiv_id']]
+        assert row['doc_index'] == df.index[row['arxiv_id']]
+        assert ' '.join(source['text'][row['window_start']:row['window_end']].split()) == row['text']
@@ -0,0 +1,127 @@
+import json
+import os
+import sys
+import time
+
+import pytest
+
+fitz = pytest.importorskip('fitz')
+pytest.importorskip('pypdfium2')
+pytest.importorskip('PyPDF2')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pdf_extraction'))
+import convert_pdfs_to_text
+from convert_pdfs_to_text import convert_pdfs, iter_pdf_paths, load_manifest
+
+
+def write_pdf(path, text):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), text)
+    doc.save(str(path))
+    doc.close()
+
+
+def read_output(path):
+    with open(path, encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+def convert(folder, output, **kwargs):
+    return convert_pdfs(iter_pdf_paths(str(folder)), str(output), num_workers=2, **kwargs)
+
+
+def test_changed_pdf_replaces_its_record(tmp_path):
+    folder = tmp_path / 'pdfs'
+    folder.mkdir()
+    for name in ('a', 'b'):
+        write_pdf(folder / f'{name}.pdf', f'Paper {name} reports an AUROC of 0.9.')
+    output = tmp_path / 'papers.jsonl'
+    assert convert(folder, output)['converted'] == 2
+
+    write_pdf(folder / 'a.pdf', 'Paper a was revised and now reports the AUPRC as well.')
+    stats = convert(folder, output)
+    assert stats['converted'] == 1 and stats['skipped'] == 1
+    records = read_output(output)
+    assert sorted(record['meta']['arxiv_id'] for record in records) == ['a.pdf', 'b.pdf']
+    assert 'revised' in next(record['text'] for record in records if record['meta']['arxiv_id'] == 'a.pdf')
+
+
+def test_unreadable_pdf_is_failed_and_retried(tmp_path):
+    folder = tmp_path / 'pdfs'
+    folder.mkdir()
+    (folder / 'broken.pdf').write_bytes(b'not a pdf at all')
+    output = tmp_path / 'papers.jsonl'
+    assert convert(folder, output)['failed'] == 1
+    assert read_output(output) == []
+    assert load_manifest(str(output) + '.manifest.jsonl')[str(folder / 'broken.pdf')]['status'] == 'failed'
+
+    assert convert(folder, output)['skipped'] == 1
+    assert convert(folder, output, retry_failed=True)['failed'] == 1
+
+
+def fake_extract_text(path, return_extractor=False, **options):
+    # Workers are forked, so they run this in place of the PDF libraries
+    name = os.path.basename(path)
+    if name.startswith('hang'):
+        time.sleep(60)
+    if name.startswith('crash'):
+        os._exit(1)
+    return f'text of {name}', 'fake'
+
+
+@pytest.fixture
+def fake_pdfs(tmp_path, monkeypatch):
+    def create(*names):
+        folder = tmp_path / 'pdfs'
+        folder.mkdir()
+        for name in names:
+            (folder / name).write_bytes(name.encode())
+        return folder
+
+    monkeypatch.setattr(convert_pdfs_to_text, 'extract_text', fake_extract_text)
+    return create
+
+
+def test_records_keep_the_paper_layout(tmp_path):
+    folder = tmp_path / 'pdfs' / '2301'
+    folder.mkdir(parents=True)
+    write_pdf(folder / '2301.00001.pdf', 'We report an AUROC of 0.9.')
+    (folder / 'notes.txt').write_text('not a pdf')
+    output = tmp_path / 'papers.jsonl'
+    assert convert(tmp_path / 'pdfs', output)['converted'] == 1
+    [record] = read_output(output)
+    assert 'AUROC' in record['text']
+    assert record['meta']['arxiv_id'] == '2301.00001.pdf' and record['meta']['url'] == str(folder / '2301.00001.pdf')
+
+
+def test_hanging_pdf_times_out_without_blocking_the_others(fake_pdfs, tmp_path):
+    folder = fake_pdfs('a.pdf', 'hang.pdf', 'b.pdf', 'c.pdf', 'd.pdf')
+    output = tmp_path / 'papers.jsonl'
+    start = time.monotonic()
+    stats = convert(folder, output, timeout=1)
+    assert time.monotonic() - start < 30
+    assert stats['timed_out'] == 1 and stats['converted'] == 4
+    assert sorted(record['meta']['arxiv_id'] for record in read_output(output)) == ['a.pdf', 'b.pdf', 'c.pdf', 'd.pdf']
+
+
+def test_crashed_worker_is_replaced(fake_pdfs, tmp_path):
+    folder = fake_pdfs('a.pdf', 'crash1.pdf', 'b.pdf', 'crash2.pdf', 'c.pdf')
+    output = tmp_path / 'papers.jsonl'
+    stats = convert_pdfs(iter_pdf_paths(str(folder)), str(output), num_workers=1)
+    assert stats['crashed'] == 2 and stats['converted'] == 3
+    assert [record['text'] for record in read_output(output)] == ['text of a.pdf', 'text of b.pdf', 'text of c.pdf']
+
+
+def test_workers_are_recycled(fake_pdfs, tmp_path, monkeypatch):
+    started = []
+    worker_init = convert_pdfs_to_text._Worker.__init__
+
+    def counting_init(self, *args, **kwargs):
+        worker_init(self, *args, **kwargs)
+        started.append(self)
+
+    monkeypatch.setattr(convert_pdfs_to_text._Worker, '__init__', counting_init)
+    folder = fake_pdfs(*[f'{i}.pdf' for i in range(6)])
+    stats = convert_pdfs(iter_pdf_paths(str(folder)), str(tmp_path / 'papers.jsonl'), num_workers=1, max_tasks_per_worker=2)
+    assert stats['converted'] == 6
+    assert len(started) == 3
+    assert not any(worker.process.is_alive() for worker in started)
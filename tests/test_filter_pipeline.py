@@ -0,0 +1,41 @@
+import os
+
+import pandas.testing as pdt
+
+from arxiv_search import jsonl_folder_filtering
+from keywords_auroc import auroc_search_terms
+from keywords_auprc import auprc_search_terms
+
+METADATA_KEYS = ['arxiv_id', 'timestamp']
+
+
+def run_filter(folder, **kwargs):
+    kwargs.setdefault('save_file', False)
+    return jsonl_folder_filtering(str(folder), auroc_search_terms, auprc_search_terms, metadata_keys=METADATA_KEYS,
+                                  num_processes=2, **kwargs)
+
+
+def test_streaming_output_equals_in_memory(jsonl_folder, tmp_path):
+    expected = run_filter(jsonl_folder)
+    streamed = run_filter(jsonl_folder, stream_output=True, buffer_size=7, output_folder_path=str(tmp_path / 'out'))
+    assert len(expected) > 0
+    pdt.assert_frame_equal(streamed.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
+
+
+def test_total_texts_counts_every_line(jsonl_folder, tmp_path):
+    run_filter(jsonl_folder, save_file=True, output_folder_path=str(tmp_path / 'out'))
+    with open(os.path.join(tmp_path, 'out', 'total_texts.txt')) as file:
+        assert int(file.read()) == 60 + 80 + 100
+
+
+def test_row_order_follows_files_and_lines(jsonl_folder):
+    # Small chunks are scheduled largest first; the rows and text_ids must still follow the file order
+    single = run_filter(jsonl_folder, chunk_size=10 ** 9)
+    chunked = run_filter(jsonl_folder, chunk_size=700)
+    pdt.assert_frame_equal(chunked, single)
+
+
+def test_streaming_row_order_follows_files_and_lines(jsonl_folder, tmp_path):
+    single = run_filter(jsonl_folder, chunk_size=10 ** 9)
+    streamed = run_filter(jsonl_folder, chunk_size=700, stream_output=True, output_folder_path=str(tmp_path / 'out'))
+    pdt.assert_frame_equal(streamed, single, check_dtype=False)
@@ -0,0 +1,113 @@
+import os
+from multiprocessing import pool
+
+import pandas.testing as pdt
+import pytest
+
+from conftest import make_records, write_jsonl
+from test_filter_pipeline import run_filter
+from text_store import TextStore
+
+
+def run_incremental(folder, out, **kwargs):
+    return run_filter(folder, incremental=True, output_folder_path=str(out), **kwargs)
+
+
+def assert_matches_full_run(incremental, folder):
+    expected = run_filter(folder)
+    pdt.assert_frame_equal(incremental.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
+    assert incremental.attrs['total_texts'] == expected.attrs['total_texts']
+    assert incremental.attrs['prefiltered_texts'] == expected.attrs['prefiltered_texts']
+
+
+def test_first_run_equals_full_run(jsonl_folder, tmp_path):
+    result = run_incremental(jsonl_folder, tmp_path / 'out')
+    assert len(result) > 0
+    assert_matches_full_run(result, jsonl_folder)
+
+
+def test_added_modified_and_removed_files(jsonl_folder, tmp_path):
+    run_incremental(jsonl_folder, tmp_path / 'out')
+    write_jsonl(jsonl_folder / 'arxiv_003.jsonl', make_records(40, 3))
+    write_jsonl(jsonl_folder / 'arxiv_001.jsonl', make_records(90, 11))
+    os.remove(jsonl_folder / 'arxiv_002.jsonl')
+    assert_matches_full_run(run_incremental(jsonl_folder, tmp_path / 'out'), jsonl_folder)
+
+
+def test_unchanged_files_are_reused(jsonl_folder, tmp_path, capsys):
+    run_incremental(jsonl_folder, tmp_path / 'out')
+    write_jsonl(jsonl_folder / 'arxiv_003.jsonl', make_records(40, 3))
+    capsys.readouterr()
+    assert_matches_full_run(run_incremental(jsonl_folder, tmp_path / 'out'), jsonl_folder)
+    assert '1 files processed, 3 reused, 0 removed' in capsys.readouterr().out
+
+
+def test_changed_files_share_one_pool(jsonl_folder, tmp_path, monkeypatch):
+    pools = []
+    original_init = pool.Pool.__init__
+
+    def counting_init(self, *args, **kwargs):
+        pools.append(self)
+        original_init(self, *args, **kwargs)
+
+    monkeypatch.setattr(pool.Pool, '__init__', counting_init)
+    run_incremental(jsonl_folder, tmp_path / 'out', chunk_size=700)
+    assert len(pools) == 1
+
+
+def test_settings_change_filters_with_the_new_settings(jsonl_folder, tmp_path):
+    run_incremental(jsonl_folder, tmp_path / 'out')
+    result = run_incremental(jsonl_folder, tmp_path / 'out', remove_latex=False)
+    expected = run_filter(jsonl_folder, remove_latex=False)
+    pdt.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
+
+
+def test_results_are_kept_per_settings(jsonl_folder, tmp_path, capsys):
+    run_incremental(jsonl_folder, tmp_path / 'out')
+    run_incremental(jsonl_folder, tmp_path / 'out', remove_latex=False)
+    write_jsonl(jsonl_folder / 'arxiv_001.jsonl', make_records(90, 11))
+    capsys.readouterr()
+    result = run_incremental(jsonl_folder, tmp_path / 'out')
+    assert '1 files processed, 2 reused, 0 removed' in capsys.readouterr().out
+    assert_matches_full_run(result, jsonl_folder)
+
+
+def test_settings_sharing_a_text_store_keep_their_texts(jsonl_folder, tmp_path):
+    store_dir = str(tmp_path / 'store')
+    run_incremental(jsonl_folder, tmp_path / 'out', text_store_dir=store_dir)
+    run_incremental(jsonl_folder, tmp_path / 'out', text_store_dir=store_dir, remove_latex=False)
+    result = run_incremental(jsonl_folder, tmp_path / 'out', text_store_dir=store_dir)
+    expected = run_filter(jsonl_folder)
+    store = TextStore(store_dir)
+    assert [store.get(text_id) for text_id in result['text_id']] == expected['text'].tolist()
+
+
+def test_file_changed_during_run_is_reprocessed(jsonl_folder, tmp_path, monkeypatch):
+    import incremental_filtering
+
+    # Rewrite a file while the changed files are filtered; the manifest must keep the fingerprint taken before
+    original = incremental_filtering.collect_unit_rows
+
+    def collect_and_modify(*args, **kwargs):
+        results = original(*args, **kwargs)
+        write_jsonl(jsonl_folder / 'arxiv_000.jsonl', make_records(60, 21))
+        return results
+
+    monkeypatch.setattr(incremental_filtering, 'collect_unit_rows', collect_and_modify)
+    run_incremental(jsonl_folder, tmp_path / 'out')
+    monkeypatch.undo()
+    assert_matches_full_run(run_incremental(jsonl_folder, tmp_path / 'out'), jsonl_folder)
+
+
+def test_text_store_rows_keep_content_ids(jsonl_folder, tmp_path):
+    store = str(tmp_path / 'store')
+    run_incremental(jsonl_folder, tmp_path / 'out', text_store_dir=store)
+    write_jsonl(jsonl_folder / 'arxiv_003.jsonl', make_records(40, 3))
+    result = run_incremental(jsonl_folder, tmp_path / 'out', text_store_dir=store)
+    expected = run_filter(jsonl_folder, text_store_dir=str(tmp_path / 'full_store'))
+    pdt.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
+
+
+def test_requires_output_folder(jsonl_folder):
+    with pytest.raises(ValueError):
+        run_filter(jsonl_folder, incremental=True)
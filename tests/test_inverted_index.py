@@ -0,0 +1,87 @@
+import os
+
+import pandas.testing as pdt
+import pytest
+
+import arxiv_search_regex
+from conftest import make_records, write_jsonl
+from inverted_index import InvertedIndex, build_index
+from regex_definitions import AUPRC_PREFILTER_TERMS, AUROC_PREFILTER_TERMS, compiled_auprc_regex, compiled_auroc_regex
+from test_filter_pipeline import METADATA_KEYS, run_filter
+
+
+def run_regex_filter(folder, **kwargs):
+    return arxiv_search_regex.jsonl_folder_filtering(str(folder), compiled_auroc_regex, compiled_auprc_regex,
+                                                     metadata_keys=METADATA_KEYS, save_file=False, num_processes=2,
+                                                     prefilter_terms=AUROC_PREFILTER_TERMS + AUPRC_PREFILTER_TERMS, **kwargs)
+
+
+@pytest.fixture
+def indexed_folder(jsonl_folder, tmp_path):
+    # A blank and an unparsable line count towards the total texts of a full scan, but are no documents
+    with open(jsonl_folder / 'arxiv_001.jsonl', 'a', encoding='utf-8') as file:
+        file.write('\n{"text": "AUROC truncated\n')
+    index_path = str(tmp_path / 'index.sqlite')
+    build_index(str(jsonl_folder), index_path, num_processes=2, chunk_size=2000)
+    return jsonl_folder, index_path
+
+
+def test_keyword_index_equals_full_scan(indexed_folder):
+    folder, index_path = indexed_folder
+    expected = run_filter(folder)
+    indexed = run_filter(folder, index_path=index_path)
+    assert len(expected) > 0
+    pdt.assert_frame_equal(indexed, expected)
+    assert indexed.attrs['total_texts'] == expected.attrs['total_texts'] == 60 + 82 + 100
+
+
+def test_regex_index_equals_full_scan(indexed_folder):
+    folder, index_path = indexed_folder
+    expected = run_regex_filter(folder)
+    indexed = run_regex_filter(folder, index_path=index_path)
+    assert len(expected) > 0
+    pdt.assert_frame_equal(indexed, expected)
+    assert indexed.attrs['total_texts'] == expected.attrs['total_texts']
+
+
+def test_index_counts_documents_and_lines(indexed_folder):
+    _, index_path = indexed_folder
+    with InvertedIndex(index_path) as index:
+        assert index.num_docs == 60 + 80 + 100
+        assert index.total_texts == 60 + 82 + 100
+
+
+def test_index_rejects_added_file(indexed_folder):
+    folder, index_path = indexed_folder
+    write_jsonl(folder / 'arxiv_new.jsonl', make_records(5, 9))
+    with pytest.raises(ValueError, match='not indexed'):
+        run_filter(folder, index_path=index_path)
+
+
+def test_index_rejects_other_folder(indexed_folder, tmp_path):
+    _, index_path = indexed_folder
+    other = tmp_path / 'other'
+    other.mkdir()
+    write_jsonl(other / 'arxiv_000.jsonl', make_records(60, 0))
+    with pytest.raises(ValueError, match='other files'):
+        run_filter(other, index_path=index_path)
+
+
+def test_index_rejects_changed_file(indexed_folder):
+    folder, index_path = indexed_folder
+    write_jsonl(folder / 'arxiv_000.jsonl', make_records(61, 0))
+    with pytest.raises(ValueError, match='changed'):
+        run_filter(folder, index_path=index_path)
+
+
+def test_index_rejects_other_latex_setting(indexed_folder):
+    folder, index_path = indexed_folder
+    with pytest.raises(ValueError, match='remove_latex'):
+        run_filter(folder, index_path=index_path, remove_latex=False)
+
+
+def test_rebuild_replaces_index(indexed_folder):
+    folder, index_path = indexed_folder
+    os.remove(folder / 'arxiv_002.jsonl')
+    build_index(str(folder), index_path, num_processes=2)
+    pdt.assert_frame_equal(run_filter(folder, index_path=index_path), run_filter(folder))
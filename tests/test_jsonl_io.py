@@ -0,0 +1,20 @@
+import pytest
+
+from jsonl_io import split_jsonl_file, plan_work_units, iter_jsonl_lines
+
+
+def test_split_ranges_cover_file_on_line_boundaries(jsonl_folder):
+    path = str(jsonl_folder / 'arxiv_001.jsonl')
+    with open(path, 'rb') as file:
+        lines = file.readlines()
+    ranges = split_jsonl_file(path, 500)
+    assert len(ranges) > 1
+    assert ranges[0][1] == 0 and ranges[-1][2] == sum(len(line) for line in lines)
+    assert all(end == next_start for (_, _, end), (_, next_start, _) in zip(ranges, ranges[1:]))
+    assert [line for unit in ranges for line in iter_jsonl_lines(*unit)] == lines
+
+
+@pytest.mark.parametrize('chunk_size', [0, -1])
+def test_non_positive_chunk_size_is_rejected(jsonl_folder, chunk_size):
+    with pytest.raises(ValueError):
+        plan_work_units([str(jsonl_folder / 'arxiv_000.jsonl')], 2, chunk_size)
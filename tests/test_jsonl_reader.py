@@ -0,0 +1,26 @@
+import pytest
+
+from jsonl_io import JsonlReader, available_json_backends
+
+FAST_BACKENDS = [backend for backend in available_json_backends() if backend != 'json']
+
+LINES = [
+    b'{"text": "AUROC of 0.9", "meta": {"arxiv_id": "1", "timestamp": "2023"}}\n',
+    b'{"text": "lone \\ud83d surrogate", "meta": {"arxiv_id": "2"}}\n',
+    b'{"text": "score", "meta": {"arxiv_id": "3", "score": NaN}}\n',
+    b'{"text": "no meta"}\n',
+]
+
+
+@pytest.mark.skipif(not FAST_BACKENDS, reason="no fast JSON backend installed")
+@pytest.mark.parametrize('backend', FAST_BACKENDS)
+@pytest.mark.parametrize('line', LINES)
+def test_fast_backends_accept_the_same_lines_as_json(backend, line):
+    fields = ['text', 'meta.arxiv_id', 'meta.timestamp']
+    assert JsonlReader(fields, backend=backend).parse(line) == JsonlReader(fields, backend='json').parse(line)
+
+
+@pytest.mark.parametrize('backend', available_json_backends())
+def test_invalid_lines_raise_value_error(backend):
+    with pytest.raises(ValueError):
+        JsonlReader(['text'], backend=backend).parse(b'{"text": "truncated\n')
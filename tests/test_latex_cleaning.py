@@ -0,0 +1,36 @@
+import random
+
+import pytest
+
+from latex_cleaning import remove_latex_commands, remove_latex_commands_chained
+
+FUZZ_ALPHABET = ['\\', '\\', '$', 'n', 'r', 't', 'a', 'Z', '_', '1', '{', '}', '[', ']', '(', ')',
+                 '.', '*', '?', ' ', '\n', '\r', '\t', 'é', 'begin', 'end', 'frac']
+
+PROSE = ("The receiver operating characteristic curve of the classifier was computed on held-out data, "
+         "and the proposed method improves the area under the curve over all baselines. ")
+LATEX = ("We set $\\lambda = 0.1$ as in \\cite{smith2020} and report AUROC in Table~\\ref{tab:main}.\n"
+         "\\begin{equation}\\mathrm{AUPRC} = \\int_0^1 p(r)\\,dr\\end{equation}\n\\\\ \\textbf{Results.} ")
+
+
+@pytest.mark.parametrize('text', [
+    None, '', '   ', '\\', '$', '$$', '\\n\\r\\t', 'a\\nb', '\\alpha', 'x \\beta', '\\textbf{AUROC}',
+    '$x$ and $y', '\\begin{eq}a\\end{eq}', '\\[x\\]', '\\(y\\)', 'end\\', '\\\\ line', 'naïve \\é',
+    'AUC\\nROC', '\\notation', '\\t\\n',
+])
+def test_matches_chained_reference_on_edge_cases(text):
+    assert remove_latex_commands(text) == remove_latex_commands_chained(text)
+
+
+@pytest.mark.parametrize('latex_ratio', [0.0, 0.2, 0.8, 1.0])
+def test_matches_chained_reference_on_documents(latex_ratio):
+    rng = random.Random(latex_ratio)
+    doc = ''.join(LATEX if rng.random() < latex_ratio else PROSE for _ in range(200))
+    assert remove_latex_commands(doc) == remove_latex_commands_chained(doc)
+
+
+def test_matches_chained_reference_on_random_strings():
+    rng = random.Random(1)
+    for _ in range(20000):
+        s = ''.join(rng.choice(FUZZ_ALPHABET) for _ in range(rng.randint(0, 16)))
+        assert remove_latex_commands(s) == remove_latex_commands_chained(s), s
@@ -0,0 +1,113 @@
+import random
+import re
+
+import pytest
+
+from arxiv_search import create_keyword_pattern
+from keywords_auprc import auprc_search_terms
+from keywords_auroc import auroc_search_terms
+from metric_matching import MetricMatcher, keyword_alternation, prefilter_terms_from_keywords
+from regex_definitions import compiled_auprc_regex, compiled_auroc_regex
+
+
+def plain_keyword_pattern(keywords):
+    # create_keyword_pattern before the keywords were folded into a trie
+    pattern = r'(?:(?<=\W)|(?<=^))(' + '|'.join(map(re.escape, keywords)) + r')(?=\W|$)'
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def spans(pattern, text):
+    return [match.span() for match in pattern.finditer(text)]
+
+
+KEYWORD_LISTS = [
+    list(auroc_search_terms),
+    list(auprc_search_terms),
+    ['roc', 'roc curve', 'roc-auc'],
+    ['roc curve', 'roc', 'roc-auc'],
+    ['auc', 'auc roc', 'a', 'auc-roc curve', 'au'],
+    ['abx', 'a', 'ab', 'a b', 'abx y'],
+    ['a.b', 'a', 'a(b)', 'a+', '$x$'],
+    ['dup', 'dup', 'du', ''],
+]
+
+
+def random_text(rng, keywords, length=40):
+    alphabet = ['a', 'b', 'x', 'y', ' ', '-', '.', '(', ')', '+', '$', 'roc', 'auc', 'curve', 'ROC', 'AUC']
+    pieces = [rng.choice(keywords) if rng.random() < 0.3 else rng.choice(alphabet) for _ in range(length)]
+    return ''.join(piece if rng.random() < 0.7 else piece.upper() for piece in pieces)
+
+
+@pytest.mark.parametrize('keywords', KEYWORD_LISTS)
+def test_trie_matches_the_same_spans_as_the_plain_alternation(keywords):
+    rng = random.Random(0)
+    trie, plain = create_keyword_pattern(keywords), plain_keyword_pattern([keyword for keyword in keywords if keyword])
+    for _ in range(2000):
+        text = random_text(rng, [keyword for keyword in keywords if keyword])
+        assert spans(trie, text) == spans(plain, text), text
+
+
+@pytest.mark.parametrize('keywords, text, expected', [
+    (['roc', 'roc curve'], 'the roc curve', 'roc'),
+    (['roc curve', 'roc'], 'the roc curve', 'roc curve'),
+    (['roc', 'roc curve'], 'the roc-curve', 'roc'),
+    (['rocx', 'roc'], 'a roc', 'roc'),
+])
+def test_prefix_keywords_keep_list_order(keywords, text, expected):
+    assert create_keyword_pattern(keywords).search(text).group(1) == expected
+
+
+def test_empty_keyword_list_matches_nothing():
+    assert re.search(keyword_alternation([]), 'anything') is None
+    assert re.search(keyword_alternation(['']), 'anything') is None
+
+
+FAMILIES = [
+    {'auroc': create_keyword_pattern(auroc_search_terms), 'auprc': create_keyword_pattern(auprc_search_terms)},
+    {'auroc': compiled_auroc_regex, 'auprc': compiled_auprc_regex},
+    {'auroc': compiled_auprc_regex, 'auprc': compiled_auroc_regex},
+]
+
+TEXTS = [
+    '',
+    'no metrics here',
+    'We report AUROC.',
+    'We report AUPRC.',
+    'AUC-PRC and later AUROC',
+    'AUROC first, then the precision-recall curve',
+    # One family's match overlaps the other's: "AUC" is an AUROC regex match inside "AUC-PRC"
+    'AUC-PRC',
+    'the area under the precision recall curve',
+    'auc prc',
+    'area under the receiver operating characteristic curve and average precision',
+    'sensitivity vs. 1-specificity',
+    'roc' * 3 + ' prc',
+]
+
+
+@pytest.mark.parametrize('families', FAMILIES)
+def test_single_pass_equals_separate_searches(families):
+    matcher = MetricMatcher(families)
+    rng = random.Random(1)
+    words = TEXTS + list(auroc_search_terms) + list(auprc_search_terms) + ['the', ',', '-', 'AUC', 'PR', 'curve']
+    texts = TEXTS + [' '.join(rng.choice(words) for _ in range(rng.randint(0, 12))) for _ in range(3000)]
+    for text in texts:
+        separate = {name for name, pattern in families.items() if pattern.search(text)}
+        assert matcher.search(text) == separate, text
+        assert matcher.contains(text) == {name: name in separate for name in families}
+
+
+def test_family_flags_stay_scoped():
+    matcher = MetricMatcher({'upper': re.compile('AUC'), 'lower': '(?i)prc'})
+    assert matcher.search('auc PRC') == {'lower'}
+    assert matcher.search('AUC') == {'upper'}
+
+
+def test_invalid_family_name():
+    with pytest.raises(ValueError):
+        MetricMatcher({'not valid': 'x'})
+
+
+def test_prefilter_terms_from_keywords():
+    assert prefilter_terms_from_keywords(['roc curve', 'auroc', 'roc']) == ['curve', 'roc']
+    assert prefilter_terms_from_keywords(['roc', '%%']) == []
@@ -0,0 +1,105 @@
+import importlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('bs4')
+pytest.importorskip('requests')
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+neurips_scraper = importlib.import_module('neurips_scraper.neurIPS_scraper')
+
+
+@pytest.fixture
+def mock_proceedings():
+    """Factory starting benchmarks/mock_neurips_server.py on a free port; yields (base URL, server process)."""
+    servers = []
+
+    def start(papers=5, error_rate=0, max_concurrency=100):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'benchmarks', 'mock_neurips_server.py'), '-port', str(port),
+                                   '-papers', str(papers), '-latency', '0', '-error_rate', str(error_rate),
+                                   '-max_concurrency', str(max_concurrency)], stdout=subprocess.DEVNULL)
+        servers.append(server)
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        return f'http://127.0.0.1:{port}/paper/', server
+
+    yield start
+    for server in servers:
+        server.terminate()
+        server.wait()
+
+
+def read_lines(path):
+    with open(path) as file:
+        return file.readlines()
+
+
+def test_concurrent_scrape_keeps_the_sequential_order(mock_proceedings, tmp_path):
+    base_url, _ = mock_proceedings(papers=12)
+    for workers in (1, 8):
+        assert neurips_scraper.scrape(2020, 2021, str(tmp_path / str(workers)), 'papers.jsonl', authors_filename='authors.jsonl',
+                                      base_url=base_url, max_workers=workers, resume=False) == 24
+    sequential = read_lines(tmp_path / '1' / 'papers.jsonl')
+    assert read_lines(tmp_path / '8' / 'papers.jsonl') == sequential
+    assert [json.loads(line)['meta']['year'] for line in sequential] == ['2020'] * 12 + ['2021'] * 12
+    authors = [json.loads(line) for line in read_lines(tmp_path / '8' / 'authors.jsonl')]
+    assert [author['source_id'] for author in authors] == [json.loads(line)['meta']['source_id'] for line in sequential]
+
+
+def test_injected_errors_are_retried(mock_proceedings, tmp_path):
+    # 503s on a fifth of the metadata requests; the per-host cap stays below the server's 429 threshold
+    base_url, _ = mock_proceedings(papers=20, error_rate=0.2, max_concurrency=2)
+    assert neurips_scraper.scrape(2020, 2020, str(tmp_path), 'papers.jsonl', base_url=base_url, max_workers=8,
+                                  max_per_host=2, backoff_factor=0, resume=False) == 20
+
+
+def test_host_limiter_caps_requests_per_host():
+    limiter = neurips_scraper.HostLimiter(max_per_host=2)
+    in_flight = {'a': 0, 'b': 0}
+    peak = {'a': 0, 'b': 0}
+    lock = threading.Lock()
+
+    def request(host):
+        with limiter(f'http://{host}.example/paper/{host}'):
+            with lock:
+                in_flight[host] += 1
+                peak[host] = max(peak[host], in_flight[host])
+            time.sleep(0.01)
+            with lock:
+                in_flight[host] -= 1
+
+    threads = [threading.Thread(target=request, args=(host,)) for host in 'ab' * 10]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak == {'a': 2, 'b': 2}
+    assert limiter('http://a.example/x') is limiter('http://a.example/y')
+
+
+def test_offline_rerun_rewrites_the_output_from_the_cache(mock_proceedings, tmp_path):
+    base_url, server = mock_proceedings()
+    options = dict(base_url=base_url, cache_dir=str(tmp_path / 'cache'), max_workers=4)
+    assert neurips_scraper.scrape(2020, 2021, str(tmp_path), 'papers.jsonl', **options) == 10
+    online = read_lines(tmp_path / 'papers.jsonl')
+    # A resumed online run has nothing left to do
+    assert neurips_scraper.scrape(2020, 2021, str(tmp_path), 'papers.jsonl', **options) == 0
+    # Offline runs ignore the ledger and re-parse every cached paper, without the server
+    server.terminate()
+    server.wait()
+    assert neurips_scraper.scrape(2020, 2021, str(tmp_path), 'papers.jsonl', offline=True, **options) == 10
+    assert read_lines(tmp_path / 'papers.jsonl') == online
@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('fitz')
+pytest.importorskip('pypdfium2')
+pytest.importorskip('PyPDF2')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pdf_extraction'))
+from pdf_extraction import RESULTS_SECTION_PATTERN, select_pages
+
+
+@pytest.mark.parametrize('line', [
+    '5 Experiments', '4.2 Experimental Results', 'IV. RESULTS ON IMAGENET', 'Results', 'Results and Discussion',
+    'Evaluation:', '  3. Evaluation of the classifiers',
+])
+def test_headings_match(line):
+    assert RESULTS_SECTION_PATTERN.search(f'previous line\n{line}\nnext line')
+
+
+@pytest.mark.parametrize('line', [
+    'Results are shown in Table 2 for all datasets.',
+    'Evaluation on the held-out split follows the protocol of prior work and uses five seeds.',
+    'experiments with larger models were not feasible within our compute budget, so we',
+])
+def test_body_lines_do_not_match(line):
+    assert not RESULTS_SECTION_PATTERN.search(f'previous line\n{line}\nnext line')
+
+
+def test_scan_without_outline_stops_after_enough_pages():
+    pages_read = []
+
+    def read_page(num):
+        pages_read.append(num)
+        return '6 Results\n' if num % 2 == 0 else 'body text'
+
+    assert select_pages(200, read_page, [], page_limit=10, max_extra_pages=4) == list(range(10)) + [10, 11, 12, 13]
+    assert max(pages_read) == 12
+
+
+def test_scan_without_outline_is_capped():
+    pages_read = []
+
+    def read_page(num):
+        pages_read.append(num)
+        return 'body text'
+
+    assert select_pages(200, read_page, [], page_limit=10, max_scan_pages=20) == list(range(10))
+    assert pages_read == list(range(10, 30))
+
+
+def test_outline_selects_section_pages():
+    toc = [(1, 'Introduction', 0), (1, '5 Experiments', 12), (1, 'References', 14)]
+    assert select_pages(20, None, toc, page_limit=10) == list(range(10)) + [12, 13, 14]
+
+
+def test_pymupdf_outline_entries_without_destination(tmp_path):
+    import fitz
+    from pdf_extraction import open_pymupdf
+
+    path = str(tmp_path / 'outline.pdf')
+    with fitz.open() as doc:
+        for num in range(20):
+            doc.new_page().insert_text((72, 72), f'page {num}')
+        doc.set_toc([[1, 'Introduction', 1], [1, '5 Experiments', 13], [1, 'Notes', -1], [1, 'References', 15]])
+        doc.save(path)
+    with open_pymupdf(path) as (num_pages, _, toc):
+        assert toc[2] == (1, 'Notes', None)
+        # The destinationless entry neither ends the section nor gets selected itself
+        assert select_pages(num_pages, None, toc, page_limit=10) == list(range(10)) + [12, 13, 14]
@@ -0,0 +1,108 @@
+import json
+import random
+import re
+
+import pytest
+
+import arxiv_search
+import arxiv_search_regex
+from conftest import make_records, write_jsonl
+from filter_pipeline import iter_file_matches
+from keywords_auprc import auprc_search_terms
+from keywords_auroc import auroc_search_terms
+from latex_cleaning import remove_latex_commands
+from metric_matching import MetricMatcher, prefilter_terms_from_keywords
+from regex_definitions import (AUPRC_PREFILTER_TERMS, AUPRC_REGEXES, AUROC_PREFILTER_TERMS, AUROC_REGEXES,
+                               compiled_auprc_regex, compiled_auroc_regex)
+
+SEARCH_TERMS = list(auroc_search_terms) + list(auprc_search_terms)
+REGEX_TERMS = AUROC_PREFILTER_TERMS + AUPRC_PREFILTER_TERMS
+
+# Phrases the regexes or keywords match, and near misses
+PHRASES = SEARCH_TERMS + [
+    'AUC-ROC', 'AUROC)', 'area under the curve', 'sensitivity vs. 1 - specificity', 'TPR versus FPR',
+    'true positive rate against false positive rate', 'precision-recall', 'average-precision', 'APR', 'PRC',
+    'AUC-PR', 'A.U.C.', 'ROCK', 'precise recall', 'curved', 'receivers', '\\textbf{AUROC}', '$AUC$', 'épreuve',
+]
+FILLER = ['the', 'model', 'is', 'evaluated', 'on', 'a', 'held-out', 'split', '0.93', '(Table 2)', ',', '.', '\n']
+
+
+def fuzz_lines(count, seed):
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        words = [rng.choice(PHRASES if rng.random() < 0.15 else FILLER) for _ in range(rng.randint(0, 30))]
+        words = [word.upper() if rng.random() < 0.2 else word.title() if rng.random() < 0.2 else word for word in words]
+        record = {'text': ' '.join(words), 'meta': {'arxiv_id': str(i)}}
+        lines.append(json.dumps(record, ensure_ascii=rng.random() < 0.5).encode('utf-8') + b'\n')
+    return lines
+
+
+@pytest.mark.parametrize('families, terms', [
+    ({'auroc': arxiv_search.create_keyword_pattern(auroc_search_terms),
+      'auprc': arxiv_search.create_keyword_pattern(auprc_search_terms)}, prefilter_terms_from_keywords(SEARCH_TERMS)),
+    ({'auroc': compiled_auroc_regex, 'auprc': compiled_auprc_regex}, REGEX_TERMS),
+])
+def test_prefilter_keeps_every_matching_line(families, terms):
+    matcher = MetricMatcher(families, prefilter_terms=terms)
+    rejected = matched = 0
+    for line in fuzz_lines(5000, 0):
+        text = json.loads(line)['text']
+        matched += bool(matcher.search(text))
+        if not matcher.might_match(line):
+            rejected += 1
+            assert not matcher.search(text)
+            assert not matcher.search(remove_latex_commands(text))
+    assert rejected > 0 and matched > 0
+
+
+def test_regex_prefilter_terms_occur_in_every_regex_match():
+    rng = random.Random(1)
+    for regex in AUROC_REGEXES + AUPRC_REGEXES:
+        for phrase in PHRASES:
+            text = ' '.join(rng.choice(FILLER) for _ in range(3)) + f' {phrase} '
+            for match in re.finditer(f'(?i){regex}', text):
+                assert any(term in match.group(0).lower() for term in REGEX_TERMS), (regex, match.group(0))
+
+
+def test_prefiltered_texts_are_counted(tmp_path):
+    path = tmp_path / 'sample.jsonl'
+    write_jsonl(path, make_records(200, 4))
+    with open(path, 'rb') as file:
+        lines = file.readlines()
+    terms = prefilter_terms_from_keywords(SEARCH_TERMS)
+    expected = sum(not any(term.encode() in line.lower() for term in terms) for line in lines)
+    assert 0 < expected < len(lines)
+
+    matcher = MetricMatcher({'auroc': arxiv_search.create_keyword_pattern(auroc_search_terms),
+                             'auprc': arxiv_search.create_keyword_pattern(auprc_search_terms)}, prefilter_terms=terms)
+    stats = {}
+    rows = list(iter_file_matches(str(path), matcher, ['arxiv_id'], remove_latex_commands, stats))
+    assert stats == {'total_texts': len(lines), 'prefiltered_texts': expected}
+    unfiltered = MetricMatcher({'auroc': arxiv_search.create_keyword_pattern(auroc_search_terms),
+                                'auprc': arxiv_search.create_keyword_pattern(auprc_search_terms)})
+    assert rows == list(iter_file_matches(str(path), unfiltered, ['arxiv_id'], remove_latex_commands))
+
+
+def test_process_file_applies_the_prefilter(tmp_path, monkeypatch):
+    path = str(tmp_path / 'sample.jsonl')
+    write_jsonl(path, make_records(100, 5))
+    auroc_pattern = arxiv_search.create_keyword_pattern(auroc_search_terms)
+    auprc_pattern = arxiv_search.create_keyword_pattern(auprc_search_terms)
+    expected = arxiv_search.process_file(path, auroc_pattern, auprc_pattern, ['arxiv_id'], True)
+
+    checked = []
+    might_match = MetricMatcher.might_match
+
+    def recording_might_match(self, line):
+        checked.append(self.prefilter_terms)
+        return might_match(self, line)
+
+    monkeypatch.setattr(MetricMatcher, 'might_match', recording_might_match)
+    assert arxiv_search.process_file(path, auroc_pattern, auprc_pattern, ['arxiv_id'], True, search_terms=SEARCH_TERMS) == expected
+    assert checked and checked[0] is not None
+    checked.clear()
+    assert arxiv_search_regex.process_file(path, compiled_auroc_regex, compiled_auprc_regex, ['arxiv_id'], True,
+                                           prefilter_terms=REGEX_TERMS) == \
+        arxiv_search_regex.process_file(path, compiled_auroc_regex, compiled_auprc_regex, ['arxiv_id'], True)
+    assert checked[0] is not None
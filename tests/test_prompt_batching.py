@@ -0,0 +1,135 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('openai')
+
+import prompt_batching
+from prompt_batching import build_batch_message, make_batches, parse_batch_response, process_batch_with_gpt
+from response_cache import ResponseCache
+
+
+def results(*pairs):
+    return json.dumps({'results': [{'id': window_id, 'response': response} for window_id, response in pairs]})
+
+
+def test_valid_reply():
+    assert parse_batch_response(results((1, 'Yes'), (2, 'No')), 2) == {1: 'Yes', 2: 'No'}
+
+
+def test_ids_as_strings_and_structured_answers():
+    assert parse_batch_response(results(('1', {'claims': []})), 1) == {1: '{"claims": []}'}
+
+
+def test_duplicate_ids_are_dropped():
+    assert parse_batch_response(results((1, 'Yes'), (2, 'No'), (1, 'No')), 2) == {2: 'No'}
+
+
+def test_ids_out_of_range_are_ignored():
+    assert parse_batch_response(results((0, 'a'), (1, 'b'), (3, 'c'), ('x', 'd'), (None, 'e')), 2) == {1: 'b'}
+
+
+def test_missing_ids_are_left_out():
+    assert parse_batch_response(results((2, 'No')), 3) == {2: 'No'}
+
+
+def test_entries_without_response_are_ignored():
+    content = json.dumps({'results': [{'id': 1}, 'text', {'id': 2, 'response': 'Yes'}]})
+    assert parse_batch_response(content, 2) == {2: 'Yes'}
+
+
+@pytest.mark.parametrize('content', ['not json', '{"results": [', '[]', '{"answers": []}', '{"results": {}}'])
+def test_malformed_replies_raise(content):
+    with pytest.raises(ValueError):
+        parse_batch_response(content, 2)
+
+
+def test_batches_and_message():
+    assert make_batches(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+    message = build_batch_message(['first', 'second'], 'Intro', 'End')
+    assert message.startswith('Intro\n\n') and message.endswith('\n\nEnd')
+    assert json.loads(message.split('\n\n')[2]) == [{'id': 1, 'text': 'first'}, {'id': 2, 'text': 'second'}]
+
+
+class FakeClient:
+    """Stands in for openai.OpenAI, answering every request with the next scripted reply."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **request):
+        self.requests.append(request)
+        content = self.replies.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    def install(*replies):
+        client = FakeClient(replies)
+        monkeypatch.setattr(prompt_batching, 'OpenAI', lambda **kwargs: client)
+        return client
+    return install
+
+
+def single(context_window):
+    single.calls.append(context_window)
+    return f'single: {context_window}'
+
+
+@pytest.fixture(autouse=True)
+def reset_single():
+    single.calls = []
+
+
+BATCH = [(10, 'first'), (11, 'second'), (12, 'third')]
+
+
+def test_fallback_covers_exactly_the_unanswered_windows(fake_client):
+    fake_client(results((1, 'Yes'), (3, 'No'), (3, 'Yes')))
+    responses = process_batch_with_gpt(BATCH, 'model', 'system', 'key', single)
+    assert responses == {10: 'Yes', 11: 'single: second', 12: 'single: third'}
+    assert single.calls == ['second', 'third']
+
+
+def test_malformed_reply_falls_back_for_every_window(fake_client):
+    fake_client('{"results": [')
+    responses = process_batch_with_gpt(BATCH, 'model', 'system', 'key', single)
+    assert single.calls == ['first', 'second', 'third']
+    assert responses[11] == 'single: second'
+
+
+def test_per_window_cache_keys(fake_client, tmp_path):
+    with ResponseCache(str(tmp_path / 'cache.sqlite')) as cache:
+        fake_client(results((1, 'Yes'), (2, 'No')))
+        process_batch_with_gpt(BATCH[:2], 'model', 'system', 'key', single, cache=cache)
+        # A new batch sharing one window only asks the model about the other one
+        client = fake_client(results((1, 'Maybe')))
+        responses = process_batch_with_gpt([(20, 'second'), (21, 'fourth')], 'model', 'system', 'key', single, cache=cache)
+        assert responses == {20: 'No', 21: 'Maybe'}
+        sent = json.loads(client.requests[0]['messages'][1]['content'].split('\n\n')[1])
+        assert sent == [{'id': 1, 'text': 'fourth'}]
+        # Fallback answers and other prompts are not served from the batched entries
+        client = fake_client(results((1, 'Other')))
+        assert process_batch_with_gpt([(30, 'first')], 'model', 'other system', 'key', single, cache=cache) == {30: 'Other'}
+    assert single.calls == []
+
+
+def test_persistent_rate_limit_does_not_fan_out(openai_server, monkeypatch):
+    base_url, server = openai_server(requests_per_second=0, burst=0, retry_after=0)
+    monkeypatch.setenv('OPENAI_BASE_URL', base_url)
+    monkeypatch.setattr(prompt_batching.time, 'sleep', lambda seconds: None)
+    responses = process_batch_with_gpt(BATCH, 'model', 'system', 'key', single, max_retries=3)
+    assert responses == {window_id: 'Error: Rate limit exceeded.' for window_id, _ in BATCH}
+    assert single.calls == []
+    assert server.counters['rate_limited'] == 3
+
+
+def test_batched_request_against_mock_server(openai_server, monkeypatch):
+    base_url, server = openai_server(response='Yes')
+    monkeypatch.setenv('OPENAI_BASE_URL', base_url)
+    assert process_batch_with_gpt(BATCH, 'model', 'system', 'key', single) == {10: 'Yes', 11: 'Yes', 12: 'Yes'}
+    assert server.counters['ok'] == 1
@@ -0,0 +1,52 @@
+import pytest
+
+import rate_limiting
+from rate_limiting import TokenBucket, RateLimiter, parse_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiting.time, 'monotonic', fake)
+    return fake
+
+
+def test_bucket_serves_bursts_then_paces(clock):
+    bucket = TokenBucket(capacity=10, refill_per_second=2)
+    assert [bucket.reserve(5) for _ in range(2)] == [0.0, 0.0]
+    assert bucket.reserve(4) == pytest.approx(2.0)
+    clock.now += 2.0
+    assert bucket.reserve(1) == pytest.approx(0.5)
+
+
+def test_bucket_refill_is_capped(clock):
+    bucket = TokenBucket(capacity=10, refill_per_second=2)
+    clock.now += 1000
+    assert bucket.reserve(10) == 0.0
+    assert bucket.reserve(2) == pytest.approx(1.0)
+
+
+def test_penalize_holds_back_every_budget(clock):
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60000, headroom=1.0)
+    limiter.penalize(3)
+    assert limiter.reserve(0) == pytest.approx(3.0 + 1 / 10)
+
+
+class FakeResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'retry-after-ms': '1500'}, 1.5), ({'retry-after': '2'}, 2.0), ({'retry-after': 'soon'}, 7.0), ({}, 7.0),
+])
+def test_parse_retry_after(headers, expected):
+    assert parse_retry_after(FakeResponse(headers), default=7.0) == pytest.approx(expected)
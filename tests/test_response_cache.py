@@ -0,0 +1,56 @@
+from response_cache import ResponseCache, response_cache_key
+
+
+def test_responses_survive_reopening(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    key = response_cache_key('model', 'system', 'window')
+    with ResponseCache(path) as cache:
+        assert cache.get(key) is None
+        cache.put(key, 'Yes')
+    with ResponseCache(path) as cache:
+        assert cache.get(key) == 'Yes'
+        assert cache.stats()['hits'] == 1
+
+
+def test_errors_are_not_cached(tmp_path):
+    with ResponseCache(str(tmp_path / 'cache.sqlite')) as cache:
+        cache.put('key', 'Error: rate limited')
+        assert cache.get('key') is None
+
+
+def test_keys_depend_on_model_and_prompts():
+    keys = {response_cache_key(*request) for request in
+            [('m', 's', 'w'), ('m2', 's', 'w'), ('m', 's2', 'w'), ('m', 's', 'w2')]}
+    assert len(keys) == 4
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    with ResponseCache(str(tmp_path / 'cache.sqlite'), max_size_bytes=25) as cache:
+        cache.put('a', 'x' * 10)
+        cache.put('b', 'x' * 10)
+        cache.get('a')
+        cache.put('c', 'x' * 10)
+        assert cache.get('b') is None
+        assert cache.get('a') is not None and cache.get('c') is not None
+
+
+def test_stored_size_is_tracked_without_rescanning(tmp_path):
+    with ResponseCache(str(tmp_path / 'cache.sqlite'), max_size_bytes=1000) as cache:
+        statements = []
+        cache._connection.set_trace_callback(statements.append)
+        for i in range(200):
+            cache.put(f'key{i % 150}', 'x' * (10 + i % 7))
+        assert sum('SUM(size)' in statement for statement in statements) == 1
+        assert cache._stored_size == cache.stats()['size_bytes'] <= 1000
+
+
+def test_size_bound_holds_across_instances(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with ResponseCache(path, max_size_bytes=100) as first, ResponseCache(path, max_size_bytes=100) as second:
+        first.put('a', 'x' * 60)
+        second.put('b', 'x' * 30)
+        first.put('a', 'x' * 20)
+        assert first.stats()['size_bytes'] == 50
+        second.put('c', 'x' * 60)
+        assert second.stats()['size_bytes'] <= 100
+        assert second.get('c') is not None
@@ -0,0 +1,46 @@
+import re
+
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from table_io import write_table, read_table, load_table
+from test_filter_pipeline import run_filter
+
+pytest.importorskip('pyarrow')
+pytest.importorskip('openai')
+from claim_search_v3 import extract_context_windows_df, process_all_context_windows
+from response_cache import ResponseCache, response_cache_key
+
+METRIC_REGEXES = [re.compile(r'\bAUROC\b|\bAUPRC\b', re.IGNORECASE), re.compile('receiver operating characteristic')]
+
+
+@pytest.mark.parametrize('filename', ['table.parquet', 'table.arrow', 'table.csv'])
+def test_round_trip_and_column_selection(tmp_path, filename):
+    df = pd.DataFrame({'text_id': [3, 1, 2], 'context_window': ['a', 'b', None], 'contains_auroc': [True, False, True]})
+    path = str(tmp_path / filename)
+    write_table(df, path, row_group_size=2)
+    pdt.assert_frame_equal(read_table(path), df, check_dtype=False)
+    pdt.assert_frame_equal(load_table(path, columns=['text_id']), df[['text_id']], check_dtype=False)
+    assert load_table(df) is df
+
+
+def test_stages_read_and_write_table_files(jsonl_folder, tmp_path):
+    filtered_path = str(tmp_path / 'filtered.parquet')
+    windows_path = str(tmp_path / 'windows.parquet')
+    responses_path = str(tmp_path / 'responses.arrow')
+    run_filter(jsonl_folder, save_file=True, output_folder_path=str(tmp_path), filename='filtered.parquet')
+
+    windows = extract_context_windows_df(filtered_path, 'text', METRIC_REGEXES, 5, output_path=windows_path)
+    assert len(windows) > 0
+    pdt.assert_frame_equal(read_table(windows_path), windows, check_dtype=False)
+
+    # Every window is answered from the cache, so no API call is made
+    with ResponseCache(str(tmp_path / 'cache.sqlite')) as cache:
+        for window in windows['text']:
+            cache.put(response_cache_key('model', 'system', window), 'Yes')
+        windows = windows.rename(columns={'text': 'context_window'})
+        write_table(windows, windows_path)
+        responses = process_all_context_windows(windows_path, 'model', 'system', 'key', cache=cache, output_path=responses_path)
+    assert (responses['gpt_response'] == 'Yes').all()
+    pdt.assert_frame_equal(read_table(responses_path), responses, check_dtype=False)
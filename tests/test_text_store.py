@@ -0,0 +1,41 @@
+import pickle
+import re
+
+import pytest
+
+from text_store import TextStoreWriter, TextStore, text_id_of
+from test_filter_pipeline import run_filter
+
+pytest.importorskip('openai')
+from claim_search_v3 import extract_context_windows_df
+
+METRIC_REGEXES = [re.compile(r'\bAUROC\b|\bAUPRC\b', re.IGNORECASE)]
+
+
+def test_store_round_trip_across_segments(tmp_path):
+    texts = ['AUROC', '', 'précision – recall', 'AUROC']
+    with TextStoreWriter(str(tmp_path), 'a') as writer:
+        ids = [writer.add(text) for text in texts[:2]]
+    with TextStoreWriter(str(tmp_path), 'b') as writer:
+        ids += [writer.add(text) for text in texts[2:]]
+    store = TextStore(str(tmp_path))
+    assert ids == [text_id_of(text) for text in texts]
+    assert [store.get(text_id) for text_id in ids] == texts
+    assert len(store) == 3
+    assert store.window(ids[2], 0, 9) == 'précision'
+    assert list(pickle.loads(pickle.dumps(store.texts(ids)))) == texts
+    with pytest.raises(KeyError):
+        store.get(text_id_of('missing'))
+
+
+def test_text_store_run_matches_text_run(jsonl_folder, tmp_path):
+    store_dir = str(tmp_path / 'store')
+    with_texts = run_filter(jsonl_folder)
+    with_ids = run_filter(jsonl_folder, text_store_dir=store_dir)
+    store = TextStore(store_dir)
+    assert [store.get(text_id) for text_id in with_ids['text_id']] == with_texts['text'].tolist()
+    assert with_ids.drop(columns=['text_id']).equals(with_texts.drop(columns=['text', 'text_id']))
+
+    expected = extract_context_windows_df(with_texts, 'text', METRIC_REGEXES, 5)
+    from_store = extract_context_windows_df(with_ids, 'text', METRIC_REGEXES, 5, text_store=store, num_processes=2)
+    assert from_store['text'].tolist() == expected['text'].tolist()
@@ -0,0 +1,64 @@
+import pandas as pd
+
+from window_dedup import find_duplicate_windows, deduplicate_context_windows, process_deduplicated
+
+BASE = ("the proposed classifier reaches an AUROC of 0.91 while the AUPRC stays low because the positive class "
+        "is rare in the held out test split of the benchmark")
+
+
+def test_exact_duplicates_ignore_whitespace():
+    windows = ['a  b', 'c', ' a b\n', 'c', 'd']
+    assert find_duplicate_windows(windows) == [0, 1, 0, 1, 4]
+
+
+def test_near_duplicates_are_merged_only_when_enabled():
+    near = BASE.replace('0.91', '0.92')
+    windows = [BASE, near, 'an unrelated sentence about stochastic gradient descent and learning rates']
+    assert find_duplicate_windows(windows) == [0, 1, 2]
+    assert find_duplicate_windows(windows, near_duplicates=True, threshold=0.5) == [0, 0, 2]
+
+
+def test_responses_fan_out_to_every_duplicate():
+    df = pd.DataFrame({'context_window': ['x  y', 'z', 'x y', 'w', 'z'], 'paper': list('abcde')},
+                      index=[10, 11, 12, 13, 14])
+    sent = []
+
+    def fake_process(unique_df):
+        sent.extend(unique_df['context_window'])
+        unique_df['gpt_response'] = ['response ' + window for window in unique_df['context_window']]
+        return unique_df
+
+    result = process_deduplicated(fake_process, df)
+    assert sent == ['x  y', 'z', 'w']
+    assert result['gpt_response'].tolist() == ['response x  y', 'response z', 'response x  y', 'response w', 'response z']
+    assert result['paper'].tolist() == list('abcde')
+
+
+def test_dedup_stats():
+    df = pd.DataFrame({'context_window': ['a', 'a', 'b', 'a']})
+    unique_df, representatives = deduplicate_context_windows(df)
+    assert unique_df.attrs['dedup_stats'] == {'total_windows': 4, 'unique_windows': 2, 'reduction_ratio': 0.5}
+    assert representatives.tolist() == [0, 0, 2, 0]
+
+
+def test_fan_out_with_repeated_index_labels():
+    # Window frames concatenated from several files repeat index labels
+    df = pd.concat([pd.DataFrame({'context_window': ['a', 'b']}), pd.DataFrame({'context_window': ['b', 'c', 'a']})])
+    assert df.index.tolist() == [0, 1, 0, 1, 2]
+
+    def fake_process(unique_df):
+        unique_df['gpt_response'] = ['response ' + window for window in unique_df['context_window']]
+        return unique_df
+
+    result = process_deduplicated(fake_process, df)
+    assert result['gpt_response'].tolist() == ['response a', 'response b', 'response b', 'response c', 'response a']
+
+
+def test_near_duplicates_are_compared_beyond_the_bucket_head(monkeypatch):
+    import window_dedup
+
+    # One band of zero rows puts every window in the same bucket, headed by an unrelated window
+    monkeypatch.setattr(window_dedup, '_lsh_bands', lambda num_perm, threshold: (1, 0))
+    unrelated = 'an unrelated sentence about stochastic gradient descent and learning rates in deep networks'
+    windows = [unrelated, BASE, BASE.replace('0.91', '0.92'), BASE.replace('rare', 'scarce')]
+    assert find_duplicate_windows(windows, near_duplicates=True, threshold=0.5) == [0, 1, 1, 1]